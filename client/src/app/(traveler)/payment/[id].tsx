@@ -90,9 +90,8 @@ export default function PaymentScreen() {
           translator_id: parseInt(id as string), // Convert string ID to number
           date: tomorrow.toISOString().split('T')[0],
           start_time: '10:00',
-          duration_hours: 2,
+          duration_hours: 2, // Priced by the server
           location: translatorResponse.location || 'To be determined',
-          total_amount: translatorResponse.hourly_rate * 2, // 2 hours default duration
           notes: ''
         };
         
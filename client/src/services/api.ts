@@ -329,10 +329,44 @@ export interface CreateBookingData {
   start_time: string; // HH:MM
   duration_hours: number;
   location: string;
-  total_amount: number;
+  // Priced by the server; sent only to confirm the price shown (409 if it changed)
+  total_amount?: number;
+  quote_token?: string;
   notes?: string;
 }
 
+// Server-side price of a booking; quote_token keeps that price when booking until expires_at
+export interface BookingQuote {
+  translator_id: number;
+  date: string;
+  start_time: string;
+  duration_hours: number;
+  hourly_rate: number;
+  subtotal: number;
+  surcharges: { name: string; amount: number }[];
+  service_fee: number;
+  total: number;
+  currency: string;
+  quote_token: string;
+  expires_at: string;
+}
+
+export const getBookingQuote = async (
+  translatorId: number, date: string, startTime: string, durationHours: number
+): Promise<BookingQuote> => {
+  const headers = await createAuthHeaders();
+  const params = new URLSearchParams({
+    translator_id: String(translatorId),
+    date,
+    start_time: startTime,
+    duration_hours: String(durationHours),
+  });
+  return await apiFetch(`/api/bookings/quote?${params.toString()}`, {
+    method: 'GET',
+    headers
+  });
+};
+
 export const createBooking = async (bookingData: CreateBookingData): Promise<Booking> => {
   try {
     const headers = await createAuthHeaders();
@@ -347,6 +381,42 @@ export const createBooking = async (bookingData: CreateBookingData): Promise<Boo
   }
 };
 
+export interface Review {
+  id: number;
+  booking_id: number;
+  reviewer_id: number;
+  reviewer_name: string | null;
+  reviewee_id: number;
+  rating: number;
+  review: string | null;
+  created_at: string;
+}
+
+// Rate the translator of a completed booking (1-5, once per booking)
+export const rateBooking = async (bookingId: number, rating: number, review?: string): Promise<Review> => {
+  const headers = await createAuthHeaders();
+  return await apiFetch(`/api/bookings/${bookingId}/rating`, {
+    method: 'POST',
+    headers,
+    body: JSON.stringify({ rating, review }),
+  });
+};
+
+export interface TranslatorReviews {
+  rating: number;
+  rating_count: number;
+  reviews: Review[];
+}
+
+// Newest reviews first; later pages follow the X-Next-Cursor response header
+export const getTranslatorReviews = async (translatorId: number, limit = 20): Promise<TranslatorReviews> => {
+  const headers = await createAuthHeaders();
+  return await apiFetch(`/api/translators/${translatorId}/reviews?limit=${limit}`, {
+    method: 'GET',
+    headers
+  });
+};
+
 export interface UpdateBookingData {
   action: 'cancel' | 'complete' | 'reschedule';
   date?: string;
@@ -543,6 +613,23 @@ export const getPaymentHistory = async (): Promise<any[]> => {
   }
 };
 
+// Everything the first screen needs (user, upcoming bookings, conversations, earnings) in one request
+export interface BootstrapData {
+  user: any;
+  upcoming_bookings: Booking[] | null;
+  conversations: Conversation[] | null;
+  earnings: EarningsSummary | null;
+  errors?: Record<string, string>;
+}
+
+export const getBootstrap = async (): Promise<BootstrapData> => {
+  const headers = await createAuthHeaders();
+  return await apiFetch('/api/bootstrap', {
+    method: 'GET',
+    headers
+  });
+};
+
 // Earnings related functions
 export interface EarningsSummary {
   today_earnings: number;
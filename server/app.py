@@ -68,6 +68,8 @@ def create_app():
     from routes.bookings import bookings_bp
     from routes.chat import chat_bp
     from routes.payments import payments_bp
+    from routes.bootstrap import bootstrap_bp
+    from routes.batch import batch_bp
     
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api')
@@ -77,6 +79,24 @@ def create_app():
     app.register_blueprint(bookings_bp, url_prefix='/api/bookings')
     app.register_blueprint(chat_bp, url_prefix='/api/chat')
     app.register_blueprint(payments_bp)
+    app.register_blueprint(bootstrap_bp, url_prefix='/api/bootstrap')
+    app.register_blueprint(batch_bp, url_prefix='/api/batch')
+    
+    # Idempotency key maintenance command
+    import idempotency
+    idempotency.init_app(app)
+    
+    # Current-user loader and its cache metrics
+    import user_cache
+    user_cache.init_app(app)
+    
+    # Access token revocation (logout)
+    import revocation
+    revocation.init_app(app)
+    
+    # Uploaded profile photos (served from here when stored locally)
+    import photos
+    photos.init_app(app)
     
     # Initialize SocketIO with the app
     socketio.init_app(app)
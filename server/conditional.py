@@ -0,0 +1,52 @@
+from flask import request, jsonify, make_response
+from datetime import timezone
+import hashlib
+
+def make_etag(*parts):
+    """Build a strong ETag from the values a response is derived from.
+
+    Callers pass cheap version data (ids, updated_at timestamps, aggregate
+    counters) rather than the serialized body, so the tag can be computed
+    before any expensive serialization happens.
+    """
+    digest = hashlib.sha1(repr(parts).encode('utf-8'))
+    return digest.hexdigest()
+
+def latest(*timestamps):
+    """Return the most recent of the given timestamps, ignoring missing ones"""
+    present = [ts for ts in timestamps if ts is not None]
+    return max(present) if present else None
+
+def _as_http_date(timestamp):
+    # Model timestamps are naive UTC and HTTP dates have whole-second precision
+    return timestamp.replace(tzinfo=timezone.utc, microsecond=0)
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _as_http_date(last_modified)
+    # Let clients keep the body but always revalidate it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(etag, last_modified=None):
+    """Return a 304 response if the client's cached copy is still current.
+
+    If-None-Match takes precedence over If-Modified-Since, as required by
+    RFC 7232. Returns None when the full response has to be built.
+    """
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        matched = _as_http_date(last_modified) <= request.if_modified_since
+    else:
+        matched = False
+
+    if not matched:
+        return None
+
+    return _set_validators(make_response('', 304), etag, last_modified)
+
+def conditional_jsonify(payload, etag, last_modified=None, status=200):
+    """jsonify a payload and attach its ETag/Last-Modified validators"""
+    return _set_validators(make_response(jsonify(payload), status), etag, last_modified)
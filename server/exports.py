@@ -0,0 +1,82 @@
+from flask import Response, stream_with_context
+from extensions import db
+from datetime import date, time, datetime
+from decimal import Decimal
+import csv
+import io
+import json
+
+# Number of rows fetched from the server-side cursor per round trip
+EXPORT_FETCH_SIZE = 1000
+
+# Number of encoded rows buffered before a chunk is written to the client
+EXPORT_CHUNK_ROWS = 200
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+def _export_value(value):
+    """Convert a column value into something CSV/JSON can carry losslessly"""
+    if value is None:
+        return None
+    if isinstance(value, Decimal):
+        # Keep money exact - never round-trip through float
+        return str(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+def _encode_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+
+    for batch in rows:
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerows(
+            ['' if value is None else value for value in map(_export_value, row)]
+            for row in batch
+        )
+        yield buffer.getvalue()
+
+def _encode_ndjson(columns, rows):
+    for batch in rows:
+        yield ''.join(
+            json.dumps(dict(zip(columns, map(_export_value, row)))) + '\n'
+            for row in batch
+        )
+
+def stream_export(statement, columns, fmt, filename):
+    """Stream the rows of a Core select as CSV or NDJSON.
+
+    Rows come off a server-side cursor in EXPORT_FETCH_SIZE batches and are
+    written out in small chunks, so memory stays flat regardless of how many
+    rows the export contains. The response has no Content-Length and is sent
+    with chunked transfer encoding.
+    """
+    encode = _encode_csv if fmt == 'csv' else _encode_ndjson
+
+    def generate():
+        result = db.session.execute(
+            statement.execution_options(stream_results=True, yield_per=EXPORT_FETCH_SIZE)
+        )
+        try:
+            yield from encode(columns, result.partitions(EXPORT_CHUNK_ROWS))
+        finally:
+            result.close()
+            # Release the connection held open by the cursor
+            db.session.rollback()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}.{fmt}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        }
+    )
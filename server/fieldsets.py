@@ -0,0 +1,20 @@
+def requested_fields(args, model, default='full'):
+    """Resolve the ?fields= parameter into the keys a model should serialize.
+    
+    Takes a comma-separated mix of named projections (model.PROJECTIONS,
+    e.g. "card") and individual keys, e.g. "card,bio". The id is always
+    included. Raises ValueError for unknown names.
+    """
+    fields = ['id']
+    for name in (args.get('fields') or default).split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name in model.PROJECTIONS:
+            names = model.PROJECTIONS[name]
+        elif name in model.FIELD_SERIALIZERS:
+            names = [name]
+        else:
+            raise ValueError(f"Unknown field: {name}")
+        fields.extend(field for field in names if field not in fields)
+    return fields
@@ -0,0 +1,114 @@
+from flask import request, jsonify, make_response
+from flask_jwt_extended import get_jwt_identity
+from functools import wraps
+from datetime import datetime, timedelta
+from extensions import db
+from models import IdempotencyKey
+import hashlib
+import logging
+import os
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+# How long a stored response can be replayed
+IDEMPOTENCY_TTL = timedelta(hours=int(os.getenv('IDEMPOTENCY_TTL_HOURS', 24)))
+
+def _request_fingerprint():
+    digest = hashlib.sha256()
+    digest.update(request.method.encode('utf-8'))
+    digest.update(request.path.encode('utf-8'))
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+def _replay(record):
+    response = make_response(record.response_body, record.status_code)
+    response.mimetype = 'application/json'
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def _release(claim_id):
+    try:
+        db.session.rollback()
+        db.session.query(IdempotencyKey).filter_by(id=claim_id).delete()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error releasing idempotency key: {str(e)}")
+
+def idempotent(view):
+    """Make a mutating route safe to retry with an Idempotency-Key header.
+    
+    The first request with a given key runs normally and its response is
+    stored; a retry with the same key gets the stored response without the
+    view running again. Reusing a key for a different request is rejected,
+    as is a retry that arrives while the original is still running. Server
+    errors are not stored, so those can be retried. Requests without the
+    header are passed straight through. Apply below @jwt_required().
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        
+        if len(key) > 255:
+            return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be at most 255 characters'}), 400
+        
+        user_id = int(get_jwt_identity())
+        fingerprint = _request_fingerprint()
+        
+        claim_id = IdempotencyKey.claim(user_id, key, request.method, request.path, fingerprint, IDEMPOTENCY_TTL)
+        if claim_id is None:
+            record = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+            
+            # An expired key is free to be used again
+            if record is not None and record.expires_at < datetime.utcnow():
+                db.session.delete(record)
+                db.session.flush()
+                claim_id = IdempotencyKey.claim(user_id, key, request.method, request.path, fingerprint, IDEMPOTENCY_TTL)
+                record = None
+            
+            if claim_id is None:
+                db.session.rollback()
+                if record is None:
+                    return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+                if record.request_hash != fingerprint:
+                    return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 422
+                if record.status_code is None:
+                    return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+                return _replay(record)
+        
+        # Make the reservation visible before the view runs
+        db.session.commit()
+        
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            # Release the key so the request can be retried, then let the error propagate
+            _release(claim_id)
+            raise
+        
+        try:
+            # Discard anything the view left uncommitted before recording the outcome
+            db.session.rollback()
+            claim = db.session.get(IdempotencyKey, claim_id)
+            if response.status_code >= 500 or response.is_streamed:
+                db.session.delete(claim)
+            else:
+                claim.status_code = response.status_code
+                claim.response_body = response.get_data(as_text=True)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error storing idempotent response: {str(e)}")
+        
+        return response
+    return wrapper
+
+def init_app(app):
+    @app.cli.command('prune-idempotency-keys')
+    def prune_idempotency_keys():
+        """Delete idempotency keys whose replay window has passed"""
+        removed = IdempotencyKey.prune()
+        db.session.commit()
+        print(f"Removed {removed} expired idempotency keys")
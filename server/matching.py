@@ -0,0 +1,364 @@
+from flask import current_app
+from sqlalchemy import select, or_, event
+from sqlalchemy.orm import Session
+from collections import namedtuple
+from extensions import db
+from models import TranslatorProfile, Rating, RatingSummary
+from datetime import datetime, timedelta
+import logging
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# How often each worker picks up profile and rating changes (seconds)
+MATCHING_REFRESH_SECONDS = float(os.environ.get('MATCHING_REFRESH_SECONDS', 30))
+
+# How often the snapshot is rebuilt from scratch, dropping deleted profiles (seconds)
+MATCHING_REBUILD_SECONDS = float(os.environ.get('MATCHING_REBUILD_SECONDS', 3600))
+
+# Re-read changes this far back on every refresh, so a late commit is not skipped
+MATCHING_REFRESH_OVERLAP = timedelta(seconds=60)
+
+# Rows a background build applies between yields, so requests keep being served
+MATCHING_BUILD_CHUNK = 2000
+
+# Score = sum of weight * component, each component in [0, 1]
+MATCH_WEIGHTS = {
+    'languages': 0.40,  # Share of the needed languages the translator speaks
+    'rating': 0.20,
+    'location': 0.15,  # Same city
+    'interests': 0.10,  # Specializations overlapping the traveler's interests (up to 3)
+    'completion': 0.10,
+    'price': 0.05  # Cheaper than the median rate scores higher
+}
+
+# One traveler request; languages/interests are lists of strings, the rest optional
+MatchRequest = namedtuple('MatchRequest', ['languages', 'location', 'interests', 'max_rate', 'include_unavailable'])
+
+def location_cell(location):
+    """Coarse location key: profiles hold free text like "Madrid, Spain", so the city part, normalized"""
+    if not location:
+        return None
+    return location.split(',')[0].strip().lower() or None
+
+def _normalize(values):
+    return [str(value).strip().lower() for value in values or [] if str(value).strip()]
+
+def _language_codes(languages):
+    # Profiles store [{language_code, ...}]; requests may also pass plain codes
+    return _normalize(
+        language.get('language_code') if isinstance(language, dict) else language
+        for language in languages or []
+    )
+
+class TranslatorSnapshot:
+    """Columnar, in-memory copy of every translator's matching attributes.
+
+    One row per translator, with the attributes held in parallel NumPy
+    arrays. Languages and specializations are bitmasks: each distinct
+    code/term gets a bit, and the number of 64-bit words grows with the
+    vocabulary. Scoring a request touches each column once for all rows,
+    with no Python loop over translators.
+    """
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.rows = {}
+        self.language_bits = {}
+        self.specialization_bits = {}
+        self.cells = {}
+        self.user_ids = np.zeros(capacity, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.available = np.zeros(capacity, dtype=bool)
+        self.hourly_rate = np.zeros(capacity, dtype=np.float32)
+        self.rating = np.zeros(capacity, dtype=np.float32)
+        self.completion = np.zeros(capacity, dtype=np.float32)
+        self.cell = np.full(capacity, -1, dtype=np.int32)
+        self.languages = np.zeros((capacity, 1), dtype=np.uint64)
+        self.specializations = np.zeros((capacity, 1), dtype=np.uint64)
+        self.median_rate = 0.0
+
+    def _grow(self):
+        capacity = len(self.user_ids) * 2
+        for name in ('user_ids', 'active', 'available', 'hourly_rate', 'rating', 'completion', 'cell',
+                     'languages', 'specializations'):
+            column = getattr(self, name)
+            grown = np.full((capacity,) + column.shape[1:], -1 if name == 'cell' else 0, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def _bit(self, vocabulary, column_name, term):
+        """Bit index of a term, widening the bitmask column when the vocabulary outgrows it"""
+        bit = vocabulary.get(term)
+        if bit is None:
+            bit = vocabulary[term] = len(vocabulary)
+            column = getattr(self, column_name)
+            if bit // 64 >= column.shape[1]:
+                setattr(self, column_name, np.hstack([column, np.zeros((len(column), 1), dtype=np.uint64)]))
+        return bit
+
+    def _mask(self, vocabulary, column_name, terms):
+        # Look up (and add) every bit first: a new term may widen the column
+        bits = [self._bit(vocabulary, column_name, term) for term in terms]
+        mask = np.zeros(getattr(self, column_name).shape[1], dtype=np.uint64)
+        for bit in bits:
+            mask[bit // 64] |= np.uint64(1 << (bit % 64))
+        return mask
+
+    def upsert(self, user_id, languages, hourly_rate, rating, completion, location, specializations, is_available):
+        row = self.rows.get(user_id)
+        if row is None:
+            if self.size == len(self.user_ids):
+                self._grow()
+            row = self.rows[user_id] = self.size
+            self.size += 1
+        # Build the masks first: they may widen the columns
+        language_mask = self._mask(self.language_bits, 'languages', _language_codes(languages))
+        specialization_mask = self._mask(self.specialization_bits, 'specializations', _normalize(specializations))
+
+        cell = location_cell(location)
+        self.user_ids[row] = user_id
+        self.active[row] = True
+        self.available[row] = bool(is_available)
+        self.hourly_rate[row] = hourly_rate or 0
+        self.rating[row] = rating or 0
+        self.completion[row] = completion or 0
+        self.cell[row] = -1 if cell is None else self.cells.setdefault(cell, len(self.cells))
+        self.languages[row] = language_mask
+        self.specializations[row] = specialization_mask
+
+    def remove(self, user_id):
+        row = self.rows.get(user_id)
+        if row is not None:
+            self.active[row] = False
+
+    def finish(self):
+        """Update derived values after a batch of upserts"""
+        rates = self.hourly_rate[:self.size][self.active[:self.size]]
+        self.median_rate = float(np.median(rates)) if len(rates) else 0.0
+
+    def _term_hits(self, vocabulary, column, terms):
+        """Per row, how many of the terms have their bit set"""
+        hits = np.zeros(self.size, dtype=np.float32)
+        for term in terms:
+            bit = vocabulary.get(term)
+            if bit is not None:
+                word = column[:self.size, bit // 64]
+                hits += ((word >> np.uint64(bit % 64)) & np.uint64(1)).astype(np.float32)
+        return hits
+
+    def score(self, request):
+        """Score every row against a MatchRequest; rows that cannot match get -inf"""
+        n = self.size
+        needed = _language_codes(request.languages)
+        interests = _normalize(request.interests)
+
+        eligible = self.active[:n].copy()
+        if not request.include_unavailable:
+            eligible &= self.available[:n]
+        if request.max_rate is not None:
+            eligible &= self.hourly_rate[:n] <= request.max_rate
+
+        scores = MATCH_WEIGHTS['rating'] * (self.rating[:n] / 5)
+        scores += MATCH_WEIGHTS['completion'] * (self.completion[:n] / 100)
+
+        if needed:
+            coverage = self._term_hits(self.language_bits, self.languages, needed) / len(needed)
+            # Speaking none of the needed languages rules a translator out
+            eligible &= coverage > 0
+            scores += MATCH_WEIGHTS['languages'] * coverage
+
+        cell = self.cells.get(location_cell(request.location))
+        if cell is not None:
+            scores += MATCH_WEIGHTS['location'] * (self.cell[:n] == cell)
+
+        if interests:
+            overlap = self._term_hits(self.specialization_bits, self.specializations, interests)
+            scores += MATCH_WEIGHTS['interests'] * (np.minimum(overlap, 3) / 3)
+
+        if self.median_rate > 0:
+            scores += MATCH_WEIGHTS['price'] * np.clip(1 - self.hourly_rate[:n] / (2 * self.median_rate), 0, 1)
+
+        return np.where(eligible, scores, -np.inf)
+
+    def top_k(self, request, k):
+        """The k best (user_id, score) pairs for a request, best first"""
+        scores = self.score(request)
+        if not len(scores):
+            return []
+        k = min(k, len(scores))
+        # Partial selection is O(n); only the k winners get sorted
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [
+            (int(self.user_ids[row]), round(float(scores[row]), 4))
+            for row in candidates if np.isfinite(scores[row])
+        ]
+
+def _translator_rows(connection, changed_since=None, user_ids=None):
+    """Matching attributes of translators, with their average rating, in one query"""
+    query = select(
+        TranslatorProfile.user_id,
+        TranslatorProfile.languages,
+        TranslatorProfile.hourly_rate,
+        RatingSummary.average(),
+        TranslatorProfile.profile_completion,
+        TranslatorProfile.location,
+        TranslatorProfile.specializations,
+        TranslatorProfile.is_available
+    ).outerjoin(
+        RatingSummary, RatingSummary.user_id == TranslatorProfile.user_id
+    )
+
+    if changed_since is not None:
+        # Edited profiles, and profiles whose rating moved
+        query = query.where(or_(
+            TranslatorProfile.updated_at >= changed_since,
+            RatingSummary.last_rating_at >= changed_since
+        ))
+    if user_ids is not None:
+        query = query.where(TranslatorProfile.user_id.in_(user_ids))
+    return connection.execute(query).all()
+
+class TranslatorMatcher:
+    """Per-worker matching snapshot, kept fresh the way the revocation list is.
+
+    Profiles committed in this worker are reloaded before the next match.
+    Changes made elsewhere are picked up every MATCHING_REFRESH_SECONDS.
+    Every MATCHING_REBUILD_SECONDS a new snapshot, without deleted
+    profiles, is built in a background thread (a green thread under
+    eventlet, yielding every MATCHING_BUILD_CHUNK rows) and swapped in when
+    done. Matches keep using the current snapshot meanwhile; only the
+    first match in a worker waits for a snapshot to exist.
+    """
+
+    def __init__(self, refresh_seconds=MATCHING_REFRESH_SECONDS, rebuild_seconds=MATCHING_REBUILD_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._dirty = set()
+        self._refreshed_at = None
+        self._refreshed_since = None
+        self._rebuilt_at = None
+        self._build = None
+
+    def mark_dirty(self, user_ids):
+        with self._lock:
+            self._dirty.update(user_ids)
+
+    def top_k(self, request, k=10):
+        self._refresh_if_due()
+        with self._lock:
+            return self._snapshot.top_k(request, k)
+
+    def _refresh_if_due(self):
+        now = time.monotonic()
+        if self._rebuilt_at is None or now - self._rebuilt_at >= self.rebuild_seconds:
+            build = self.start_rebuild()
+            if self._snapshot is None:
+                build.wait()
+                if self._snapshot is None:
+                    raise RuntimeError('Matching snapshot could not be built')
+                return
+        if self._build is not None:
+            # Changes wait for the new snapshot, which is read after they were made
+            return
+        if now - self._refreshed_at >= self.refresh_seconds:
+            self.refresh()
+        elif self._dirty:
+            self.refresh(only_dirty=True)
+
+    def _apply(self, snapshot, rows, yield_every=None):
+        for count, (user_id, languages, hourly_rate, rating, completion, location, specializations,
+                    is_available) in enumerate(rows, 1):
+            snapshot.upsert(user_id, languages, hourly_rate, float(rating), completion, location,
+                            specializations, is_available)
+            if yield_every and count % yield_every == 0:
+                # Lets other (green) threads run during a long build
+                time.sleep(0)
+        snapshot.finish()
+
+    def refresh(self, only_dirty=False):
+        """Reload translators changed since the last refresh (or just this worker's commits)"""
+        started = datetime.utcnow()
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        with db.engine.connect() as connection:
+            dirty_rows = _translator_rows(connection, user_ids=list(dirty)) if dirty else []
+            rows = [] if only_dirty else _translator_rows(connection, changed_since=self._refreshed_since)
+        with self._lock:
+            self._apply(self._snapshot, dirty_rows + rows)
+            # Dirty ids missing from their own lookup had their profile deleted
+            for user_id in dirty - {row[0] for row in dirty_rows}:
+                self._snapshot.remove(user_id)
+        if not only_dirty:
+            self._refreshed_since = started - MATCHING_REFRESH_OVERLAP
+            self._refreshed_at = time.monotonic()
+
+    def start_rebuild(self):
+        """Start building a new snapshot in the background, unless one is being built.
+
+        Returns a threading.Event that is set when the build is done.
+        """
+        with self._lock:
+            if self._build is None:
+                self._build = threading.Event()
+                threading.Thread(target=self._run_rebuild, args=(current_app._get_current_object(), self._build),
+                                 name='matching-rebuild', daemon=True).start()
+            return self._build
+
+    def _run_rebuild(self, app, done):
+        try:
+            with app.app_context():
+                self.rebuild()
+        except Exception as e:
+            logging.error(f"Error building matching snapshot: {str(e)}")
+        finally:
+            with self._lock:
+                self._build = None
+            done.set()
+
+    def rebuild(self):
+        """Build a new snapshot of every translator and swap it in"""
+        started = datetime.utcnow()
+        build_started = time.perf_counter()
+        with self._lock:
+            # The new snapshot is read after these commits, so it already has them
+            self._dirty.clear()
+        with db.engine.connect() as connection:
+            rows = _translator_rows(connection)
+
+        snapshot = TranslatorSnapshot(capacity=max(1024, len(rows)))
+        self._apply(snapshot, rows, yield_every=MATCHING_BUILD_CHUNK)
+        with self._lock:
+            self._snapshot = snapshot
+        self._refreshed_since = started - MATCHING_REFRESH_OVERLAP
+        self._refreshed_at = self._rebuilt_at = time.monotonic()
+        logging.info(f"Built matching snapshot of {snapshot.size} translators in {time.perf_counter() - build_started:.2f}s")
+
+matcher = TranslatorMatcher()
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_translators(session, flush_context):
+    changed = session.info.setdefault('matching_user_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, TranslatorProfile):
+            changed.add(obj.user_id)
+        elif isinstance(obj, Rating):
+            changed.add(obj.reviewee_id)
+
+@event.listens_for(Session, 'after_commit')
+def _refresh_on_commit(session):
+    changed = session.info.pop('matching_user_ids', None)
+    if changed:
+        matcher.mark_dirty(changed)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('matching_user_ids', None)
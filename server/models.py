@@ -1,12 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import password_hasher
+from photos import photo_variant_urls
 from datetime import datetime, timedelta
 import secrets
 import string
 from extensions import db
 import json
-from sqlalchemy.dialects.postgresql import JSON, ARRAY
-from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import JSON, ARRAY, insert as pg_insert
+from sqlalchemy import func, update, select, union, event, inspect
+from sqlalchemy.orm import Session, load_only, joinedload, contains_eager
+from decimal import Decimal
 
 # Generate a random token
 def generate_token(length=32):
@@ -23,7 +26,7 @@ class User(db.Model):
     is_traveler = db.Column(db.Boolean, nullable=False)
     preferred_language = db.Column(db.String(10), nullable=False, default='en')
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     password_reset_tokens = db.relationship('PasswordResetToken', backref='user', lazy=True, cascade='all, delete')
@@ -32,10 +35,18 @@ class User(db.Model):
     traveler_profile = db.relationship('TravelerProfile', backref='user', lazy=True, uselist=False, cascade='all, delete')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify a password, upgrading the stored hash if the hash parameters changed.
+        
+        The caller commits; a rehash shows up as a pending change on the user.
+        """
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     def as_dict(self):
         return {
@@ -119,6 +130,39 @@ class RefreshToken(db.Model):
         
         return token
 
+class RevokedToken(db.Model):
+    """Access token revoked before its expiry, identified by its JWT jti"""
+    __tablename__ = 'revoked_tokens'
+    __table_args__ = (
+        db.Index('idx_revoked_tokens_expires', 'expires_at'),
+        db.Index('idx_revoked_tokens_revoked', 'revoked_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    @classmethod
+    def revoke(cls, jti, user_id, expires_at):
+        """Record a revoked token (does not commit); revoking twice is a no-op"""
+        db.session.execute(
+            pg_insert(cls.__table__).values(
+                jti=jti,
+                user_id=user_id,
+                expires_at=expires_at,
+                revoked_at=datetime.utcnow()
+            ).on_conflict_do_nothing(index_elements=['jti'])
+        )
+    
+    @classmethod
+    def prune(cls):
+        """Delete entries for tokens that have expired (does not commit); returns the number removed"""
+        return db.session.execute(
+            cls.__table__.delete().where(cls.__table__.c.expires_at < datetime.utcnow())
+        ).rowcount
+
 class TranslatorProfile(db.Model):
     __tablename__ = 'translator_profiles'
     
@@ -129,6 +173,7 @@ class TranslatorProfile(db.Model):
     languages = db.Column(JSON, nullable=False)  # Array of {language_code, proficiency_level}
     hourly_rate = db.Column(db.Float, nullable=False)
     photo_url = db.Column(db.String(255))
+    photo_key = db.Column(db.String(64))  # Content digest of an uploaded photo (see photos.py)
     location = db.Column(db.String(255))
     bio = db.Column(db.Text)
     is_available = db.Column(db.Boolean, default=True)
@@ -143,6 +188,7 @@ class TranslatorProfile(db.Model):
     social_media = db.Column(JSON)  # Object with social media links
     preferred_meeting_locations = db.Column(ARRAY(db.String))  # Preferred meeting spots
     availability_hours = db.Column(JSON)  # Weekly availability schedule
+    profile_completion = db.Column(db.Integer, nullable=False, default=0)  # Kept up to date on write
     
     # Relationships
     ratings_received = db.relationship(
@@ -160,25 +206,26 @@ class TranslatorProfile(db.Model):
         lazy=True
     )
     
+    # Weight of each field in the profile completion percentage
+    COMPLETION_WEIGHTS = {
+        'languages': 15,  # Essential
+        'hourly_rate': 10,  # Essential
+        'photo_url': 10,
+        'location': 10,
+        'bio': 10,
+        'education': 10,
+        'certificates': 10,
+        'specializations': 5,
+        'years_of_experience': 5,
+        'social_media': 5,
+        'preferred_meeting_locations': 5,
+        'availability_hours': 5
+    }
+    
     def calculate_profile_completion(self):
         """Calculate profile completion percentage"""
-        fields = {
-            'languages': 15,  # Essential
-            'hourly_rate': 10,  # Essential
-            'photo_url': 10,
-            'location': 10,
-            'bio': 10,
-            'education': 10,
-            'certificates': 10,
-            'specializations': 5,
-            'years_of_experience': 5,
-            'social_media': 5,
-            'preferred_meeting_locations': 5,
-            'availability_hours': 5
-        }
-        
         completed = 0
-        for field, weight in fields.items():
+        for field, weight in self.COMPLETION_WEIGHTS.items():
             value = getattr(self, field)
             if value:
                 if isinstance(value, list) and len(value) > 0:
@@ -190,49 +237,158 @@ class TranslatorProfile(db.Model):
         
         return completed
     
-    def as_dict(self):
-        # Get average rating
+    def stats_version(self):
+        """Get cheap version data for the derived rating and booking stats.
+
+        Returns (rating_count, last_rating_at, booking_count, last_booking_at)
+        from the maintained summaries in a single round trip of two primary
+        key lookups, so callers can validate a cached profile without
+        aggregating ratings or bookings.
+        """
+        return db.session.query(
+            db.session.query(RatingSummary.rating_count).filter(
+                RatingSummary.user_id == self.user_id
+            ).scalar_subquery(),
+            db.session.query(RatingSummary.last_rating_at).filter(
+                RatingSummary.user_id == self.user_id
+            ).scalar_subquery(),
+            db.session.query(BookingSummary.booking_count).filter(
+                BookingSummary.translator_id == self.user_id
+            ).scalar_subquery(),
+            db.session.query(BookingSummary.last_booking_at).filter(
+                BookingSummary.translator_id == self.user_id
+            ).scalar_subquery()
+        ).one()
+    
+    def cache_validators(self):
+        """Get the (version parts, last modified) pair describing as_dict()"""
+        rating_count, last_rating_at, booking_count, last_booking_at = self.stats_version()
+        parts = (
+            'translator_profile', self.user_id, self.updated_at, self.user.updated_at,
+            rating_count, last_rating_at, booking_count
+        )
+        last_modified = max(
+            ts for ts in (self.updated_at, self.user.updated_at, last_rating_at, last_booking_at)
+            if ts is not None
+        )
+        return parts, last_modified
+    
+    # Serialized keys and how to produce them; rating and booking_count are aggregates
+    FIELD_SERIALIZERS = {
+        'id': lambda p: p.user_id,
+        'name': lambda p: p.user.name,
+        'languages': lambda p: p.languages,
+        'hourly_rate': lambda p: p.hourly_rate,
+        'photo_url': lambda p: p.photo_url or '',
+        'photo_urls': lambda p: p.photo_urls(),
+        'location': lambda p: p.location or '',
+        'bio': lambda p: p.bio or '',
+        'is_available': lambda p: p.is_available,
+        'rating': None,
+        'booking_count': None,
+        'education': lambda p: p.education or [],
+        'certificates': lambda p: p.certificates or [],
+        'specializations': lambda p: p.specializations or [],
+        'years_of_experience': lambda p: p.years_of_experience or 0,
+        'social_media': lambda p: p.social_media or {},
+        'preferred_meeting_locations': lambda p: p.preferred_meeting_locations or [],
+        'availability_hours': lambda p: p.availability_hours or {},
+        'profile_completion': lambda p: p.profile_completion,
+        'created_at': lambda p: p.created_at.isoformat(),
+        'updated_at': lambda p: p.updated_at.isoformat()
+    }
+    
+    # Columns each serialized key reads (beyond the always-loaded id/user_id/updated_at)
+    FIELD_COLUMNS = {
+        'languages': ['languages'],
+        'hourly_rate': ['hourly_rate'],
+        'photo_url': ['photo_url'],
+        'photo_urls': ['photo_key', 'photo_url'],
+        'location': ['location'],
+        'bio': ['bio'],
+        'is_available': ['is_available'],
+        'education': ['education'],
+        'certificates': ['certificates'],
+        'specializations': ['specializations'],
+        'years_of_experience': ['years_of_experience'],
+        'social_media': ['social_media'],
+        'preferred_meeting_locations': ['preferred_meeting_locations'],
+        'availability_hours': ['availability_hours'],
+        'profile_completion': ['profile_completion'],
+        'created_at': ['created_at']
+    }
+    
+    # Named field sets: card for lists and search, detail for a profile screen
+    PROJECTIONS = {
+        'card': ['id', 'name', 'photo_urls', 'languages', 'hourly_rate', 'rating', 'is_available'],
+        'detail': [
+            'id', 'name', 'photo_urls', 'languages', 'hourly_rate', 'rating', 'is_available',
+            'location', 'bio', 'booking_count', 'specializations', 'years_of_experience',
+            'profile_completion'
+        ],
+        'full': list(FIELD_SERIALIZERS)
+    }
+    
+    @classmethod
+    def columns_for(cls, fields):
+        """Names of the columns the given fields read"""
+        columns = {'id', 'user_id', 'updated_at'}
+        for field in fields:
+            columns.update(cls.FIELD_COLUMNS.get(field, []))
+        return sorted(columns)
+    
+    @classmethod
+    def load_options(cls, fields, user_joined=False):
+        """Query options loading only the columns the given fields need.
+        
+        Heavy JSON columns that are not requested stay deferred. Pass
+        user_joined=True when the query already joins User.
+        """
+        user_columns = (User.name, User.updated_at)
+        return [
+            load_only(*[getattr(cls, column) for column in cls.columns_for(fields)]),
+            contains_eager(cls.user).load_only(*user_columns) if user_joined
+            else joinedload(cls.user).load_only(*user_columns)
+        ]
+    
+    def photo_urls(self):
+        """Thumb/medium/full URLs of the profile photo"""
+        return photo_variant_urls(self.photo_key, self.photo_url)
+    
+    def average_rating(self):
         try:
-            avg_rating = db.session.query(func.avg(Rating.rating)).filter(
-                Rating.reviewee_id == self.user_id
-            ).scalar() or 0
+            return RatingSummary.for_user(self.user_id)[0]
         except Exception as e:
             # Handle any exceptions when getting ratings
             print(f"Error getting ratings: {str(e)}")
-            avg_rating = 0
-        
-        # Get total number of bookings - safely handle errors
+            return 0
+    
+    def booking_count(self):
         try:
-            booking_count = Booking.query.filter(
-                Booking.translator_id == self.user_id
-            ).count()
+            return db.session.query(BookingSummary.booking_count).filter(
+                BookingSummary.translator_id == self.user_id
+            ).scalar() or 0
         except Exception as e:
             # Handle any exceptions when counting bookings
             print(f"Error counting bookings: {str(e)}")
-            booking_count = 0
+            return 0
+    
+    def as_dict(self, fields=None, rating=None):
+        """Serialize the profile, limited to the given fields (default: all).
         
-        return {
-            'id': self.user_id,
-            'name': self.user.name,
-            'languages': self.languages,
-            'hourly_rate': self.hourly_rate,
-            'photo_url': self.photo_url or '',
-            'location': self.location or '',
-            'bio': self.bio or '',
-            'is_available': self.is_available,
-            'rating': round(float(avg_rating), 1),
-            'booking_count': booking_count,
-            'education': self.education or [],
-            'certificates': self.certificates or [],
-            'specializations': self.specializations or [],
-            'years_of_experience': self.years_of_experience or 0,
-            'social_media': self.social_media or {},
-            'preferred_meeting_locations': self.preferred_meeting_locations or [],
-            'availability_hours': self.availability_hours or {},
-            'profile_completion': self.calculate_profile_completion(),
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+        Aggregates only run when their key is requested; callers that have
+        already computed the average rating can pass it in.
+        """
+        data = {}
+        for field in fields or self.PROJECTIONS['full']:
+            if field == 'rating':
+                avg_rating = rating if rating is not None else self.average_rating()
+                data['rating'] = round(float(avg_rating), 1)
+            elif field == 'booking_count':
+                data['booking_count'] = self.booking_count()
+            else:
+                data[field] = self.FIELD_SERIALIZERS[field](self)
+        return data
     
     @classmethod
     def search(cls, filters=None, page=1, per_page=10):
@@ -253,19 +409,17 @@ class TranslatorProfile(db.Model):
             if 'available' in filters and filters['available']:
                 query = query.filter(cls.is_available == True)
             
+            if 'min_completion' in filters:
+                query = query.filter(cls.profile_completion >= int(filters['min_completion']))
+            
             if 'min_rating' in filters:
                 # Subquery to get translators with minimum rating
                 min_rating = float(filters['min_rating'])
-                rated_translators = db.session.query(
-                    Rating.reviewee_id,
-                    db.func.avg(Rating.rating).label('avg_rating')
-                ).group_by(Rating.reviewee_id).having(
-                    db.func.avg(Rating.rating) >= min_rating
-                ).subquery()
-                
                 query = query.join(
-                    rated_translators,
-                    cls.user_id == rated_translators.c.reviewee_id
+                    RatingSummary, RatingSummary.user_id == cls.user_id
+                ).filter(
+                    RatingSummary.rating_count > 0,
+                    RatingSummary.rating_sum >= min_rating * RatingSummary.rating_count
                 )
         
         # Order by rating and availability
@@ -290,6 +444,7 @@ class TravelerProfile(db.Model):
     full_name = db.Column(db.String(255), nullable=False)
     phone_number = db.Column(db.String(20), nullable=False)
     photo_url = db.Column(db.String(255))
+    photo_key = db.Column(db.String(64))  # Content digest of an uploaded photo (see photos.py)
     bio = db.Column(db.Text)
     nationality = db.Column(db.String(100))
     languages_needed = db.Column(JSON, nullable=False)  # Languages they need help with
@@ -297,24 +452,26 @@ class TravelerProfile(db.Model):
     travel_preferences = db.Column(JSON)  # Travel style, preferences, etc.
     interests = db.Column(ARRAY(db.String))  # Areas of interest
     emergency_contact = db.Column(JSON)  # Emergency contact information
+    profile_completion = db.Column(db.Integer, nullable=False, default=0)  # Kept up to date on write
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Weight of each field in the profile completion percentage
+    COMPLETION_WEIGHTS = {
+        'photo_url': 15,
+        'bio': 15,
+        'nationality': 15,
+        'languages_needed': 15,  # Essential
+        'current_location': 10,
+        'travel_preferences': 10,
+        'interests': 10,
+        'emergency_contact': 10
+    }
     
     def calculate_profile_completion(self):
         """Calculate profile completion percentage"""
-        fields = {
-            'photo_url': 15,
-            'bio': 15,
-            'nationality': 15,
-            'languages_needed': 15,  # Essential
-            'current_location': 10,
-            'travel_preferences': 10,
-            'interests': 10,
-            'emergency_contact': 10
-        }
-        
         completed = 0
-        for field, weight in fields.items():
+        for field, weight in self.COMPLETION_WEIGHTS.items():
             value = getattr(self, field)
             if value:
                 if isinstance(value, list) and len(value) > 0:
@@ -326,11 +483,20 @@ class TravelerProfile(db.Model):
         
         return completed
     
+    def photo_urls(self):
+        """Thumb/medium/full URLs of the profile photo"""
+        return photo_variant_urls(self.photo_key, self.photo_url)
+    
+    def cache_validators(self):
+        """Get the (version parts, last modified) pair describing as_dict()"""
+        return ('traveler_profile', self.user_id, self.updated_at), self.updated_at
+    
     def as_dict(self):
         return {
             'id': self.id,
             'user_id': self.user_id,
             'photo_url': self.photo_url or '',
+            'photo_urls': self.photo_urls(),
             'bio': self.bio or '',
             'nationality': self.nationality or '',
             'languages_needed': self.languages_needed,
@@ -338,42 +504,207 @@ class TravelerProfile(db.Model):
             'travel_preferences': self.travel_preferences or {},
             'interests': self.interests or [],
             'emergency_contact': self.emergency_contact or {},
-            'profile_completion': self.calculate_profile_completion(),
+            'profile_completion': self.profile_completion,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
 
+@event.listens_for(TranslatorProfile, 'before_insert')
+@event.listens_for(TravelerProfile, 'before_insert')
+def _set_profile_completion(mapper, connection, profile):
+    profile.profile_completion = profile.calculate_profile_completion()
+
+@event.listens_for(TranslatorProfile, 'before_update')
+@event.listens_for(TravelerProfile, 'before_update')
+def _update_profile_completion(mapper, connection, profile):
+    # Only recompute when a field that counts towards completion was written
+    state = inspect(profile)
+    if any(state.attrs[field].history.has_changes() for field in profile.COMPLETION_WEIGHTS):
+        profile.profile_completion = profile.calculate_profile_completion()
+
+class SimilarTranslators(db.Model):
+    """Precomputed nearest neighbours of one translator (built by similar.py)"""
+    __tablename__ = 'similar_translators'
+
+    translator_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    neighbours = db.Column(JSON, nullable=False)  # [[translator user id, similarity], ...], most similar first
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
 class Rating(db.Model):
     __tablename__ = 'ratings'
+    __table_args__ = (
+        db.UniqueConstraint('booking_id', 'reviewer_id', 'reviewee_id'),
+        db.Index('idx_ratings_reviewee_created', 'reviewee_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     reviewer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     reviewee_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False)
-    rating = db.Column(db.Float, nullable=False)
-    comment = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    rating = db.Column(db.Integer, nullable=False)  # 1 to 5
+    review = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
-    def __init__(self, reviewer_id, reviewee_id, booking_id, rating, comment=None):
+    def __init__(self, reviewer_id, reviewee_id, booking_id, rating, review=None):
         self.reviewer_id = reviewer_id
         self.reviewee_id = reviewee_id
         self.booking_id = booking_id
         self.rating = rating
-        self.comment = comment
+        self.review = review
+    
+    def as_dict(self, reviewer_name=None):
+        return {
+            'id': self.id,
+            'booking_id': self.booking_id,
+            'reviewer_id': self.reviewer_id,
+            'reviewer_name': reviewer_name,
+            'reviewee_id': self.reviewee_id,
+            'rating': self.rating,
+            'review': self.review,
+            'created_at': self.created_at.isoformat()
+        }
+
+class RatingSummary(db.Model):
+    """Running sum and count of the ratings each user received, one row per user.
+    
+    Updated in the transaction that stores a rating, so averages are a
+    primary key lookup (or a 1:1 join) instead of an AVG over ratings.
+    """
+    __tablename__ = 'rating_summaries'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    rating_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    last_rating_at = db.Column(db.DateTime)
+    
+    @classmethod
+    def average(cls):
+        """SQL expression for the average rating, 0 when there is none (use with an outer join)"""
+        return func.coalesce(
+            db.cast(cls.rating_sum, db.Float) / func.nullif(cls.rating_count, 0, type_=db.Float), 0
+        )
+    
+    @classmethod
+    def for_user(cls, user_id):
+        """Get (average, count, last_rating_at) with a primary key lookup"""
+        row = db.session.query(cls.rating_sum, cls.rating_count, cls.last_rating_at).filter(
+            cls.user_id == user_id
+        ).first()
+        if not row or not row.rating_count:
+            return 0, 0, None
+        return row.rating_sum / row.rating_count, row.rating_count, row.last_rating_at
+    
+    @classmethod
+    def record(cls, user_id, rating, rated_at):
+        """Add one rating to the user's running totals (does not commit)"""
+        statement = pg_insert(cls.__table__).values(
+            user_id=user_id,
+            rating_sum=rating,
+            rating_count=1,
+            last_rating_at=rated_at
+        )
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={
+                'rating_sum': cls.__table__.c.rating_sum + statement.excluded.rating_sum,
+                'rating_count': cls.__table__.c.rating_count + 1,
+                'last_rating_at': func.greatest(cls.__table__.c.last_rating_at, statement.excluded.last_rating_at)
+            }
+        ))
+    
+    @classmethod
+    def rebuild(cls):
+        """Recompute every user's totals from the ratings table (does not commit)"""
+        totals = db.session.query(
+            Rating.reviewee_id,
+            func.sum(Rating.rating),
+            func.count(Rating.id),
+            func.max(Rating.created_at)
+        ).group_by(Rating.reviewee_id)
+        
+        statement = pg_insert(cls.__table__).from_select(
+            ['user_id', 'rating_sum', 'rating_count', 'last_rating_at'],
+            totals
+        )
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={
+                'rating_sum': statement.excluded.rating_sum,
+                'rating_count': statement.excluded.rating_count,
+                'last_rating_at': statement.excluded.last_rating_at
+            }
+        ))
+
+class BookingSummary(db.Model):
+    """Running count of the bookings each translator received, one row per translator.
+    
+    Kept current by the booking flush listener below (and by bulk inserts),
+    so a profile's booking count and cache validators are a primary key
+    lookup instead of a COUNT over bookings.
+    """
+    __tablename__ = 'booking_summaries'
+    
+    translator_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    booking_count = db.Column(db.Integer, nullable=False, default=0)
+    last_booking_at = db.Column(db.DateTime)
+    
+    @classmethod
+    def apply_deltas(cls, connection, deltas):
+        """Add {translator_id: [count, last_booking_at]} deltas to the running counts"""
+        rows = [{
+            'translator_id': translator_id,
+            'booking_count': count,
+            'last_booking_at': last_booking_at
+        } for translator_id, (count, last_booking_at) in deltas.items() if count]
+        if not rows:
+            return
+        
+        statement = pg_insert(cls.__table__).values(rows)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=['translator_id'],
+            set_={
+                'booking_count': cls.__table__.c.booking_count + statement.excluded.booking_count,
+                'last_booking_at': func.greatest(cls.__table__.c.last_booking_at, statement.excluded.last_booking_at)
+            }
+        ))
+    
+    @classmethod
+    def rebuild(cls):
+        """Recompute every translator's count from the bookings table (does not commit)"""
+        totals = db.session.query(
+            Booking.translator_id,
+            func.count(Booking.id),
+            func.max(Booking.created_at)
+        ).group_by(Booking.translator_id)
+        
+        statement = pg_insert(cls.__table__).from_select(
+            ['translator_id', 'booking_count', 'last_booking_at'],
+            totals
+        )
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['translator_id'],
+            set_={
+                'booking_count': statement.excluded.booking_count,
+                'last_booking_at': statement.excluded.last_booking_at
+            }
+        ))
 
 class Booking(db.Model):
     __tablename__ = 'bookings'
     
     id = db.Column(db.Integer, primary_key=True)
     traveler_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    translator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    status = db.Column(db.String(20), nullable=False)  # pending, confirmed, completed, cancelled
-    date = db.Column(db.Date, nullable=False)
+    # active_history keeps the previous value of the columns that key the
+    # daily earnings rollup, so a transition can move amounts between buckets
+    translator_id = db.column_property(db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False), active_history=True)
+    status = db.column_property(db.Column(db.String(20), nullable=False), active_history=True)  # pending, confirmed, completed, cancelled
+    date = db.column_property(db.Column(db.Date, nullable=False), active_history=True)
     start_time = db.Column(db.Time, nullable=False)
     duration_hours = db.Column(db.Integer, nullable=False)
     location = db.Column(db.String(255), nullable=False)
     notes = db.Column(db.Text)
-    total_amount = db.Column(db.Numeric(10, 2), nullable=False)
+    total_amount = db.column_property(db.Column(db.Numeric(10, 2), nullable=False), active_history=True)
+    hourly_rate = db.Column(db.Numeric(10, 2))  # Rate the booking was priced at (see pricing.py); NULL before quotes
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -381,7 +712,7 @@ class Booking(db.Model):
     rating = db.relationship('Rating', backref='booking', lazy=True, uselist=False)
     payments = db.relationship('Payment', backref='booking', lazy=True)
     
-    def __init__(self, traveler_id, translator_id, date, start_time, duration_hours, location, total_amount, notes=None):
+    def __init__(self, traveler_id, translator_id, date, start_time, duration_hours, location, total_amount, notes=None, hourly_rate=None):
         self.traveler_id = traveler_id
         self.translator_id = translator_id
         self.status = 'pending'
@@ -391,12 +722,20 @@ class Booking(db.Model):
         self.location = location
         self.notes = notes
         self.total_amount = total_amount
+        self.hourly_rate = hourly_rate
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        # Serves the traveler's payment history, newest first
+        db.Index('idx_payments_traveler_created', 'traveler_id', 'created_at', 'id'),
+        # Lets reconciliation walk the pending payments oldest first
+        db.Index('idx_payments_pending_created', 'created_at', 'id', postgresql_where=db.text("status = 'pending'")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False)
+    traveler_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # Denormalized from the booking
     payment_id = db.Column(db.String(100), nullable=False, unique=True)
     transaction_id = db.Column(db.String(100), unique=True)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
@@ -408,8 +747,9 @@ class Payment(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
-    def __init__(self, booking_id, payment_id, amount, currency, status, payment_method, payment_intent_id=None, client_secret=None, transaction_id=None):
+    def __init__(self, booking_id, payment_id, amount, currency, status, payment_method, payment_intent_id=None, client_secret=None, transaction_id=None, traveler_id=None):
         self.booking_id = booking_id
+        self.traveler_id = traveler_id
         self.payment_id = payment_id
         self.amount = amount
         self.currency = currency
@@ -433,6 +773,371 @@ class Payment(db.Model):
             'updated_at': self.updated_at.isoformat()
         }
 
+class WebhookEvent(db.Model):
+    """Inbox of received provider webhook events, processed asynchronously"""
+    __tablename__ = 'webhook_events'
+    __table_args__ = (
+        db.Index('idx_webhook_events_due', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(255), nullable=False, unique=True)
+    event_type = db.Column(db.String(100), nullable=False)
+    payload = db.Column(JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processed, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    
+    @classmethod
+    def store(cls, event_id, event_type, payload):
+        """Insert an event unless one with the same id was already received (does not commit).
+        
+        Returns True if the event is new, False for a duplicate delivery.
+        """
+        now = datetime.utcnow()
+        inserted = db.session.execute(
+            pg_insert(cls.__table__).values(
+                event_id=event_id,
+                event_type=event_type,
+                payload=payload,
+                status='pending',
+                attempts=0,
+                next_attempt_at=now,
+                created_at=now
+            ).on_conflict_do_nothing(
+                index_elements=['event_id']
+            ).returning(cls.__table__.c.id)
+        ).scalar()
+        return inserted is not None
+
+class IdempotencyKey(db.Model):
+    """Response of a mutating request, replayed when the client retries with the same key"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='unique_user_idempotency_key'),
+        db.Index('idx_idempotency_keys_expires', 'expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    method = db.Column(db.String(10), nullable=False)
+    path = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)  # NULL while the original request is still running
+    response_body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    @classmethod
+    def claim(cls, user_id, key, method, path, request_hash, ttl):
+        """Reserve a key for a new request (does not commit).
+        
+        Returns the id of the reserved row, or None if the user already used
+        the key. The unique (user_id, key) constraint makes concurrent
+        retries race-free: exactly one of them gets the reservation.
+        """
+        now = datetime.utcnow()
+        return db.session.execute(
+            pg_insert(cls.__table__).values(
+                user_id=user_id,
+                key=key,
+                method=method,
+                path=path,
+                request_hash=request_hash,
+                created_at=now,
+                expires_at=now + ttl
+            ).on_conflict_do_nothing(
+                index_elements=['user_id', 'key']
+            ).returning(cls.__table__.c.id)
+        ).scalar()
+    
+    @classmethod
+    def prune(cls):
+        """Delete expired keys (does not commit); returns the number removed"""
+        return db.session.execute(
+            cls.__table__.delete().where(cls.__table__.c.expires_at < datetime.utcnow())
+        ).rowcount
+
+class TranslatorEarning(db.Model):
+    __tablename__ = 'translator_earnings'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    translator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False, unique=True)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # pending, available, paid
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    @classmethod
+    def record_for_booking(cls, booking):
+        """Append the earning for a completed booking and credit the translator's balance.
+        
+        Safe to call more than once for the same booking: the unique booking_id
+        turns repeats into no-ops, so the balance is only credited once. Runs in
+        the caller's transaction and does not commit.
+        """
+        now = datetime.utcnow()
+        inserted = db.session.execute(
+            pg_insert(cls.__table__).values(
+                translator_id=booking.translator_id,
+                booking_id=booking.id,
+                amount=booking.total_amount,
+                status='available',
+                created_at=now,
+                updated_at=now
+            ).on_conflict_do_nothing(
+                index_elements=['booking_id']
+            ).returning(cls.__table__.c.id)
+        ).scalar()
+        
+        if inserted is not None:
+            TranslatorBalance.credit(booking.translator_id, booking.total_amount)
+        
+        return inserted
+
+class TranslatorPayout(db.Model):
+    __tablename__ = 'translator_payouts'
+    __table_args__ = (
+        db.Index('idx_translator_payouts_translator_created', 'translator_id', 'created_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    translator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    payment_method = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # pending, processing, completed, failed
+    transaction_id = db.Column(db.String(100))
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'translator_id': self.translator_id,
+            'amount': float(self.amount),
+            'payment_method': self.payment_method,
+            'status': self.status,
+            'transaction_id': self.transaction_id,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+class TranslatorBalance(db.Model):
+    """Running totals of the earnings/payouts ledger, one row per translator"""
+    __tablename__ = 'translator_balances'
+    
+    translator_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    available_balance = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    total_earned = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    total_paid_out = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    @classmethod
+    def for_translator(cls, translator_id):
+        """Get (available_balance, total_paid_out) with a primary key lookup"""
+        row = db.session.query(cls.available_balance, cls.total_paid_out).filter(
+            cls.translator_id == translator_id
+        ).first()
+        if not row:
+            return Decimal('0.00'), Decimal('0.00')
+        return row.available_balance, row.total_paid_out
+    
+    @classmethod
+    def credit(cls, translator_id, amount):
+        """Add an earning to the translator's running balance (does not commit)"""
+        statement = pg_insert(cls.__table__).values(
+            translator_id=translator_id,
+            available_balance=amount,
+            total_earned=amount,
+            total_paid_out=0,
+            updated_at=datetime.utcnow()
+        )
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['translator_id'],
+            set_={
+                'available_balance': cls.__table__.c.available_balance + statement.excluded.available_balance,
+                'total_earned': cls.__table__.c.total_earned + statement.excluded.total_earned,
+                'updated_at': statement.excluded.updated_at
+            }
+        ))
+    
+    @classmethod
+    def debit(cls, translator_id, amount):
+        """Take a payout out of the translator's balance (does not commit).
+        
+        The balance check and the debit are a single conditional UPDATE, so
+        concurrent withdrawals serialize on the balance row and can never
+        overdraw it. Returns the new balance, or None if funds are insufficient.
+        """
+        return db.session.execute(
+            update(cls.__table__).where(
+                cls.__table__.c.translator_id == translator_id,
+                cls.__table__.c.available_balance >= amount
+            ).values(
+                available_balance=cls.__table__.c.available_balance - amount,
+                total_paid_out=cls.__table__.c.total_paid_out + amount,
+                updated_at=datetime.utcnow()
+            ).returning(cls.__table__.c.available_balance)
+        ).scalar()
+    
+    @classmethod
+    def rebuild(cls):
+        """Recompute every translator's running totals from the ledger rows (does not commit)"""
+        earned = db.session.query(
+            TranslatorEarning.translator_id.label('translator_id'),
+            func.sum(TranslatorEarning.amount).label('amount')
+        ).group_by(TranslatorEarning.translator_id).subquery()
+        paid = db.session.query(
+            TranslatorPayout.translator_id.label('translator_id'),
+            func.sum(TranslatorPayout.amount).label('amount')
+        ).filter(
+            TranslatorPayout.status != 'failed'
+        ).group_by(TranslatorPayout.translator_id).subquery()
+        
+        translators = union(
+            select(earned.c.translator_id),
+            select(paid.c.translator_id)
+        ).subquery()
+        total_earned = func.coalesce(earned.c.amount, 0)
+        total_paid_out = func.coalesce(paid.c.amount, 0)
+        
+        totals = db.session.query(
+            translators.c.translator_id,
+            total_earned - total_paid_out,
+            total_earned,
+            total_paid_out,
+            func.now()
+        ).outerjoin(
+            earned, earned.c.translator_id == translators.c.translator_id
+        ).outerjoin(
+            paid, paid.c.translator_id == translators.c.translator_id
+        )
+        
+        statement = pg_insert(cls.__table__).from_select(
+            ['translator_id', 'available_balance', 'total_earned', 'total_paid_out', 'updated_at'],
+            totals
+        )
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['translator_id'],
+            set_={
+                'available_balance': statement.excluded.available_balance,
+                'total_earned': statement.excluded.total_earned,
+                'total_paid_out': statement.excluded.total_paid_out,
+                'updated_at': statement.excluded.updated_at
+            }
+        ))
+
+class TranslatorDailyEarning(db.Model):
+    """Per-day booking totals for each translator and booking status.
+    
+    Kept current by the flush listener below, so earnings dashboards
+    aggregate a few rollup rows instead of every booking.
+    """
+    __tablename__ = 'translator_daily_earnings'
+    
+    translator_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    amount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    booking_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def apply_deltas(cls, connection, deltas):
+        """Add {(translator_id, day, status): [amount, count]} deltas to the rollup"""
+        rows = [{
+            'translator_id': translator_id,
+            'day': day,
+            'status': status,
+            'amount': amount,
+            'booking_count': count
+        } for (translator_id, day, status), (amount, count) in deltas.items() if count or amount]
+        if not rows:
+            return
+        
+        statement = pg_insert(cls.__table__).values(rows)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=['translator_id', 'day', 'status'],
+            set_={
+                'amount': cls.__table__.c.amount + statement.excluded.amount,
+                'booking_count': cls.__table__.c.booking_count + statement.excluded.booking_count
+            }
+        ))
+    
+    @classmethod
+    def rebuild(cls):
+        """Recompute the whole rollup from the bookings table (does not commit)"""
+        db.session.execute(cls.__table__.delete())
+        db.session.execute(pg_insert(cls.__table__).from_select(
+            ['translator_id', 'day', 'status', 'amount', 'booking_count'],
+            select(
+                Booking.translator_id,
+                Booking.date,
+                Booking.status,
+                func.sum(Booking.total_amount),
+                func.count(Booking.id)
+            ).group_by(Booking.translator_id, Booking.date, Booking.status)
+        ))
+
+# Booking attributes that identify a rollup bucket, in _add_booking_delta order
+ROLLUP_BOOKING_KEYS = ('translator_id', 'date', 'status', 'total_amount')
+
+def _add_booking_delta(deltas, translator_id, day, status, amount, count):
+    bucket = deltas.setdefault((translator_id, day, status), [Decimal('0'), 0])
+    bucket[0] += Decimal(str(amount)) * count
+    bucket[1] += count
+
+def _previous_value(state, key):
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return state.attrs[key].value
+
+@event.listens_for(Session, 'after_flush')
+def _update_daily_earnings(session, flush_context):
+    """Move booking amounts between rollup buckets as bookings are written.
+    
+    Also keeps each translator's running booking count (BookingSummary).
+    """
+    deltas = {}
+    counts = {}
+    
+    for obj in session.new:
+        if isinstance(obj, Booking):
+            _add_booking_delta(deltas, obj.translator_id, obj.date, obj.status, obj.total_amount, 1)
+            count = counts.setdefault(obj.translator_id, [0, None])
+            count[0] += 1
+            count[1] = max(filter(None, (count[1], obj.created_at)), default=None)
+    
+    for obj in session.dirty:
+        if not isinstance(obj, Booking):
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[key].history.has_changes() for key in ROLLUP_BOOKING_KEYS):
+            continue
+        previous = [_previous_value(state, key) for key in ROLLUP_BOOKING_KEYS]
+        _add_booking_delta(deltas, *previous, -1)
+        _add_booking_delta(deltas, obj.translator_id, obj.date, obj.status, obj.total_amount, 1)
+    
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            previous = [_previous_value(inspect(obj), key) for key in ROLLUP_BOOKING_KEYS]
+            _add_booking_delta(deltas, *previous, -1)
+            counts.setdefault(previous[0], [0, None])[0] -= 1
+    
+    if deltas:
+        TranslatorDailyEarning.apply_deltas(session.connection(), deltas)
+    if counts:
+        BookingSummary.apply_deltas(session.connection(), counts)
+
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
     
@@ -0,0 +1,252 @@
+from extensions import db
+from models import User, TranslatorProfile
+from passwords import password_hasher
+from routes.auth import is_valid_password
+from email_validator import validate_email, EmailNotValidError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from datetime import datetime
+import csv
+import json
+import logging
+import os
+import time
+
+# Rows validated, hashed and inserted per transaction
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 500))
+
+TRANSLATOR_REQUIRED_FIELDS = ['full_name', 'phone_number', 'hourly_rate', 'languages']
+
+# Optional profile columns an import row may set
+IMPORT_OPTIONAL_FIELDS = ['location', 'bio', 'photo_url', 'years_of_experience']
+
+def translator_profile_error(data):
+    """Validate translator profile data; returns an error message, or None if it is valid"""
+    missing_fields = [field for field in TRANSLATOR_REQUIRED_FIELDS if field not in data]
+    if missing_fields:
+        return f'Missing required fields: {missing_fields}'
+
+    try:
+        float(data['hourly_rate'])
+    except (TypeError, ValueError) as e:
+        return f'Invalid value: {str(e)}'
+
+    # Validate languages array
+    if not isinstance(data['languages'], list):
+        return 'Languages must be a list'
+    if not data['languages']:
+        return 'At least one language must be provided'
+    for lang in data['languages']:
+        if not isinstance(lang, dict):
+            return 'Each language must be an object'
+        if 'language_code' not in lang or 'language_name' not in lang:
+            return 'Each language must have language_code and language_name'
+
+    return None
+
+def _parse_languages(value):
+    """CSV cells hold either a JSON array or "es:Spanish:native;fr:French" """
+    value = value.strip()
+    if not value or value.startswith('['):
+        return json.loads(value or '[]')
+    languages = []
+    for item in value.split(';'):
+        parts = [part.strip() for part in item.split(':')]
+        language = {'language_code': parts[0], 'language_name': parts[1] if len(parts) > 1 else None}
+        if len(parts) > 2:
+            language['proficiency_level'] = parts[2]
+        if language['language_name'] is None:
+            del language['language_name']
+        languages.append(language)
+    return languages
+
+def read_rows(path, file_format):
+    """Yield (line number, row dict) from a CSV or JSONL file, streaming"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                # Blank cells mean "not given"
+                row = {key: value.strip() for key, value in row.items() if key and value and value.strip()}
+                if 'languages' in row:
+                    try:
+                        row['languages'] = _parse_languages(row['languages'])
+                    except ValueError:
+                        pass  # Left as a string; validation reports it
+                yield reader.line_num, row
+        else:
+            for line_num, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_num, row if isinstance(row, dict) else None
+
+class TranslatorImport:
+    """Loads translators (user + profile) in chunks, one transaction per chunk.
+
+    Each chunk's passwords are hashed together across the whole password
+    pool. Users and profiles then go in with one multi-row INSERT each.
+    Rows that fail validation, or whose email already exists, are written
+    to the rejects file instead of stopping the import.
+    """
+
+    def __init__(self, rejects_file, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False):
+        self.rejects_file = rejects_file
+        # PostgreSQL allows 65535 bind parameters per statement; a user row takes 7
+        self.chunk_size = max(1, min(chunk_size, 5000))
+        self.dry_run = dry_run
+        self.stats = {'read': 0, 'imported': 0, 'rejected': 0, 'hash_seconds': 0.0, 'insert_seconds': 0.0}
+        self._seen_emails = set()
+        self._deliverable_domains = {}
+
+    def email_error(self, email):
+        # Syntax per row, deliverability (a DNS lookup) once per domain
+        try:
+            domain = validate_email(email, check_deliverability=False).ascii_domain
+        except EmailNotValidError:
+            return 'Invalid email format'
+        if domain not in self._deliverable_domains:
+            try:
+                validate_email(email)
+                self._deliverable_domains[domain] = True
+            except EmailNotValidError:
+                self._deliverable_domains[domain] = False
+        return None if self._deliverable_domains[domain] else 'Invalid email format'
+
+    def validate(self, row):
+        """Check an import row with the register and create-profile rules; returns an error or None"""
+        if row is None:
+            return 'Not a JSON object'
+
+        missing_fields = [field for field in ('email', 'password') if not row.get(field)]
+        if missing_fields:
+            return f'Missing required fields: {", ".join(missing_fields)}'
+        if not isinstance(row['email'], str):
+            return 'Invalid email format'
+        error = self.email_error(row['email'].strip())
+        if error:
+            return error
+        if not isinstance(row['password'], str) or not is_valid_password(row['password']):
+            return 'Password must be at least 8 characters long and contain uppercase, lowercase, and numeric characters'
+
+        error = translator_profile_error(row)
+        if error:
+            return error
+        if row.get('years_of_experience') is not None:
+            try:
+                int(row['years_of_experience'])
+            except (TypeError, ValueError):
+                return 'Invalid value for years_of_experience'
+
+        email = row['email'].strip().lower()
+        if email in self._seen_emails:
+            return 'Duplicate email in import file'
+        self._seen_emails.add(email)
+        return None
+
+    def reject(self, line_num, row, error):
+        self.stats['rejected'] += 1
+        if isinstance(row, dict):
+            row = {key: value for key, value in row.items() if key != 'password'}
+        self.rejects_file.write(json.dumps({'line': line_num, 'error': error, 'row': row}, default=str) + '\n')
+
+    def run(self, rows):
+        chunk = []
+        for line_num, row in rows:
+            self.stats['read'] += 1
+            error = self.validate(row)
+            if error:
+                self.reject(line_num, row, error)
+                continue
+            chunk.append((line_num, row))
+            if len(chunk) >= self.chunk_size:
+                self.load_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.load_chunk(chunk)
+        return self.stats
+
+    def load_chunk(self, chunk):
+        # Drop emails registered before this import (one indexed lookup per chunk)
+        existing = {
+            email for (email,) in
+            db.session.query(User.email).filter(User.email.in_([row['email'].strip() for _, row in chunk]))
+        }
+        pending = []
+        for line_num, row in chunk:
+            if row['email'].strip() in existing:
+                self.reject(line_num, row, 'Email already registered')
+            else:
+                pending.append((line_num, row))
+        if not pending or self.dry_run:
+            self.stats['imported'] += len(pending)
+            return
+
+        started = time.monotonic()
+        password_hashes = password_hasher.hash_many([row['password'] for _, row in pending])
+        self.stats['hash_seconds'] += time.monotonic() - started
+
+        started = time.monotonic()
+        now = datetime.utcnow()
+        try:
+            # ON CONFLICT: an email registered while the chunk was hashing is rejected, not fatal
+            inserted = db.session.execute(
+                pg_insert(User.__table__).values([
+                    {
+                        'email': row['email'].strip(),
+                        'password_hash': password_hash,
+                        'name': row.get('name') or row['full_name'],
+                        'is_traveler': False,
+                        'preferred_language': row.get('preferred_language', 'en'),
+                        'created_at': now,
+                        'updated_at': now
+                    }
+                    for (_, row), password_hash in zip(pending, password_hashes)
+                ]).on_conflict_do_nothing(index_elements=['email']).returning(
+                    User.__table__.c.id, User.__table__.c.email
+                )
+            ).all()
+            user_ids = {email: user_id for user_id, email in inserted}
+
+            profiles = []
+            conflicts = []
+            for line_num, row in pending:
+                user_id = user_ids.get(row['email'].strip())
+                if user_id is None:
+                    conflicts.append((line_num, row))
+                    continue
+                values = {
+                    'user_id': user_id,
+                    'full_name': row['full_name'],
+                    'phone_number': str(row['phone_number']),
+                    'hourly_rate': float(row['hourly_rate']),
+                    'languages': row['languages'],
+                    'is_available': True,
+                    'created_at': now,
+                    'updated_at': now
+                }
+                # Every row gets every key: an executemany insert takes its columns from the first row
+                for field in IMPORT_OPTIONAL_FIELDS:
+                    value = row.get(field)
+                    values[field] = int(value) if field == 'years_of_experience' and value is not None else value
+                # Core inserts skip the mapper hooks, so fill in the stored completion here
+                values['profile_completion'] = TranslatorProfile(**values).calculate_profile_completion()
+                profiles.append(values)
+
+            if profiles:
+                db.session.execute(TranslatorProfile.__table__.insert(), profiles)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error importing translators (lines {pending[0][0]}-{pending[-1][0]}): {str(e)}")
+            for line_num, row in pending:
+                self.reject(line_num, row, f'Chunk failed: {str(e)}')
+            return
+        finally:
+            self.stats['insert_seconds'] += time.monotonic() - started
+
+        for line_num, row in conflicts:
+            self.reject(line_num, row, 'Email already registered')
+        self.stats['imported'] += len(profiles)
@@ -0,0 +1,25 @@
+import base64
+import json
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row on a page into an opaque cursor"""
+    raw = json.dumps([str(value) for value in values]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor() back into its list of string values.
+
+    Raises ValueError for anything that is not a cursor we issued.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+        raise ValueError('Invalid cursor')
+    return values
+
+def page_limit(args, default=20, maximum=100):
+    """Read a bounded page size from the request args"""
+    return max(1, min(maximum, int(args.get('limit', default))))
@@ -0,0 +1,65 @@
+from werkzeug.security import generate_password_hash, check_password_hash
+from process_pool import BoundedProcessPool, PoolBusy
+import os
+
+# Werkzeug hash method, e.g. "pbkdf2:sha256:600000" or "scrypt:32768:8:1".
+# Stored hashes made with other parameters are upgraded on the next login.
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+
+# Hashing processes, and how many more hashes may wait for one. 0 hashes inline.
+PASSWORD_POOL_SIZE = int(os.environ.get('PASSWORD_POOL_SIZE', max(1, (os.cpu_count() or 2) // 2)))
+PASSWORD_QUEUE_SIZE = int(os.environ.get('PASSWORD_QUEUE_SIZE', 32))
+
+# Longest a request waits for its hash, queueing included (seconds)
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5))
+
+class PasswordHasherBusy(PoolBusy):
+    """All hashing slots are taken; the client should retry later"""
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded pool of worker processes.
+
+    Key stretching is deliberately CPU-heavy, so it runs on a
+    BoundedProcessPool of PASSWORD_POOL_SIZE processes while the calling
+    green thread yields to the hub. At most PASSWORD_QUEUE_SIZE hashes may
+    queue; beyond that, callers get PasswordHasherBusy instead of piling up.
+    """
+
+    def __init__(self, method=PASSWORD_HASH_METHOD, pool_size=PASSWORD_POOL_SIZE,
+                 queue_size=PASSWORD_QUEUE_SIZE, timeout=PASSWORD_HASH_TIMEOUT):
+        self.method = method
+        self._pool = BoundedProcessPool(
+            pool_size, queue_size, timeout, busy_error=PasswordHasherBusy,
+            busy_message='Too many password operations in progress',
+            timeout_message='Password operation timed out'
+        )
+        self._method_tag = None
+
+    def hash(self, password):
+        password_hash = self._pool.run(generate_password_hash, password, self.method)
+        self._method_tag = password_hash.split('$', 1)[0]
+        return password_hash
+
+    def hash_many(self, passwords):
+        """Hash a batch of passwords across the whole pool (for bulk jobs, no queue bound)"""
+        return self._pool.map(generate_password_hash, passwords, [self.method] * len(passwords))
+
+    def verify(self, password_hash, password):
+        return self._pool.run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if a stored hash was made with different parameters than the configured ones.
+
+        Werkzeug fills in defaults (e.g. "scrypt" -> "scrypt:32768:8:1"), so
+        the expanded tag is learned from a hash made here. If the pool is too
+        busy to make one, the rehash is skipped rather than failing a login
+        whose password already checked out.
+        """
+        if self._method_tag is None:
+            try:
+                self.hash('')
+            except PasswordHasherBusy:
+                return False
+        return password_hash.split('$', 1)[0] != self._method_tag
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from stripe.http_client import RequestsClient
+from process_pool import wait_for
+import logging
+import os
+import threading
+import time
+import stripe
+
+# Setup Stripe with the API key from environment variables
+stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
+stripe_publishable_key = os.environ.get('STRIPE_PUBLISHABLE_KEY')
+
+# Point the client at a local fake (tools/fake_stripe.py) for offline load tests
+if os.environ.get('STRIPE_API_BASE'):
+    stripe.api_base = os.environ['STRIPE_API_BASE']
+
+# Worker threads making provider calls, and how many more calls may wait for one
+PROVIDER_POOL_SIZE = int(os.environ.get('STRIPE_POOL_SIZE', 8))
+PROVIDER_QUEUE_SIZE = int(os.environ.get('STRIPE_QUEUE_SIZE', 16))
+
+# Connect/read timeouts of a single HTTP request, and the overall budget of a call
+PROVIDER_CONNECT_TIMEOUT = float(os.environ.get('STRIPE_CONNECT_TIMEOUT', 3))
+PROVIDER_READ_TIMEOUT = float(os.environ.get('STRIPE_READ_TIMEOUT', 10))
+PROVIDER_CALL_TIMEOUT = float(os.environ.get('STRIPE_CALL_TIMEOUT', 12))
+
+# Consecutive failures that open the breaker, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('STRIPE_BREAKER_FAILURES', 5))
+BREAKER_RESET_SECONDS = float(os.environ.get('STRIPE_BREAKER_RESET_SECONDS', 30))
+
+# Each pool thread keeps its own requests.Session, so connections are reused
+stripe.default_http_client = RequestsClient(timeout=(PROVIDER_CONNECT_TIMEOUT, PROVIDER_READ_TIMEOUT))
+
+# Errors that say something about the provider's health rather than the request
+PROVIDER_FAULTS = (
+    stripe.error.APIConnectionError,
+    stripe.error.APIError,
+    stripe.error.RateLimitError
+)
+
+class ProviderUnavailable(Exception):
+    """The payment provider cannot take the call right now; the client should retry later"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Fail fast after repeated provider faults instead of tying up workers.
+
+    Closed: calls pass through. After BREAKER_FAILURE_THRESHOLD consecutive
+    faults the breaker opens and rejects calls for BREAKER_RESET_SECONDS.
+    Then a single trial call is let through (half-open); its outcome closes
+    or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def retry_after(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(1, int(self.reset_seconds - (time.monotonic() - self._opened_at)) + 1)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logging.warning("Payment provider circuit breaker opened")
+                self._opened_at = time.monotonic()
+
+class PaymentProvider:
+    """Runs payment provider calls on a bounded pool with timeouts and a circuit breaker.
+
+    Request handlers never talk to Stripe directly: the call runs on one of
+    PROVIDER_POOL_SIZE threads, at most PROVIDER_QUEUE_SIZE further calls may
+    wait, and anything beyond that is rejected immediately rather than
+    queueing behind a slow provider.
+    """
+
+    def __init__(self, pool_size=PROVIDER_POOL_SIZE, queue_size=PROVIDER_QUEUE_SIZE,
+                 call_timeout=PROVIDER_CALL_TIMEOUT):
+        self.call_timeout = call_timeout
+        self.breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='payment-provider')
+        self._slots = threading.BoundedSemaphore(pool_size + queue_size)
+
+    def call(self, fn, *args, **kwargs):
+        if not self.breaker.allow():
+            raise ProviderUnavailable('Payment provider is unavailable', self.breaker.retry_after())
+
+        if not self._slots.acquire(blocking=False):
+            raise ProviderUnavailable('Payment provider is busy', 1)
+
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            # Yields to the eventlet hub while the call runs, so other sockets keep being served
+            result = wait_for(future, self.call_timeout)
+        except FutureTimeoutError:
+            # The thread finishes on its own; the HTTP timeouts bound how long
+            self.breaker.record_failure()
+            raise ProviderUnavailable('Payment provider timed out', 1)
+        except PROVIDER_FAULTS:
+            self.breaker.record_failure()
+            raise
+        except stripe.error.StripeError:
+            # Card declines, invalid requests, etc. mean the provider is healthy
+            self.breaker.record_success()
+            raise
+
+        self.breaker.record_success()
+        return result
+
+    def create_payment_intent(self, **params):
+        return self.call(stripe.PaymentIntent.create, **params)
+
+    def retrieve_payment_intent(self, payment_intent_id):
+        return self.call(stripe.PaymentIntent.retrieve, payment_intent_id)
+
+    def list_payment_intents(self, **params):
+        return self.call(stripe.PaymentIntent.list, **params)
+
+provider = PaymentProvider()
@@ -0,0 +1,183 @@
+from flask import send_from_directory, abort
+from process_pool import BoundedProcessPool, PoolBusy
+import hashlib
+import importlib
+import io
+import os
+import threading
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+# "local" stores files under PHOTO_STORAGE_DIR and serves them from /media.
+# Anything else is a "package.module:ClassName" implementing exists/save/url.
+PHOTO_STORAGE_BACKEND = os.environ.get('PHOTO_STORAGE_BACKEND', 'local')
+PHOTO_STORAGE_DIR = os.environ.get('PHOTO_STORAGE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media'))
+
+# Prefix of stored photo URLs, e.g. a CDN in front of the media route
+PHOTO_BASE_URL = os.environ.get('PHOTO_BASE_URL', '/media').rstrip('/')
+
+# Largest accepted upload (bytes) and image (pixels, guards against decompression bombs)
+PHOTO_MAX_BYTES = int(os.environ.get('PHOTO_MAX_BYTES', 8 * 1024 * 1024))
+PHOTO_MAX_PIXELS = int(os.environ.get('PHOTO_MAX_PIXELS', 40_000_000))
+
+# Resizing processes, how many more uploads may wait for one, and the wait timeout (seconds)
+PHOTO_POOL_SIZE = int(os.environ.get('PHOTO_POOL_SIZE', max(1, (os.cpu_count() or 2) // 2)))
+PHOTO_QUEUE_SIZE = int(os.environ.get('PHOTO_QUEUE_SIZE', 16))
+PHOTO_TIMEOUT = float(os.environ.get('PHOTO_TIMEOUT', 20))
+
+# Variant name -> (longest side in pixels, crop to a square). The thumbnail
+# covers 40x40 avatars on 2x screens; full caps what a profile screen loads.
+PHOTO_VARIANTS = {
+    'thumb': (96, True),
+    'medium': (480, False),
+    'full': (1600, False)
+}
+
+PHOTO_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+# Stored files never change under a given URL, so clients and CDNs may keep them forever
+PHOTO_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+class PhotoProcessorBusy(PoolBusy):
+    """All resizing slots are taken; the client should retry later"""
+
+    def __init__(self, message, retry_after=2):
+        super().__init__(message, retry_after)
+
+def variant_key(digest, variant):
+    """Storage key of one variant of the photo with the given content digest"""
+    return f'photos/{digest[:2]}/{digest}/{variant}.jpg'
+
+def render_variants(data):
+    """Decode an uploaded image and encode every variant as JPEG.
+
+    Runs in a pool process. Raises ValueError for anything that is not a
+    supported, reasonably sized image.
+    """
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = PHOTO_MAX_PIXELS
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format not in PHOTO_FORMATS:
+            raise ValueError(f'Unsupported image format: {image.format}')
+        if image.width * image.height > PHOTO_MAX_PIXELS:
+            raise ValueError('Image is too large')
+        image.load()
+    except (OSError, Image.DecompressionBombError):
+        raise ValueError('File is not a valid image')
+
+    # Respect camera orientation, then flatten transparency onto white
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    variants = {}
+    for name, (size, crop) in PHOTO_VARIANTS.items():
+        if crop:
+            resized = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        # Re-encoding also drops EXIF (location etc.) from what we serve
+        resized.save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+        variants[name] = buffer.getvalue()
+    return variants
+
+class LocalPhotoStorage:
+    """Stores photos as files under a directory.
+
+    Other backends (e.g. an object store) implement the same three
+    methods and are selected with PHOTO_STORAGE_BACKEND.
+    """
+
+    def __init__(self, root=PHOTO_STORAGE_DIR, base_url=PHOTO_BASE_URL):
+        self.root = root
+        self.base_url = base_url
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.root, key))
+
+    def save(self, key, data, content_type='image/jpeg'):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a reader never sees a partial file
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def url(self, key):
+        return f'{self.base_url}/{key}'
+
+def create_storage():
+    if PHOTO_STORAGE_BACKEND == 'local':
+        return LocalPhotoStorage()
+    module_name, class_name = PHOTO_STORAGE_BACKEND.split(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+storage = create_storage()
+
+def photo_variant_urls(photo_key, photo_url=None):
+    """URLs of every variant of an uploaded photo.
+
+    Profiles that only have an external photo_url get it for every variant,
+    so clients can always read e.g. photo_urls['thumb'].
+    """
+    if photo_key:
+        return {variant: storage.url(variant_key(photo_key, variant)) for variant in PHOTO_VARIANTS}
+    return {variant: photo_url or '' for variant in PHOTO_VARIANTS}
+
+class PhotoProcessor:
+    """Resizes uploads on a BoundedProcessPool of PHOTO_POOL_SIZE processes.
+
+    At most PHOTO_QUEUE_SIZE uploads may queue; beyond that, callers get
+    PhotoProcessorBusy.
+    """
+
+    def __init__(self, pool_size=PHOTO_POOL_SIZE, queue_size=PHOTO_QUEUE_SIZE, timeout=PHOTO_TIMEOUT):
+        self._pool = BoundedProcessPool(
+            pool_size, queue_size, timeout, busy_error=PhotoProcessorBusy,
+            busy_message='Too many photo uploads in progress',
+            timeout_message='Photo processing timed out'
+        )
+
+    def render(self, data):
+        return self._pool.run(render_variants, data)
+
+photo_processor = PhotoProcessor()
+
+def store_photo(data):
+    """Store all variants of an uploaded image; returns its content digest.
+
+    Photos are addressed by the SHA-256 of the uploaded bytes, so uploading
+    the same image again reuses the stored variants without resizing.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    if not storage.exists(variant_key(digest, 'full')):
+        variants = photo_processor.render(data)
+        # 'full' is written last: once it exists, every variant does
+        for name in sorted(variants, key=lambda name: name == 'full'):
+            storage.save(variant_key(digest, name), variants[name])
+    return digest
+
+def init_app(app):
+    if not isinstance(storage, LocalPhotoStorage):
+        return
+
+    @app.route('/media/photos/<path:key>')
+    def serve_photo(key):
+        if not key.endswith('.jpg'):
+            abort(404)
+        response = send_from_directory(os.path.join(storage.root, 'photos'), key, mimetype='image/jpeg')
+        response.headers['Cache-Control'] = PHOTO_CACHE_CONTROL
+        return response
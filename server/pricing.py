@@ -0,0 +1,191 @@
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from collections import OrderedDict, namedtuple
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from extensions import db
+from models import TranslatorProfile
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+import os
+import threading
+import time
+
+# Currency of every quote; payments are charged in it
+PRICING_CURRENCY = 'EUR'
+
+# How long a translator's rate may be served from the per-worker cache (seconds)
+PRICING_CACHE_TTL = float(os.environ.get('PRICING_CACHE_TTL_SECONDS', 60))
+PRICING_CACHE_MAX_ENTRIES = int(os.environ.get('PRICING_CACHE_MAX_ENTRIES', 10000))
+
+# How long a quote_token locks its price (seconds)
+PRICING_QUOTE_TTL = int(os.environ.get('PRICING_QUOTE_TTL_SECONDS', 900))
+
+# Surcharges and the service fee, in percent; 0 turns one off. The night
+# surcharge applies to each hour starting between NIGHT_START and NIGHT_END.
+WEEKEND_SURCHARGE_PERCENT = Decimal(os.environ.get('WEEKEND_SURCHARGE_PERCENT', '0'))
+NIGHT_SURCHARGE_PERCENT = Decimal(os.environ.get('NIGHT_SURCHARGE_PERCENT', '0'))
+SERVICE_FEE_PERCENT = Decimal(os.environ.get('SERVICE_FEE_PERCENT', '0'))
+NIGHT_START_HOUR = 20
+NIGHT_END_HOUR = 8
+
+CENT = Decimal('0.01')
+
+# What pricing needs to know about a translator
+TranslatorRate = namedtuple('TranslatorRate', ['translator_id', 'hourly_rate', 'is_available'])
+
+class QuoteError(Exception):
+    """A quote_token that is invalid, expired or for another booking"""
+
+def _money(value):
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+def _percent(amount, percent):
+    return _money(amount * percent / 100)
+
+class Quote(namedtuple('Quote', ['translator_id', 'date', 'start_time', 'duration_hours', 'hourly_rate',
+                                 'subtotal', 'surcharges', 'service_fee', 'total'])):
+
+    def as_dict(self):
+        return {
+            'translator_id': self.translator_id,
+            'date': self.date.strftime('%Y-%m-%d'),
+            'start_time': self.start_time.strftime('%H:%M'),
+            'duration_hours': self.duration_hours,
+            'hourly_rate': float(self.hourly_rate),
+            'subtotal': float(self.subtotal),
+            'surcharges': [{'name': name, 'amount': float(amount)} for name, amount in self.surcharges],
+            'service_fee': float(self.service_fee),
+            'total': float(self.total),
+            'currency': PRICING_CURRENCY
+        }
+
+def quote(translator_id, hourly_rate, booking_date, start_time, duration_hours):
+    """Price a booking. Pure: the rate comes from the caller, so quoting needs no query"""
+    hourly_rate = _money(hourly_rate)
+    subtotal = hourly_rate * duration_hours
+
+    surcharges = []
+    if WEEKEND_SURCHARGE_PERCENT and booking_date.weekday() >= 5:
+        surcharges.append(('weekend', _percent(subtotal, WEEKEND_SURCHARGE_PERCENT)))
+    if NIGHT_SURCHARGE_PERCENT:
+        night_hours = sum(
+            1 for hour in range(duration_hours)
+            if not NIGHT_END_HOUR <= (start_time.hour + hour) % 24 < NIGHT_START_HOUR
+        )
+        if night_hours:
+            surcharges.append(('night', _percent(hourly_rate * night_hours, NIGHT_SURCHARGE_PERCENT)))
+
+    service_fee = _percent(subtotal + sum(amount for _, amount in surcharges), SERVICE_FEE_PERCENT)
+    total = subtotal + sum(amount for _, amount in surcharges) + service_fee
+    return Quote(translator_id, booking_date, start_time, duration_hours, hourly_rate,
+                 subtotal, surcharges, service_fee, total)
+
+def quote_booking(booking, hourly_rate=None):
+    """Re-price a stored booking at its own rate, or at hourly_rate if it has none"""
+    return quote(booking.translator_id, booking.hourly_rate or hourly_rate,
+                 booking.date, booking.start_time, booking.duration_hours)
+
+class RateCache:
+    """Short-lived, per-worker cache of translator rates, like the user cache.
+
+    Entries are dropped when the translator's profile is committed in this
+    worker and expire after PRICING_CACHE_TTL everywhere else. Callers that
+    already loaded the profile put its rate in, so the next quote is free.
+    """
+
+    def __init__(self, ttl=PRICING_CACHE_TTL, max_entries=PRICING_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, translator_id):
+        """Return the TranslatorRate for a translator, or None if they have no profile"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(translator_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(translator_id)
+                return entry[1]
+
+        row = db.session.query(
+            TranslatorProfile.user_id, TranslatorProfile.hourly_rate, TranslatorProfile.is_available
+        ).filter(TranslatorProfile.user_id == translator_id).first()
+        if row is None:
+            return None
+        rate = TranslatorRate(row.user_id, _money(row.hourly_rate), bool(row.is_available))
+        self.put(rate)
+        return rate
+
+    def put(self, rate):
+        with self._lock:
+            self._entries[rate.translator_id] = (time.monotonic() + self.ttl, rate)
+            self._entries.move_to_end(rate.translator_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *translator_ids):
+        with self._lock:
+            for translator_id in translator_ids:
+                self._entries.pop(translator_id, None)
+
+rate_cache = RateCache()
+
+def rate_from_profile(profile):
+    """The rate of an already loaded profile (or row), cached for later quotes"""
+    rate = TranslatorRate(profile.user_id, _money(profile.hourly_rate), bool(profile.is_available))
+    rate_cache.put(rate)
+    return rate
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='booking-quote')
+
+def quote_token(booking_quote):
+    """Signed token that lets create_booking honour this quote for PRICING_QUOTE_TTL"""
+    return _serializer().dumps({
+        'translator_id': booking_quote.translator_id,
+        'date': booking_quote.date.isoformat(),
+        'start_time': booking_quote.start_time.strftime('%H:%M'),
+        'duration_hours': booking_quote.duration_hours,
+        'hourly_rate': str(booking_quote.hourly_rate)
+    })
+
+def quote_expires_at():
+    return datetime.utcnow() + timedelta(seconds=PRICING_QUOTE_TTL)
+
+def quote_from_token(token, translator_id, booking_date, start_time, duration_hours):
+    """Re-create a quote from its token; checks the signature only, no query.
+
+    The token carries the rate, not the total, so the total is always
+    computed here. Raises QuoteError when the token is invalid, expired or
+    was issued for a different booking.
+    """
+    try:
+        data = _serializer().loads(token, max_age=PRICING_QUOTE_TTL)
+    except SignatureExpired:
+        raise QuoteError('Quote has expired')
+    except BadSignature:
+        raise QuoteError('Invalid quote token')
+
+    if (data['translator_id'], data['date'], data['start_time'], data['duration_hours']) != (
+            translator_id, booking_date.isoformat(), start_time.strftime('%H:%M'), duration_hours):
+        raise QuoteError('Quote is for a different booking')
+    return quote(translator_id, Decimal(data['hourly_rate']), booking_date, start_time, duration_hours)
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_rates(session, flush_context):
+    changed = session.info.setdefault('pricing_translator_ids', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, TranslatorProfile):
+            changed.add(obj.user_id)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    changed = session.info.pop('pricing_translator_ids', None)
+    if changed:
+        rate_cache.invalidate(*changed)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('pricing_translator_ids', None)
@@ -0,0 +1,103 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+import multiprocessing
+import threading
+import time
+
+try:
+    import eventlet
+    import greenlet
+except ImportError:
+    eventlet = None
+
+# Polling interval bounds while a green thread waits on a pool result (seconds)
+POLL_MIN_INTERVAL = 0.001
+POLL_MAX_INTERVAL = 0.02
+
+class PoolBusy(Exception):
+    """All slots of a bounded pool are taken, or its result took too long"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def in_green_thread():
+    return eventlet is not None and greenlet.getcurrent().parent is not None
+
+def wait_for(future, timeout):
+    """Result of a concurrent.futures future, without stalling the eventlet hub.
+
+    Under monkey patching the future's Condition is green, so it must not be
+    waited on from a native (tpool) thread. A green caller polls done()
+    and yields to the hub between polls; anyone else blocks as usual.
+    Raises concurrent.futures.TimeoutError after `timeout` seconds.
+    """
+    if not in_green_thread():
+        return future.result(timeout)
+
+    deadline = time.monotonic() + timeout
+    interval = POLL_MIN_INTERVAL
+    while not future.done():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise FutureTimeoutError()
+        eventlet.sleep(min(interval, remaining))
+        interval = min(interval * 2, POLL_MAX_INTERVAL)
+    return future.result(0)
+
+class BoundedProcessPool:
+    """A process pool that admits at most pool_size + queue_size pending calls.
+
+    CPU-heavy work (key stretching, image resampling) stalls the eventlet
+    hub, and with it every socket on the worker, if it runs inline. Here it
+    runs in pool_size separate processes while the caller waits with
+    wait_for. Callers beyond the queue bound, and calls that take longer
+    than `timeout`, get `busy_error` instead of piling up.
+    """
+
+    def __init__(self, pool_size, queue_size, timeout, busy_error=PoolBusy,
+                 busy_message='Too many operations in progress', timeout_message='Operation timed out'):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.busy_error = busy_error
+        self.busy_message = busy_message
+        self.timeout_message = timeout_message
+        self._slots = threading.BoundedSemaphore(pool_size + queue_size)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def executor(self):
+        # Started on first use so forked workers do not inherit a running pool
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    mp_context=multiprocessing.get_context('fork')
+                )
+            return self._executor
+
+    def run(self, fn, *args):
+        """Call fn(*args) in the pool and wait for it; inline when pool_size is 0"""
+        if self.pool_size <= 0:
+            return fn(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise self.busy_error(self.busy_message)
+
+        try:
+            future = self.executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return wait_for(future, self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise self.busy_error(self.timeout_message)
+
+    def map(self, fn, *iterables, chunksize=16):
+        """Spread a batch across the whole pool (for bulk jobs, no queue bound)"""
+        if self.pool_size <= 0:
+            return list(map(fn, *iterables))
+        return list(self.executor().map(fn, *iterables, chunksize=chunksize))
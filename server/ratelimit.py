@@ -0,0 +1,173 @@
+from flask import request, jsonify
+from flask_jwt_extended import get_jwt_identity
+from functools import wraps
+import logging
+import math
+import os
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Set to "false" to switch all limits off (e.g. for load tests)
+RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() != 'false'
+
+# Optional Redis URL; buckets are then shared by all workers instead of per process
+RATELIMIT_REDIS_URL = os.environ.get('RATELIMIT_REDIS_URL')
+
+# Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+RATELIMIT_TRUST_PROXY = os.environ.get('RATELIMIT_TRUST_PROXY', 'false').lower() == 'true'
+
+# Lock stripes of the in-process store, and buckets kept per stripe
+RATELIMIT_STRIPES = 64
+RATELIMIT_MAX_BUCKETS_PER_STRIPE = 2048
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Policy name -> "<requests>/<period>"; override with e.g. RATELIMIT_LOGIN_EMAIL=10/minute.
+# The request count is also the burst: a fresh bucket allows that many at once.
+DEFAULT_POLICIES = {
+    'login-ip': '30/minute',
+    'login-email': '5/minute',
+    'register-ip': '10/hour',
+    'reset-password-ip': '10/hour',
+    'reset-password-email': '3/hour',
+    'search-user': '60/minute',
+    'search-ip': '300/minute',
+    'chat-send-user': '30/minute'
+}
+
+def parse_policy(spec):
+    """Turn "5/minute" into (refill rate per second, burst)"""
+    count, period = spec.split('/')
+    count = int(count)
+    return count / PERIODS[period], count
+
+def load_policies():
+    policies = {}
+    for name, default in DEFAULT_POLICIES.items():
+        env_name = 'RATELIMIT_' + name.upper().replace('-', '_')
+        policies[name] = parse_policy(os.environ.get(env_name, default))
+    return policies
+
+POLICIES = load_policies()
+
+class MemoryBucketStore:
+    """Token buckets in process memory, spread over lock stripes.
+
+    A request only takes the lock of its key's stripe, so concurrent
+    requests for different clients rarely contend. Each stripe keeps its
+    buckets in least-recently-used order. Once a stripe is full, the
+    oldest buckets are dropped; by then they have usually refilled anyway.
+    """
+
+    def __init__(self, stripes=RATELIMIT_STRIPES, max_buckets=RATELIMIT_MAX_BUCKETS_PER_STRIPE):
+        self.max_buckets = max_buckets
+        self._stripes = [(threading.Lock(), {}) for _ in range(stripes)]
+
+    def acquire(self, key, rate, burst):
+        """Take a token; returns 0 if allowed, else seconds until the next token"""
+        lock, buckets = self._stripes[hash(key) % len(self._stripes)]
+        now = time.monotonic()
+        with lock:
+            state = buckets.pop(key, None)
+            if state is None:
+                tokens = burst
+            else:
+                tokens = min(burst, state[0] + (now - state[1]) * rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+
+            buckets[key] = (tokens, now)
+            if len(buckets) > self.max_buckets:
+                del buckets[next(iter(buckets))]
+        return wait
+
+class RedisBucketStore:
+    """Token buckets shared through Redis, updated atomically by a Lua script"""
+
+    SCRIPT = """
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url):
+        self._client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self._script = self._client.register_script(self.SCRIPT)
+        self._fallback = MemoryBucketStore()
+
+    def acquire(self, key, rate, burst):
+        try:
+            return float(self._script(keys=['ratelimit:' + key], args=[rate, burst]))
+        except redis.RedisError as e:
+            # Keep limiting per worker rather than failing requests
+            logging.warning(f"Rate limit backend unavailable, using local buckets: {str(e)}")
+            return self._fallback.acquire(key, rate, burst)
+
+def create_store():
+    if RATELIMIT_REDIS_URL:
+        if redis is not None:
+            return RedisBucketStore(RATELIMIT_REDIS_URL)
+        logging.warning("RATELIMIT_REDIS_URL is set but the redis package is not installed; using per-worker buckets")
+    return MemoryBucketStore()
+
+store = create_store()
+
+# Key functions: return the value to limit on, or None to skip the policy
+
+def by_ip():
+    if RATELIMIT_TRUST_PROXY and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr
+
+def by_user():
+    return get_jwt_identity()
+
+def by_email():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('email'), str):
+        return None
+    return data['email'].strip().lower()
+
+def too_many_requests(wait):
+    response = jsonify({'error': 'Too many requests, please retry later'})
+    response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response, 429
+
+def rate_limit(policy, key=by_ip):
+    """Reject requests beyond a policy's rate with 429 and Retry-After.
+
+    Stack several to limit on more than one key (e.g. per IP and per email).
+    Per-user limits must be applied below @jwt_required().
+    """
+    rate, burst = POLICIES[policy]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if RATELIMIT_ENABLED:
+                value = key()
+                if value is not None:
+                    wait = store.acquire(f'{policy}:{value}', rate, burst)
+                    if wait:
+                        return too_many_requests(wait)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
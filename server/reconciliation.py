@@ -0,0 +1,150 @@
+from extensions import db
+from models import Payment, Booking
+from payment_provider import provider
+from webhooks import complete_payment, fail_payment
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import tuple_
+import logging
+import os
+
+# Pending payments younger than this are left to the client and webhooks
+RECONCILE_STALE_MINUTES = int(os.environ.get('RECONCILE_STALE_MINUTES', 30))
+
+# Pending payments examined per batch (one provider scan, one transaction)
+RECONCILE_CHUNK_SIZE = int(os.environ.get('RECONCILE_CHUNK_SIZE', 200))
+
+# A batch never spans more than this much creation time, which bounds how
+# many provider intents a single scan has to page through
+RECONCILE_MAX_WINDOW = timedelta(hours=6)
+
+# Slack around the batch's window: the intent is created before its payment row
+RECONCILE_CLOCK_SKEW = timedelta(minutes=5)
+
+# Page size of the provider list call (Stripe's maximum)
+PROVIDER_PAGE_SIZE = 100
+
+# Provider intent status -> outcome for the local payment
+SUCCEEDED_STATUSES = {'succeeded'}
+FAILED_STATUSES = {'canceled'}
+
+def _unix(timestamp):
+    # Model timestamps are naive UTC
+    return int(timestamp.replace(tzinfo=timezone.utc).timestamp())
+
+def fetch_intent_statuses(created_from, created_to, stats):
+    """List the provider's intents created in a window, following pagination.
+    
+    Returns a dict of intent id -> status. One list call returns up to
+    PROVIDER_PAGE_SIZE intents, instead of one retrieve call per payment.
+    """
+    statuses = {}
+    params = {
+        'created': {'gte': _unix(created_from), 'lte': _unix(created_to)},
+        'limit': PROVIDER_PAGE_SIZE
+    }
+    while True:
+        page = provider.list_payment_intents(**params)
+        stats['provider_calls'] += 1
+        for intent in page.data:
+            statuses[intent.id] = intent.status
+        if not page.has_more or not page.data:
+            return statuses
+        params['starting_after'] = page.data[-1].id
+
+def apply_intent_statuses(payment_ids, statuses, stats):
+    """Move pending payments to the provider's state in one transaction.
+    
+    Rows are locked with SKIP LOCKED and re-checked for 'pending', so a
+    webhook or /verify that resolved a payment in the meantime wins.
+    """
+    payments = Payment.query.filter(
+        Payment.id.in_(payment_ids),
+        Payment.status == 'pending'
+    ).with_for_update(skip_locked=True).all()
+    
+    # Load the affected bookings in one query so complete_payment finds them in the session
+    booking_ids = [payment.booking_id for payment in payments if statuses.get(payment.payment_intent_id) in SUCCEEDED_STATUSES]
+    if booking_ids:
+        Booking.query.filter(Booking.id.in_(booking_ids)).all()
+    
+    now = datetime.utcnow()
+    for payment in payments:
+        status = statuses.get(payment.payment_intent_id)
+        if status is None:
+            # Unknown to the provider in this window; left for a manual look
+            stats['missing'] += 1
+            continue
+        elif status in SUCCEEDED_STATUSES:
+            complete_payment(payment, payment.payment_intent_id)
+            stats['completed'] += 1
+        elif status in FAILED_STATUSES:
+            fail_payment(payment)
+            stats['failed'] += 1
+        else:
+            stats['still_pending'] += 1
+            continue
+        
+        payment.updated_at = now
+        stats['max_drift_seconds'] = max(stats['max_drift_seconds'], int((now - payment.created_at).total_seconds()))
+    
+    db.session.commit()
+
+def reconcile_pending_payments(stale_minutes=RECONCILE_STALE_MINUTES, chunk_size=RECONCILE_CHUNK_SIZE):
+    """Resolve pending payments whose webhook never arrived.
+    
+    Walks stale pending payments oldest first in chunks. For each chunk,
+    the provider's intents for the chunk's creation window are listed in
+    bulk, and the transitions are applied in a single transaction. No
+    database transaction is held open across provider calls.
+    
+    Returns drift metrics: how many payments were scanned and how many
+    the provider had already completed or cancelled (drift).
+    """
+    stats = {
+        'scanned': 0,
+        'completed': 0,
+        'failed': 0,
+        'still_pending': 0,
+        'missing': 0,
+        'provider_calls': 0,
+        'max_drift_seconds': 0
+    }
+    cutoff = datetime.utcnow() - timedelta(minutes=stale_minutes)
+    position = None
+    
+    while True:
+        query = db.session.query(
+            Payment.id, Payment.created_at
+        ).filter(
+            Payment.status == 'pending',
+            Payment.payment_intent_id.isnot(None),
+            Payment.created_at < cutoff
+        )
+        if position:
+            query = query.filter(tuple_(Payment.created_at, Payment.id) > position)
+        rows = query.order_by(Payment.created_at, Payment.id).limit(chunk_size).all()
+        
+        # End the read transaction before talking to the provider
+        db.session.rollback()
+        if not rows:
+            break
+        
+        # Keep the chunk inside one bounded window of creation time
+        window_end = rows[0].created_at + RECONCILE_MAX_WINDOW
+        chunk = [row for row in rows if row.created_at <= window_end]
+        position = (chunk[-1].created_at, chunk[-1].id)
+        
+        statuses = fetch_intent_statuses(
+            chunk[0].created_at - RECONCILE_CLOCK_SKEW,
+            chunk[-1].created_at + RECONCILE_CLOCK_SKEW,
+            stats
+        )
+        apply_intent_statuses([row.id for row in chunk], statuses, stats)
+        stats['scanned'] += len(chunk)
+    
+    stats['drift'] = stats['completed'] + stats['failed']
+    if stats['drift'] or stats['missing']:
+        logging.warning(f"Payment reconciliation found drift: {stats}")
+    else:
+        logging.info(f"Payment reconciliation found no drift: {stats}")
+    return stats
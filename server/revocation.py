@@ -0,0 +1,191 @@
+from flask import jsonify, current_app
+from sqlalchemy import select
+from extensions import db, jwt
+from models import RevokedToken
+from datetime import datetime, timedelta
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+
+# How often each worker pulls revocations made by other workers (seconds)
+REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', 5))
+
+# How often expired entries are pruned and the filter rebuilt (seconds)
+REVOCATION_REBUILD_SECONDS = float(os.environ.get('REVOCATION_REBUILD_SECONDS', 3600))
+
+# Re-read revocations this far back on every sync, so a logout whose
+# transaction committed late is not skipped
+REVOCATION_SYNC_OVERLAP = timedelta(seconds=60)
+
+# Target false positive rate; a false positive only costs one exact lookup
+REVOCATION_ERROR_RATE = 0.001
+REVOCATION_MIN_CAPACITY = 1024
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+
+    Answers "definitely not present" or "possibly present" using
+    about 1.8 bytes per item at a 0.1% false positive rate.
+    """
+
+    def __init__(self, capacity, error_rate=REVOCATION_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class RevocationList:
+    """Per-worker replica of revoked_tokens for the token_in_blocklist check.
+
+    The database is the source of truth. Each worker keeps a Bloom filter
+    of revoked jtis, so almost every request (one whose token was never
+    revoked) is answered from memory. Only a "possibly revoked" answer is
+    confirmed against the table. Revocations made by other workers become
+    visible within REVOCATION_SYNC_SECONDS.
+    """
+
+    def __init__(self, sync_seconds=REVOCATION_SYNC_SECONDS, rebuild_seconds=REVOCATION_REBUILD_SECONDS):
+        self.sync_seconds = sync_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._bloom = BloomFilter(REVOCATION_MIN_CAPACITY)
+        self._count = 0
+        self._synced_at = None
+        self._synced_since = None
+        self._rebuilt_at = None
+
+    def is_revoked(self, jti):
+        self._refresh_if_due()
+        if jti not in self._bloom:
+            return False
+        # Possibly revoked: confirm against the table (also catches false positives)
+        with db.engine.connect() as connection:
+            return connection.execute(
+                select(RevokedToken.id).where(RevokedToken.jti == jti)
+            ).first() is not None
+
+    def add(self, jti):
+        with self._lock:
+            if jti in self._bloom:
+                return
+            self._bloom.add(jti)
+            self._count += 1
+            if self._count > self._bloom.capacity:
+                # Full: the false positive rate climbs from here, so rebuild bigger
+                self._rebuilt_at = None
+
+    def _rebuild_due(self, now):
+        return self._rebuilt_at is None or now - self._rebuilt_at >= self.rebuild_seconds
+
+    def _refresh_if_due(self):
+        now = time.monotonic()
+        if not self._rebuild_due(now) and now - self._synced_at < self.sync_seconds:
+            return
+        # One request refreshes while the others keep answering from the
+        # current filter. Only before the first build is there nothing to
+        # answer from, so then they wait for it.
+        if not self._refresh_lock.acquire(blocking=self._synced_at is None):
+            return
+        try:
+            now = time.monotonic()
+            if self._rebuild_due(now):
+                self.rebuild()
+            elif now - self._synced_at >= self.sync_seconds:
+                self.sync()
+        finally:
+            self._refresh_lock.release()
+
+    def sync(self):
+        """Add revocations recorded since the last sync"""
+        started = datetime.utcnow()
+        with db.engine.connect() as connection:
+            jtis = connection.execute(
+                select(RevokedToken.jti).where(RevokedToken.revoked_at >= self._synced_since)
+            ).scalars().all()
+        for jti in jtis:
+            self.add(jti)
+        self._synced_since = started - REVOCATION_SYNC_OVERLAP
+        self._synced_at = time.monotonic()
+
+    def rebuild(self):
+        """Prune expired entries and rebuild the filter from the live ones.
+
+        Runs under the refresh lock, so one request per worker does this
+        while the others keep answering from the current filter.
+        """
+        started = datetime.utcnow()
+        try:
+            with db.engine.begin() as connection:
+                pruned = connection.execute(
+                    RevokedToken.__table__.delete().where(RevokedToken.expires_at < started)
+                ).rowcount
+            if pruned:
+                logging.info(f"Pruned {pruned} expired revoked tokens")
+        except Exception as e:
+            # The filter ignores expired entries anyway; try again at the next rebuild
+            logging.error(f"Error pruning revoked tokens: {str(e)}")
+        
+        with db.engine.connect() as connection:
+            jtis = connection.execute(
+                select(RevokedToken.jti).where(RevokedToken.expires_at >= started)
+            ).scalars().all()
+
+        bloom = BloomFilter(max(REVOCATION_MIN_CAPACITY, 2 * len(jtis)))
+        for jti in jtis:
+            bloom.add(jti)
+
+        with self._lock:
+            self._bloom = bloom
+            self._count = len(jtis)
+        self._synced_since = started - REVOCATION_SYNC_OVERLAP
+        self._synced_at = self._rebuilt_at = time.monotonic()
+
+revocation_list = RevocationList()
+
+def revoke_token(jwt_payload):
+    """Revoke the token a payload belongs to and commit"""
+    RevokedToken.revoke(
+        jwt_payload['jti'],
+        int(jwt_payload[current_app.config['JWT_IDENTITY_CLAIM']]),
+        datetime.utcfromtimestamp(jwt_payload['exp'])
+    )
+    db.session.commit()
+    revocation_list.add(jwt_payload['jti'])
+
+def init_app(app):
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return revocation_list.is_revoked(jwt_payload['jti'])
+
+    @jwt.revoked_token_loader
+    def revoked_token_callback(jwt_header, jwt_payload):
+        return jsonify({
+            'error': 'Token has been revoked',
+            'message': 'Please log in again'
+        }), 401
+
+    @app.cli.command('prune-revoked-tokens')
+    def prune_revoked_tokens():
+        """Delete revoked-token entries whose tokens have expired"""
+        removed = RevokedToken.prune()
+        db.session.commit()
+        print(f"Removed {removed} expired revoked tokens")
@@ -1,14 +1,24 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from models import User, PasswordResetToken
 from extensions import db
 from email_validator import validate_email, EmailNotValidError
+from passwords import PasswordHasherBusy
+from revocation import revoke_token
+from ratelimit import rate_limit, by_ip, by_email
 import re
 from datetime import datetime, timedelta
 import logging
 
 auth_bp = Blueprint('auth', __name__)
 
+def hasher_busy_response(error):
+    """Tell the client to retry when the password hashing pool is saturated"""
+    logging.warning(f"Password hashing busy: {str(error)}")
+    response = jsonify({'error': 'Server is busy, please retry'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
 # Helper function to validate email
 def is_valid_email(email):
     try:
@@ -28,6 +38,7 @@ def is_valid_password(password):
     return True
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limit('register-ip', by_ip)
 def register():
     data = request.get_json()
     
@@ -81,12 +92,17 @@ def register():
             'preferred_language': user.preferred_language,
             'message': 'User registered successfully'
         }), 201
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return hasher_busy_response(e)
     except Exception as e:
         db.session.rollback()
         logging.error(f"Registration error: {str(e)}")
         return jsonify({'error': 'Failed to register user'}), 500
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit('login-ip', by_ip)
+@rate_limit('login-email', by_email)
 def login():
     data = request.get_json()
     
@@ -98,8 +114,19 @@ def login():
     user = User.query.filter_by(email=data['email']).first()
     
     # Check if user exists and password is correct
-    if not user or not user.check_password(data['password']):
-        return jsonify({'error': 'Invalid email or password'}), 401
+    try:
+        if not user or not user.check_password(data['password']):
+            return jsonify({'error': 'Invalid email or password'}), 401
+    except PasswordHasherBusy as e:
+        return hasher_busy_response(e)
+    
+    # Store the upgraded hash if the hash parameters changed since it was made
+    if db.session.is_modified(user):
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Password rehash error: {str(e)}")
     
     # Generate single token
     access_token = create_access_token(identity=str(user.id))
@@ -113,6 +140,8 @@ def login():
     }), 200
 
 @auth_bp.route('/reset-password-request', methods=['POST'])
+@rate_limit('reset-password-ip', by_ip)
+@rate_limit('reset-password-email', by_email)
 def reset_password_request():
     data = request.get_json()
     
@@ -174,6 +203,9 @@ def reset_password_confirm():
         return jsonify({
             'message': 'Password reset successful'
         }), 200
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return hasher_busy_response(e)
     except Exception as e:
         db.session.rollback()
         logging.error(f"Password reset error: {str(e)}")
@@ -182,6 +214,14 @@ def reset_password_confirm():
 @auth_bp.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
+    # Revoke the presented token so it stops working before it expires
+    try:
+        revoke_token(get_jwt())
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Logout error: {str(e)}")
+        return jsonify({'error': 'Failed to log out'}), 500
+    
     return jsonify({
         'message': 'Logged out successfully'
     }), 200 
\ No newline at end of file
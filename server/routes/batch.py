@@ -0,0 +1,93 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from extensions import db
+from werkzeug.test import EnvironBuilder
+import json
+import logging
+import os
+
+batch_bp = Blueprint('batch', __name__)
+
+# Upper bound on the sub-requests a single batch may carry
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 20))
+
+# Sub-requests are reads; writes keep their own endpoints (idempotency keys etc.)
+BATCH_METHODS = {'GET'}
+
+# Request headers a sub-request may set; Authorization always comes from the batch itself
+BATCH_REQUEST_HEADERS = {'If-None-Match', 'If-Modified-Since', 'Accept-Language'}
+
+# Response headers passed back per item
+BATCH_RESPONSE_HEADERS = ['ETag', 'Last-Modified', 'Cache-Control', 'Retry-After', 'X-Next-Cursor']
+
+def item_error(status, message):
+    return {'status': status, 'body': {'error': message}}
+
+def run_sub_request(item):
+    """Dispatch one sub-request through the app, inside the batch's app context"""
+    if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+        return item_error(400, 'Each request needs a path')
+
+    method = str(item.get('method', 'GET')).upper()
+    path = item['path']
+    if method not in BATCH_METHODS:
+        return item_error(405, f'Method not allowed in a batch: {method}')
+    if not path.startswith('/api/') or path.split('?', 1)[0].rstrip('/') == request.path.rstrip('/'):
+        return item_error(400, f'Path not allowed in a batch: {path}')
+
+    headers = {
+        name: value for name, value in (item.get('headers') or {}).items()
+        if name.title() in BATCH_REQUEST_HEADERS
+    }
+    # Same caller as the batch: its token, and its address for rate limits
+    for name in ('Authorization', 'X-Forwarded-For'):
+        if name in request.headers:
+            headers[name] = request.headers[name]
+
+    environ = EnvironBuilder(
+        path=path,
+        method=method,
+        headers=headers,
+        base_url=request.host_url,
+        environ_overrides={'REMOTE_ADDR': request.remote_addr}
+    ).get_environ()
+
+    # The sub-request shares this app context, so g (the decoded current
+    # user) and the database session's identity map carry over between items
+    with current_app.request_context(environ):
+        response = current_app.full_dispatch_request()
+
+    if response.is_streamed:
+        return item_error(400, 'Streaming responses are not supported in a batch')
+
+    body = response.get_data(as_text=True) or None
+    if body is not None and response.is_json:
+        body = json.loads(body)
+    result = {'status': response.status_code, 'body': body}
+    passed_headers = {name: response.headers[name] for name in BATCH_RESPONSE_HEADERS if name in response.headers}
+    if passed_headers:
+        result['headers'] = passed_headers
+    return result
+
+@batch_bp.route('', methods=['POST'])
+@jwt_required()
+def run_batch():
+    """Run several GET requests in one round trip; returns one status/body per item, in order"""
+    data = request.get_json(silent=True)
+    items = data.get('requests') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'requests must be a non-empty list'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'A batch may contain at most {BATCH_MAX_ITEMS} requests'}), 413
+
+    responses = []
+    for item in items:
+        try:
+            responses.append(run_sub_request(item))
+        except Exception as e:
+            # Don't let a failed item's transaction break the ones after it
+            db.session.rollback()
+            logging.error(f"Error running batch item {item!r}: {str(e)}")
+            responses.append(item_error(500, 'Failed to run request'))
+
+    return jsonify({'responses': responses}), 200
@@ -1,126 +1,261 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import Booking, User, TranslatorProfile
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
+from models import Booking, User, TranslatorProfile, TranslatorEarning, TranslatorDailyEarning, Payment, Rating, RatingSummary, BookingSummary
 from extensions import db
+from exports import stream_export, EXPORT_FORMATS
+from conditional import make_etag, latest, not_modified, conditional_jsonify
+from idempotency import idempotent
+from user_cache import get_user_record
+from photos import photo_variant_urls
+import pricing
+from sqlalchemy import select, insert, and_, or_
+from sqlalchemy.orm import aliased
+from sqlalchemy.exc import IntegrityError
 import logging
-from datetime import datetime, date, time
+from datetime import datetime, date, time, timedelta
 from decimal import Decimal
 
 bookings_bp = Blueprint('bookings', __name__)
 
+# Upper bound on the number of bookings a single bulk request may create
+MAX_BULK_BOOKINGS = 31
+
+# Statuses that hold a translator's time slot
+ACTIVE_BOOKING_STATUSES = ['pending', 'confirmed']
+
+def booking_status_filter(status):
+    """Build the filter clause for a bookings list status ('upcoming', 'past', ...)"""
+    if status == 'upcoming':
+        # Upcoming bookings are those with status 'pending' or 'confirmed' and date >= today
+        return and_(
+            Booking.status.in_(['pending', 'confirmed']),
+            Booking.date >= date.today()
+        )
+    elif status == 'completed':
+        return Booking.status == 'completed'
+    elif status == 'cancelled':
+        return Booking.status == 'cancelled'
+    elif status == 'past':
+        # Past bookings are those with status 'completed' or 'cancelled' or date < today
+        return or_(
+            Booking.status.in_(['completed', 'cancelled']),
+            and_(Booking.status.in_(['pending', 'confirmed']), Booking.date < date.today())
+        )
+    elif status == 'pending':
+        # Add explicit filter for pending status
+        return Booking.status == 'pending'
+    return None
+
+def serialize_booking(booking):
+    """Serialize a booking (model instance or result row) for create/update responses"""
+    return {
+        'id': booking.id,
+        'traveler_id': booking.traveler_id,
+        'translator_id': booking.translator_id,
+        'date': booking.date.strftime('%Y-%m-%d'),
+        'time': booking.start_time.strftime('%H:%M'),
+        'duration_hours': booking.duration_hours,
+        'location': booking.location,
+        'notes': booking.notes,
+        'status': booking.status,
+        'amount': float(booking.total_amount),
+        'created_at': booking.created_at.isoformat(),
+        'updated_at': booking.updated_at.isoformat()
+    }
+
+def list_bookings(user, status=None):
+    """Bookings of a user (a UserRecord), newest first, formatted for the bookings list"""
+    user_id = user.id
+    
+    # Base query
+    query = Booking.query
+    
+    # Filter by user type
+    if user.is_traveler:
+        query = query.filter(Booking.traveler_id == user_id)
+    else:
+        query = query.filter(Booking.translator_id == user_id)
+    
+    # Apply status filter
+    status_filter = booking_status_filter(status)
+    if status_filter is not None:
+        query = query.filter(status_filter)
+    
+    # Order by date, newest first
+    query = query.order_by(Booking.date.desc(), Booking.start_time.desc())
+    
+    # Execute query
+    bookings = query.all()
+    
+    # Format response
+    response = []
+    for booking in bookings:
+        # Get user info based on user type
+        if user.is_traveler:
+            other_user = get_user_record(booking.translator_id)
+            translator = TranslatorProfile.query.filter_by(user_id=booking.translator_id).first()
+            photo_url = translator.photo_urls()['thumb'] if translator else ""
+        else:
+            other_user = get_user_record(booking.traveler_id)
+            photo_url = ""  # Travelers don't have photo URLs in this query
+        
+        # Calculate end time from start_time and duration
+        start_datetime = datetime.combine(booking.date, booking.start_time)
+        
+        booking_data = {
+            'id': booking.id,
+            'date': booking.date.strftime('%Y-%m-%d'),
+            'formatted_date': booking.date.strftime('%b %d'),
+            'time': booking.start_time.strftime('%H:%M'),
+            'formatted_time': f"{booking.start_time.strftime('%H:%M')} - {(datetime.combine(date.today(), booking.start_time).replace(hour=booking.start_time.hour + booking.duration_hours)).strftime('%H:%M')}",
+            'duration_hours': booking.duration_hours,
+            'location': booking.location,
+            'notes': booking.notes,
+            'status': booking.status,
+            'amount': float(booking.total_amount),
+            'created_at': booking.created_at.isoformat(),
+            'updated_at': booking.updated_at.isoformat()
+        }
+        
+        # Add other user info
+        if other_user:
+            booking_data.update({
+                'other_user_id': other_user.id,
+                'other_user_name': other_user.name,
+                'other_user_photo': photo_url
+            })
+        
+        response.append(booking_data)
+    
+    return response
+
 @bookings_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_user_bookings():
     """Get all bookings for the current user"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        # Can be 'upcoming', 'completed', 'cancelled', 'past'
+        status = request.args.get('status')
         
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        return jsonify(list_bookings(current_user, status)), 200
         
-        # Get query parameters
-        status = request.args.get('status')  # Can be 'upcoming', 'completed', 'cancelled', 'past'
+    except Exception as e:
+        logging.error(f"Error getting bookings: {str(e)}")
+        return jsonify({'error': 'Failed to get bookings'}), 500
+
+@bookings_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_bookings():
+    """Stream the full booking history of the current user as CSV or NDJSON"""
+    try:
+        user_id = int(get_jwt_identity())
+        user = current_user
         
-        # Base query
-        query = Booking.query
+        fmt = request.args.get('format', 'csv').lower()
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({'error': f'Unsupported format, use one of: {", ".join(EXPORT_FORMATS)}'}), 400
         
-        # Filter by user type
+        # The "other user" is the translator for travelers and the traveler for translators
+        other_user = aliased(User)
         if user.is_traveler:
-            query = query.filter(Booking.traveler_id == user_id)
+            own_column, other_column = Booking.traveler_id, Booking.translator_id
         else:
-            query = query.filter(Booking.translator_id == user_id)
-        
-        # Apply status filter
-        if status == 'upcoming':
-            # Upcoming bookings are those with status 'pending' or 'confirmed' and date >= today
-            query = query.filter(
-                Booking.status.in_(['pending', 'confirmed']),
-                Booking.date >= date.today()
-            )
-        elif status == 'completed':
-            query = query.filter(Booking.status == 'completed')
-        elif status == 'cancelled':
-            query = query.filter(Booking.status == 'cancelled')
-        elif status == 'past':
-            # Past bookings are those with status 'completed' or 'cancelled' or date < today
-            query = query.filter(
-                (Booking.status.in_(['completed', 'cancelled'])) |
-                ((Booking.status.in_(['pending', 'confirmed'])) & (Booking.date < date.today()))
-            )
-        elif status == 'pending':
-            # Add explicit filter for pending status
-            query = query.filter(Booking.status == 'pending')
+            own_column, other_column = Booking.translator_id, Booking.traveler_id
+        
+        statement = select(
+            Booking.id,
+            Booking.date,
+            Booking.start_time,
+            Booking.duration_hours,
+            Booking.location,
+            Booking.status,
+            Booking.total_amount,
+            other_column,
+            other_user.name,
+            Booking.notes,
+            Booking.created_at,
+            Booking.updated_at
+        ).outerjoin(
+            other_user, other_user.id == other_column
+        ).where(own_column == user_id)
+        
+        # Optional filters
+        status_filter = booking_status_filter(request.args.get('status'))
+        if status_filter is not None:
+            statement = statement.where(status_filter)
+        if request.args.get('from'):
+            statement = statement.where(Booking.date >= datetime.strptime(request.args['from'], '%Y-%m-%d').date())
+        if request.args.get('to'):
+            statement = statement.where(Booking.date <= datetime.strptime(request.args['to'], '%Y-%m-%d').date())
+        
+        statement = statement.order_by(Booking.date.desc(), Booking.start_time.desc(), Booking.id.desc())
+        
+        columns = [
+            'id', 'date', 'start_time', 'duration_hours', 'location', 'status', 'amount',
+            'other_user_id', 'other_user_name', 'notes', 'created_at', 'updated_at'
+        ]
+        return stream_export(statement, columns, fmt, f'bookings-{user_id}')
         
-        # Order by date, newest first
-        query = query.order_by(Booking.date.desc(), Booking.start_time.desc())
+    except ValueError as e:
+        return jsonify({'error': f'Invalid input: {str(e)}'}), 400
+    except Exception as e:
+        logging.error(f"Error exporting bookings: {str(e)}")
+        return jsonify({'error': 'Failed to export bookings'}), 500
+
+def quote_response(booking_quote):
+    """A quote as returned to clients, with a token that locks its price"""
+    return dict(
+        booking_quote.as_dict(),
+        quote_token=pricing.quote_token(booking_quote),
+        expires_at=pricing.quote_expires_at().isoformat()
+    )
+
+@bookings_bp.route('/quote', methods=['GET'])
+@jwt_required()
+def get_quote():
+    """Price a booking server-side (?translator_id=&date=&start_time=&duration_hours=)"""
+    try:
+        try:
+            translator_id = int(request.args['translator_id'])
+            booking_date = datetime.strptime(request.args['date'], '%Y-%m-%d').date()
+            hours, minutes = map(int, request.args['start_time'].split(':'))
+            start_time = time(hour=hours, minute=minutes)
+            duration_hours = int(request.args['duration_hours'])
+        except (ValueError, KeyError) as e:
+            return jsonify({'error': f'Invalid input: {str(e)}'}), 400
         
-        # Execute query
-        bookings = query.all()
+        if duration_hours <= 0:
+            return jsonify({'error': 'Duration must be positive'}), 400
         
-        # Format response
-        response = []
-        for booking in bookings:
-            # Get user info based on user type
-            if user.is_traveler:
-                other_user = User.query.get(booking.translator_id)
-                translator = TranslatorProfile.query.filter_by(user_id=booking.translator_id).first()
-                photo_url = translator.photo_url if translator else ""
-            else:
-                other_user = User.query.get(booking.traveler_id)
-                photo_url = ""  # Travelers don't have photo URLs in this query
-            
-            # Calculate end time from start_time and duration
-            start_datetime = datetime.combine(booking.date, booking.start_time)
-            
-            booking_data = {
-                'id': booking.id,
-                'date': booking.date.strftime('%Y-%m-%d'),
-                'formatted_date': booking.date.strftime('%b %d'),
-                'time': booking.start_time.strftime('%H:%M'),
-                'formatted_time': f"{booking.start_time.strftime('%H:%M')} - {(datetime.combine(date.today(), booking.start_time).replace(hour=booking.start_time.hour + booking.duration_hours)).strftime('%H:%M')}",
-                'duration_hours': booking.duration_hours,
-                'location': booking.location,
-                'notes': booking.notes,
-                'status': booking.status,
-                'amount': float(booking.total_amount),
-                'created_at': booking.created_at.isoformat(),
-                'updated_at': booking.updated_at.isoformat()
-            }
-            
-            # Add other user info
-            if other_user:
-                booking_data.update({
-                    'other_user_id': other_user.id,
-                    'other_user_name': other_user.name,
-                    'other_user_photo': photo_url
-                })
-            
-            response.append(booking_data)
+        # Served from the rate cache; a profile update in this worker drops the entry
+        rate = pricing.rate_cache.get(translator_id)
+        if rate is None:
+            return jsonify({'error': 'Translator not found'}), 404
+        if not rate.is_available:
+            return jsonify({'error': 'Translator is not available'}), 400
         
-        return jsonify(response), 200
+        booking_quote = pricing.quote(translator_id, rate.hourly_rate, booking_date, start_time, duration_hours)
+        return jsonify(quote_response(booking_quote)), 200
         
     except Exception as e:
-        logging.error(f"Error getting bookings: {str(e)}")
-        return jsonify({'error': 'Failed to get bookings'}), 500
+        logging.error(f"Error quoting booking: {str(e)}")
+        return jsonify({'error': 'Failed to quote booking'}), 500
 
 @bookings_bp.route('/', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_booking():
     """Create a new booking"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        user_id = int(get_jwt_identity())
+        user = current_user
         
         # Only travelers can create bookings
         if not user.is_traveler:
             return jsonify({'error': 'Only travelers can create bookings'}), 403
         
         data = request.get_json()
-        required_fields = ['translator_id', 'date', 'start_time', 'duration_hours', 'location', 'total_amount']
+        required_fields = ['translator_id', 'date', 'start_time', 'duration_hours', 'location']
         
         # Check required fields
         missing_fields = [field for field in required_fields if field not in data]
@@ -133,7 +268,6 @@ def create_booking():
             booking_date = datetime.strptime(data['date'], '%Y-%m-%d').date()
             start_time_str = data['start_time']
             duration_hours = int(data['duration_hours'])
-            total_amount = Decimal(str(data['total_amount']))
             
             # Parse time (format should be HH:MM)
             hours, minutes = map(int, start_time_str.split(':'))
@@ -157,9 +291,21 @@ def create_booking():
             if duration_hours <= 0:
                 return jsonify({'error': 'Duration must be positive'}), 400
             
-            # Check if amount is positive
-            if total_amount <= 0:
-                return jsonify({'error': 'Amount must be positive'}), 400
+            # Price the booking server-side from the profile loaded above. A
+            # quote_token from GET /quote keeps the price it was issued with.
+            rate = pricing.rate_from_profile(translator_profile)
+            booking_quote = pricing.quote(translator_id, rate.hourly_rate, booking_date, start_time, duration_hours)
+            if data.get('quote_token'):
+                try:
+                    booking_quote = pricing.quote_from_token(
+                        data['quote_token'], translator_id, booking_date, start_time, duration_hours
+                    )
+                except pricing.QuoteError as e:
+                    return jsonify({'error': str(e), 'quote': quote_response(booking_quote)}), 409
+            
+            # A total from the client only confirms what it showed the traveler
+            if 'total_amount' in data and Decimal(str(data['total_amount'])) != booking_quote.total:
+                return jsonify({'error': 'Price has changed', 'quote': quote_response(booking_quote)}), 409
             
             # Create booking
             booking = Booking(
@@ -169,27 +315,15 @@ def create_booking():
                 start_time=start_time,
                 duration_hours=duration_hours,
                 location=data['location'],
-                total_amount=total_amount,
-                notes=data.get('notes')
+                total_amount=booking_quote.total,
+                notes=data.get('notes'),
+                hourly_rate=booking_quote.hourly_rate
             )
             
             db.session.add(booking)
             db.session.commit()
             
-            return jsonify({
-                'id': booking.id,
-                'traveler_id': booking.traveler_id,
-                'translator_id': booking.translator_id,
-                'date': booking.date.strftime('%Y-%m-%d'),
-                'time': booking.start_time.strftime('%H:%M'),
-                'duration_hours': booking.duration_hours,
-                'location': booking.location,
-                'notes': booking.notes,
-                'status': booking.status,
-                'amount': float(booking.total_amount),
-                'created_at': booking.created_at.isoformat(),
-                'updated_at': booking.updated_at.isoformat()
-            }), 201
+            return jsonify(serialize_booking(booking)), 201
             
         except ValueError as e:
             return jsonify({'error': f'Invalid input: {str(e)}'}), 400
@@ -199,6 +333,208 @@ def create_booking():
         logging.error(f"Error creating booking: {str(e)}")
         return jsonify({'error': 'Failed to create booking'}), 500
 
+def expand_recurrence(rule):
+    """Expand a recurrence rule into a list of dates.
+
+    The rule has a start_date, an optional interval_days (default 1), either a
+    count or an until date, and an optional list of weekdays (0 = Monday) to
+    keep. Expansion stops after MAX_BULK_BOOKINGS + 1 dates so an unbounded
+    rule is rejected by the caller instead of being materialized.
+    """
+    start_date = datetime.strptime(rule['start_date'], '%Y-%m-%d').date()
+    interval = int(rule.get('interval_days', 1))
+    if interval <= 0:
+        raise ValueError('interval_days must be positive')
+    
+    count = int(rule['count']) if 'count' in rule else None
+    until = datetime.strptime(rule['until'], '%Y-%m-%d').date() if 'until' in rule else None
+    if count is None and until is None:
+        raise ValueError('Recurrence needs either count or until')
+    
+    weekdays = set(int(day) for day in rule.get('weekdays', range(7)))
+    
+    dates = []
+    current = start_date
+    while len(dates) <= MAX_BULK_BOOKINGS:
+        if until is not None and current > until:
+            break
+        if current.weekday() in weekdays:
+            dates.append(current)
+            if count is not None and len(dates) >= count:
+                break
+        current += timedelta(days=interval)
+    return dates
+
+def _slots_overlap(start_a, hours_a, start_b, hours_b):
+    """Check whether two same-day time slots overlap"""
+    a = start_a.hour * 60 + start_a.minute
+    b = start_b.hour * 60 + start_b.minute
+    return a < b + hours_b * 60 and b < a + hours_a * 60
+
+@bookings_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+@idempotent
+def create_bulk_bookings():
+    """Create several bookings with the same translator in one transaction"""
+    try:
+        user_id = int(get_jwt_identity())
+        user = current_user
+        
+        # Only travelers can create bookings
+        if not user.is_traveler:
+            return jsonify({'error': 'Only travelers can create bookings'}), 403
+        
+        data = request.get_json()
+        required_fields = ['translator_id', 'start_time', 'duration_hours', 'location']
+        
+        # Check required fields
+        missing_fields = [field for field in required_fields if field not in data]
+        if missing_fields:
+            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+        
+        if ('dates' in data) == ('recurrence' in data):
+            return jsonify({'error': 'Provide either dates or recurrence'}), 400
+        
+        # Validate the fields shared by every booking
+        try:
+            translator_id = int(data['translator_id'])
+            duration_hours = int(data['duration_hours'])
+            total_amount = Decimal(str(data['total_amount'])) if 'total_amount' in data else None
+            hours, minutes = map(int, data['start_time'].split(':'))
+            start_time = time(hour=hours, minute=minutes)
+            
+            if 'dates' in data:
+                if not isinstance(data['dates'], list):
+                    return jsonify({'error': 'dates must be a list'}), 400
+                requested_dates = data['dates']
+            else:
+                requested_dates = [d.strftime('%Y-%m-%d') for d in expand_recurrence(data['recurrence'])]
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': f'Invalid input: {str(e)}'}), 400
+        
+        if not requested_dates:
+            return jsonify({'error': 'No booking dates requested'}), 400
+        
+        if len(requested_dates) > MAX_BULK_BOOKINGS:
+            return jsonify({'error': f'At most {MAX_BULK_BOOKINGS} bookings can be created at once'}), 400
+        
+        if duration_hours <= 0:
+            return jsonify({'error': 'Duration must be positive'}), 400
+        
+        # Check the translator once for the whole batch
+        translator = db.session.query(
+            User.is_traveler,
+            TranslatorProfile.user_id,
+            TranslatorProfile.is_available,
+            TranslatorProfile.hourly_rate
+        ).outerjoin(
+            TranslatorProfile, TranslatorProfile.user_id == User.id
+        ).filter(User.id == translator_id).first()
+        
+        if not translator or translator.is_traveler:
+            return jsonify({'error': 'Invalid translator'}), 400
+        
+        if not translator.is_available:
+            return jsonify({'error': 'Translator is not available'}), 400
+        rate = pricing.rate_from_profile(translator)
+        
+        # Validate each requested date, keeping the per-item outcome in request order
+        results = []
+        valid_dates = set()
+        for raw_date in requested_dates:
+            item = {'date': raw_date}
+            results.append(item)
+            try:
+                booking_date = datetime.strptime(str(raw_date), '%Y-%m-%d').date()
+            except ValueError:
+                item.update(status='invalid', error='Date must be in YYYY-MM-DD format')
+                continue
+            
+            # Weekend surcharges can make the price differ between dates
+            booking_quote = pricing.quote(translator_id, rate.hourly_rate, booking_date, start_time, duration_hours)
+            if booking_date < date.today():
+                item.update(status='invalid', error='Booking date must be in the future')
+            elif booking_date in valid_dates:
+                item.update(status='invalid', error='Duplicate date in request')
+            elif total_amount is not None and total_amount != booking_quote.total:
+                item.update(status='invalid', error='Price has changed', quote=booking_quote.as_dict())
+            else:
+                item['booking_date'] = booking_date
+                item['quote'] = booking_quote
+                valid_dates.add(booking_date)
+        
+        # Check every slot against the translator's existing bookings in one query
+        if valid_dates:
+            existing = db.session.query(
+                Booking.date,
+                Booking.start_time,
+                Booking.duration_hours
+            ).filter(
+                Booking.translator_id == translator_id,
+                Booking.date.in_(valid_dates),
+                Booking.status.in_(ACTIVE_BOOKING_STATUSES)
+            ).all()
+            
+            busy_dates = set(
+                row.date for row in existing
+                if _slots_overlap(row.start_time, row.duration_hours, start_time, duration_hours)
+            )
+            for item in results:
+                if item.get('booking_date') in busy_dates:
+                    del item['booking_date'], item['quote']
+                    item.update(status='conflict', error='Translator is already booked at this time')
+        
+        to_create = [item for item in results if 'booking_date' in item]
+        if not to_create:
+            return jsonify({'created': 0, 'failed': len(results), 'results': results}), 409
+        
+        # Insert all bookings with a single multi-row INSERT ... RETURNING
+        now = datetime.utcnow()
+        rows = db.session.execute(
+            insert(Booking).returning(
+                Booking.id, Booking.traveler_id, Booking.translator_id, Booking.date,
+                Booking.start_time, Booking.duration_hours, Booking.location, Booking.notes,
+                Booking.status, Booking.total_amount, Booking.created_at, Booking.updated_at,
+                sort_by_parameter_order=True
+            ),
+            [{
+                'traveler_id': user_id,
+                'translator_id': translator_id,
+                'status': 'pending',
+                'date': item['booking_date'],
+                'start_time': start_time,
+                'duration_hours': duration_hours,
+                'location': data['location'],
+                'notes': data.get('notes'),
+                'total_amount': item['quote'].total,
+                'hourly_rate': rate.hourly_rate,
+                'created_at': now,
+                'updated_at': now
+            } for item in to_create]
+        ).all()
+        
+        # Core inserts bypass the flush listener, so update the earnings rollup and booking count here
+        TranslatorDailyEarning.apply_deltas(db.session.connection(), {
+            (translator_id, row.date, row.status): [row.total_amount, 1] for row in rows
+        })
+        BookingSummary.apply_deltas(db.session.connection(), {translator_id: [len(rows), now]})
+        db.session.commit()
+        
+        for item, row in zip(to_create, rows):
+            del item['booking_date'], item['quote']
+            item.update(status='created', booking=serialize_booking(row))
+        
+        return jsonify({
+            'created': len(rows),
+            'failed': len(results) - len(rows),
+            'results': results
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error creating bulk bookings: {str(e)}")
+        return jsonify({'error': 'Failed to create bookings'}), 500
+
 @bookings_bp.route('/<int:booking_id>', methods=['PUT'])
 @jwt_required()
 def update_booking(booking_id):
@@ -214,10 +550,7 @@ def update_booking(booking_id):
             logging.error(f"Failed to convert user_id {user_id} to integer")
             return jsonify({'error': 'Invalid user ID'}), 400
         
-        user = User.query.get(user_id)
-        if not user:
-            logging.error(f"User {user_id} not found")
-            return jsonify({'error': 'User not found'}), 404
+        user = current_user
         
         # Get booking with detailed error checking
         booking = Booking.query.get(booking_id)
@@ -272,6 +605,9 @@ def update_booking(booking_id):
             booking.status = 'completed'
             logging.info(f"Booking {booking_id} marked as completed by user {user_id}")
             
+            # Credit the translator's ledger in the same transaction
+            TranslatorEarning.record_for_booking(booking)
+            
         elif action == 'reschedule':
             # Only pending or confirmed bookings can be rescheduled
             if booking.status not in ['pending', 'confirmed']:
@@ -300,6 +636,24 @@ def update_booking(booking_id):
                 booking.location = data['location']
                 logging.info(f"Updated booking location to {booking.location}")
             
+            # Re-price a changed slot at the rate the booking was made at
+            if any(field in data for field in ('date', 'start_time', 'duration_hours')):
+                if booking.hourly_rate is None:
+                    rate = pricing.rate_cache.get(booking.translator_id)
+                    if rate is None:
+                        return jsonify({'error': 'Translator not found'}), 400
+                    booking.hourly_rate = rate.hourly_rate
+                total_amount = pricing.quote_booking(booking).total
+                if total_amount != booking.total_amount:
+                    paid = db.session.query(Payment.id).filter(
+                        Payment.booking_id == booking.id, Payment.status == 'completed'
+                    ).first()
+                    if paid:
+                        db.session.rollback()
+                        return jsonify({'error': 'Booking is already paid; cancel it and book again to change its price'}), 409
+                    booking.total_amount = total_amount
+                    logging.info(f"Re-priced booking {booking_id} to {total_amount}")
+            
         else:
             logging.error(f"Invalid action: {action}")
             return jsonify({'error': 'Invalid action'}), 400
@@ -313,20 +667,7 @@ def update_booking(booking_id):
             db.session.commit()
             logging.info(f"Booking {booking_id} successfully updated")
             
-            return jsonify({
-                'id': booking.id,
-                'traveler_id': booking.traveler_id,
-                'translator_id': booking.translator_id,
-                'date': booking.date.strftime('%Y-%m-%d'),
-                'time': booking.start_time.strftime('%H:%M'),
-                'duration_hours': booking.duration_hours,
-                'location': booking.location,
-                'notes': booking.notes,
-                'status': booking.status,
-                'amount': float(booking.total_amount),
-                'created_at': booking.created_at.isoformat(),
-                'updated_at': booking.updated_at.isoformat()
-            }), 200
+            return jsonify(serialize_booking(booking)), 200
             
         except Exception as e:
             db.session.rollback()
@@ -341,16 +682,60 @@ def update_booking(booking_id):
         logging.error(f"Error updating booking: {str(e)}")
         return jsonify({'error': 'Failed to update booking: ' + str(e)}), 500
 
+@bookings_bp.route('/<int:booking_id>/rating', methods=['POST'])
+@jwt_required()
+def rate_booking(booking_id):
+    """Rate and review the translator of a completed booking (once per booking)"""
+    try:
+        user_id = int(get_jwt_identity())
+        data = request.get_json() or {}
+        
+        rating = data.get('rating')
+        # A JSON integer only: not true/false, 4.0 or "4"
+        if not isinstance(rating, int) or isinstance(rating, bool) or not 1 <= rating <= 5:
+            return jsonify({'error': 'rating must be a whole number from 1 to 5'}), 400
+        review = data.get('review')
+        if review is not None and not isinstance(review, str):
+            return jsonify({'error': 'review must be a string'}), 400
+        review = (review or '').strip() or None
+        
+        booking = db.session.query(
+            Booking.traveler_id, Booking.translator_id, Booking.status
+        ).filter(Booking.id == booking_id).first()
+        if not booking:
+            return jsonify({'error': 'Booking not found'}), 404
+        if booking.traveler_id != user_id:
+            return jsonify({'error': 'Only the traveler of a booking can rate it'}), 403
+        if booking.status != 'completed':
+            return jsonify({'error': 'Only completed bookings can be rated'}), 400
+        
+        # The review and the reviewee's running totals commit together;
+        # the unique (booking, reviewer, reviewee) constraint rejects a second rating
+        rated = Rating(user_id, booking.translator_id, booking_id, rating, review)
+        db.session.add(rated)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'Booking has already been rated'}), 409
+        RatingSummary.record(booking.translator_id, rating, rated.created_at)
+        db.session.commit()
+        
+        return jsonify(rated.as_dict(current_user.name)), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error rating booking: {str(e)}")
+        return jsonify({'error': 'Failed to rate booking'}), 500
+
 @bookings_bp.route('/<int:booking_id>', methods=['GET'])
 @jwt_required()
 def get_booking(booking_id):
     """Get a specific booking by ID"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        # JWT identities are strings, booking foreign keys are integers
+        user_id = int(get_jwt_identity())
+        user = current_user
         
         # Get booking
         booking = Booking.query.get(booking_id)
@@ -363,15 +748,38 @@ def get_booking(booking_id):
         elif not user.is_traveler and booking.translator_id != user_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
-        # Get other user info
+        # Get other user info, together with the timestamps the response depends on
+        other_user_id = booking.translator_id if user.is_traveler else booking.traveler_id
+        other_user = db.session.query(
+            User.id,
+            User.name,
+            User.updated_at,
+            TranslatorProfile.photo_url,
+            TranslatorProfile.photo_key,
+            TranslatorProfile.updated_at.label('profile_updated_at')
+        ).outerjoin(
+            TranslatorProfile, TranslatorProfile.user_id == User.id
+        ).filter(User.id == other_user_id).first()
+        
         if user.is_traveler:
-            other_user = User.query.get(booking.translator_id)
-            translator = TranslatorProfile.query.filter_by(user_id=booking.translator_id).first()
-            photo_url = translator.photo_url if translator else ""
+            photo_url = photo_variant_urls(other_user.photo_key, other_user.photo_url)['thumb'] if other_user else ""
         else:
-            other_user = User.query.get(booking.traveler_id)
             photo_url = ""  # Travelers don't have photo URLs in this context
         
+        # Answer revalidation requests before formatting the booking
+        etag = make_etag(
+            'booking', booking.id, booking.updated_at, user_id,
+            other_user.updated_at if other_user else None, photo_url
+        )
+        last_modified = latest(
+            booking.updated_at,
+            other_user.updated_at if other_user else None,
+            other_user.profile_updated_at if other_user else None
+        )
+        cached = not_modified(etag, last_modified)
+        if cached:
+            return cached
+        
         # Format response
         response = {
             'id': booking.id,
@@ -396,7 +804,7 @@ def get_booking(booking_id):
                 'other_user_photo': photo_url
             })
         
-        return jsonify(response), 200
+        return conditional_jsonify(response, etag, last_modified)
         
     except Exception as e:
         logging.error(f"Error getting booking: {str(e)}")
@@ -0,0 +1,112 @@
+from flask import Blueprint, jsonify, copy_current_request_context
+from flask_jwt_extended import jwt_required, get_current_user
+from concurrent.futures import ThreadPoolExecutor
+from routes.users import load_user_and_profile, serialize_me
+from routes.bookings import list_bookings
+from routes.chat import get_user_conversations
+from routes.payments import earnings_summary
+from process_pool import in_green_thread
+import logging
+import os
+import threading
+
+try:
+    from eventlet import GreenPool
+except ImportError:
+    GreenPool = None
+
+bootstrap_bp = Blueprint('bootstrap', __name__)
+
+# Green threads (under eventlet) or threads shared by all bootstrap requests of
+# a worker, so at most this many extra database connections are in use at
+# once. 0 builds the sections in turn.
+BOOTSTRAP_WORKERS = int(os.environ.get('BOOTSTRAP_WORKERS', 4))
+
+_executor = None
+_green_pool = None
+_executor_lock = threading.Lock()
+
+def _pool():
+    # Started on first use so forked workers do not inherit its threads
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=BOOTSTRAP_WORKERS, thread_name_prefix='bootstrap')
+        return _executor
+
+def _green():
+    global _green_pool
+    with _executor_lock:
+        if _green_pool is None:
+            _green_pool = GreenPool(BOOTSTRAP_WORKERS)
+        return _green_pool
+
+def build_sections(sections):
+    """Run read-only section builders; returns (results, errors) keyed by section name.
+
+    With BOOTSTRAP_WORKERS > 0 the builders run concurrently, each in a copy
+    of the request context with its own database session (sessions are
+    not thread-safe). Under eventlet they run as green threads and are
+    waited on directly; real threads would be green too after monkey
+    patching, and must not be waited on from outside the hub. A failing
+    section is reported in errors instead of failing the others.
+    """
+    results, errors = {}, {}
+
+    def record(name, run):
+        try:
+            results[name] = run()
+        except Exception as e:
+            logging.error(f"Error building bootstrap section {name}: {str(e)}")
+            errors[name] = f'Failed to load {name}'
+
+    if BOOTSTRAP_WORKERS <= 0:
+        for name, build in sections.items():
+            record(name, build)
+        return results, errors
+
+    if GreenPool is not None and in_green_thread():
+        pool = _green()
+        green_threads = {name: pool.spawn(copy_current_request_context(build)) for name, build in sections.items()}
+        for name, green_thread in green_threads.items():
+            record(name, green_thread.wait)
+        return results, errors
+
+    futures = {name: _pool().submit(copy_current_request_context(build)) for name, build in sections.items()}
+    for name, future in futures.items():
+        record(name, future.result)
+    return results, errors
+
+@bootstrap_bp.route('', methods=['GET'])
+@jwt_required()
+def get_bootstrap():
+    """Everything the app's first screen needs, in one request.
+
+    Equivalent to GET /api/users/me, /api/bookings/?status=upcoming,
+    /api/chat/conversations and (translators) /api/payments/earnings.
+    The token is decoded and the user resolved once for all of them.
+    """
+    # The record itself, not the proxy: the sections run on other threads
+    user = get_current_user()
+
+    sections = {
+        'me': lambda: serialize_me(*load_user_and_profile(user.id)),
+        'upcoming_bookings': lambda: list_bookings(user, 'upcoming'),
+        'conversations': lambda: get_user_conversations(user.id)
+    }
+    if not user.is_traveler:
+        sections['earnings'] = lambda: earnings_summary(user.id)
+
+    results, errors = build_sections(sections)
+    if 'me' not in results:
+        return jsonify({'error': 'Failed to load user'}), 500
+
+    response = {
+        'user': results['me'],
+        'upcoming_bookings': results.get('upcoming_bookings'),
+        'conversations': results.get('conversations'),
+        'earnings': results.get('earnings')
+    }
+    if errors:
+        response['errors'] = errors
+    return jsonify(response), 200
@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_socketio import emit, join_room, leave_room
 from models import User, ChatMessage, Booking
 from extensions import db, socketio
+from ratelimit import rate_limit, by_user
 import logging
 from sqlalchemy import or_, and_, desc
 from datetime import datetime
@@ -83,14 +84,11 @@ def get_user_conversations(user_id):
             # Check if the partner is a translator or traveler
             is_translator = not partner.is_traveler
             
-            # Get the appropriate profile photo
+            # Get the appropriate profile photo (thumbnail, for the avatar)
             photo_url = None
-            if is_translator:
-                if partner.translator_profile and partner.translator_profile.photo_url:
-                    photo_url = partner.translator_profile.photo_url
-            else:
-                if partner.traveler_profile and partner.traveler_profile.photo_url:
-                    photo_url = partner.traveler_profile.photo_url
+            profile = partner.translator_profile if is_translator else partner.traveler_profile
+            if profile and (profile.photo_key or profile.photo_url):
+                photo_url = profile.photo_urls()['thumb']
             
             conversations.append({
                 'id': str(partner.id),
@@ -165,6 +163,7 @@ def get_messages(conversation_id):
 
 @chat_bp.route('/conversations/<conversation_id>/messages', methods=['POST'])
 @jwt_required()
+@rate_limit('chat-send-user', by_user)
 def send_message(conversation_id):
     """Send a message to a conversation"""
     user_id = get_jwt_identity()
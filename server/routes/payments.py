@@ -1,25 +1,37 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import User, Booking, Payment, db
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
+from models import User, Booking, Payment, WebhookEvent, TranslatorEarning, TranslatorPayout, TranslatorBalance, TranslatorDailyEarning, db
+from exports import stream_export, EXPORT_FORMATS
+from pagination import encode_cursor, decode_cursor, page_limit
+from idempotency import idempotent
 from decimal import Decimal
 import logging
 import uuid
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, select, update, tuple_, union_all, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from payment_provider import provider, ProviderUnavailable, stripe_publishable_key
+from webhooks import process_webhook_batch, WEBHOOK_BATCH_SIZE
+from reconciliation import reconcile_pending_payments, RECONCILE_STALE_MINUTES, RECONCILE_CHUNK_SIZE
+import pricing
+import click
+import json
 import stripe
 import os
+import time
 
 payments_bp = Blueprint('payments', __name__, url_prefix='/api/payments')
 
-# Setup Stripe with the API key from environment variables
-stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
-stripe_publishable_key = os.environ.get('STRIPE_PUBLISHABLE_KEY')
-
-# In-memory storage for mock payouts (replace with database in production)
-payouts_store = {}
+def provider_unavailable_response(error):
+    """Tell the client to retry when the payment provider is down or saturated"""
+    logging.warning(f"Payment provider unavailable: {str(error)}")
+    response = jsonify({'error': 'Payment provider is temporarily unavailable, please retry'})
+    response.headers['Retry-After'] = str(error.retry_after or 1)
+    return response, 503
 
 @payments_bp.route('/initiate', methods=['POST'])
 @jwt_required()
+@idempotent
 def initiate_payment():
     """Initiate a payment for a booking using Stripe"""
     try:
@@ -52,27 +64,44 @@ def initiate_payment():
         if existing_payment and existing_payment.status in ['completed', 'pending']:
             return jsonify({'error': 'Payment already exists for this booking'}), 400
         
+        # The amount was priced on the server when the booking was made or
+        # rescheduled, so it is charged as stored; later fee or rate changes
+        # do not apply to it. Bookings made before server-side pricing are
+        # only compared with a current quote, to flag them for review.
+        if booking.hourly_rate is None:
+            rate = pricing.rate_cache.get(booking.translator_id)
+            current_total = pricing.quote_booking(booking, rate.hourly_rate).total if rate else None
+            if current_total != booking.total_amount:
+                logging.warning(f"Charging unpriced booking {booking_id} {booking.total_amount}; its current quote is {current_total}")
+        
         # Calculate amount in cents for Stripe (Stripe uses smallest currency unit)
-        amount_cents = int(float(booking.total_amount) * 100)
+        amount = booking.total_amount
+        amount_cents = int((amount * 100).to_integral_value())
+        traveler_id = booking.traveler_id
+        translator_id = booking.translator_id
+        
+        # End the read transaction so no DB connection is held across the network call
+        db.session.rollback()
         
         # Create a payment intent with Stripe
         try:
-            payment_intent = stripe.PaymentIntent.create(
+            payment_intent = provider.create_payment_intent(
                 amount=amount_cents,
                 currency="eur",
                 payment_method_types=["card"],
                 metadata={
                     "booking_id": booking_id,
-                    "traveler_id": user_id,
-                    "translator_id": booking.translator_id
+                    "traveler_id": traveler_id,
+                    "translator_id": translator_id
                 }
             )
             
             # Create a new payment record in the database
             payment = Payment(
                 booking_id=booking_id,
+                traveler_id=traveler_id,
                 payment_id=str(uuid.uuid4()),  # Generate unique ID
-                amount=booking.total_amount,
+                amount=amount,
                 currency="EUR",
                 status="pending",
                 payment_method=payment_method,
@@ -92,6 +121,8 @@ def initiate_payment():
                 'publishable_key': stripe_publishable_key
             }), 200
             
+        except ProviderUnavailable as e:
+            return provider_unavailable_response(e)
         except stripe.error.StripeError as e:
             logging.error(f"Stripe error: {str(e)}")
             return jsonify({'error': str(e)}), 400
@@ -134,9 +165,12 @@ def verify_payment():
         if booking.traveler_id != int(user_id):
             return jsonify({'error': 'Unauthorized to verify this payment'}), 403
         
+        # End the read transaction so no DB connection is held across the network call
+        db.session.rollback()
+        
         # Retrieve payment intent from Stripe to check status
         try:
-            payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            payment_intent = provider.retrieve_payment_intent(payment_intent_id)
             
             # Update payment status based on Stripe status
             if payment_intent.status == 'succeeded':
@@ -163,6 +197,8 @@ def verify_payment():
                     'message': 'Payment has not completed yet'
                 }), 202
                 
+        except ProviderUnavailable as e:
+            return provider_unavailable_response(e)
         except stripe.error.StripeError as e:
             logging.error(f"Stripe error: {str(e)}")
             return jsonify({'error': str(e)}), 400
@@ -184,12 +220,10 @@ def stripe_webhook():
         # If endpoint secret is not set, log the event for debugging
         if not endpoint_secret:
             logging.warning("Webhook secret not set, skipping signature verification")
-            data = request.get_json()
-            event = data
         else:
             # Verify webhook signature
             try:
-                event = stripe.Webhook.construct_event(
+                stripe.Webhook.construct_event(
                     payload, sig_header, endpoint_secret
                 )
             except ValueError as e:
@@ -199,126 +233,155 @@ def stripe_webhook():
                 logging.error(f"Invalid signature: {str(e)}")
                 return jsonify({'error': 'Invalid signature'}), 400
         
-        # Handle the event
-        if event['type'] == 'payment_intent.succeeded':
-            payment_intent = event['data']['object']
-            
-            # Update payment status in the database
-            payment = Payment.query.filter_by(payment_intent_id=payment_intent['id']).first()
-            
-            if payment:
-                payment.status = 'completed'
-                payment.transaction_id = payment_intent['id']
-                
-                # Update booking status
-                booking = Booking.query.get(payment.booking_id)
-                if booking and booking.status == 'pending':
-                    booking.status = 'confirmed'
-                
-                db.session.commit()
-                
-                logging.info(f"Payment {payment.payment_id} completed via webhook")
+        # Persist the raw event to the inbox and acknowledge; a worker processes it.
+        # Redeliveries of an event id already in the inbox are dropped here.
+        event = json.loads(payload)
+        if not isinstance(event, dict) or not event.get('id') or not event.get('type'):
+            return jsonify({'error': 'Invalid payload'}), 400
+        
+        if not WebhookEvent.store(event['id'], event['type'], event):
+            logging.info(f"Duplicate webhook event {event['id']} ignored")
+        db.session.commit()
         
         # Return a success response
         return jsonify({'status': 'success'}), 200
         
+    except ValueError as e:
+        logging.error(f"Invalid payload: {str(e)}")
+        return jsonify({'error': 'Invalid payload'}), 400
     except Exception as e:
+        db.session.rollback()
         logging.error(f"Error handling webhook: {str(e)}")
         return jsonify({'error': 'Webhook processing failed'}), 500
 
 @payments_bp.route('/history', methods=['GET'])
 @jwt_required()
 def get_payment_history():
-    """Get payment history for user"""
+    """Get payment history for user, newest first, one page at a time"""
     try:
-        user_id = get_jwt_identity()
+        user_id = int(get_jwt_identity())
+        limit = page_limit(request.args)
+        
+        # Single query over payments, joined to their booking and translator
+        query = db.session.query(
+            Payment,
+            Booking.date,
+            Booking.translator_id,
+            User.name
+        ).join(
+            Booking, Booking.id == Payment.booking_id
+        ).outerjoin(
+            User, User.id == Booking.translator_id
+        ).filter(Payment.traveler_id == user_id)
+        
+        # Optional filters
+        status = request.args.get('status')
+        if status:
+            query = query.filter(Payment.status == status)
+        if request.args.get('from'):
+            query = query.filter(Payment.created_at >= datetime.strptime(request.args['from'], '%Y-%m-%d'))
+        if request.args.get('to'):
+            query = query.filter(Payment.created_at < datetime.strptime(request.args['to'], '%Y-%m-%d') + timedelta(days=1))
+        
+        # Keyset pagination on (created_at, id), served by idx_payments_traveler_created
+        cursor = request.args.get('cursor')
+        if cursor:
+            created_at, payment_id = decode_cursor(cursor)
+            query = query.filter(
+                tuple_(Payment.created_at, Payment.id) < (datetime.fromisoformat(created_at), int(payment_id))
+            )
         
-        # Get all bookings for this user (as traveler)
-        bookings = Booking.query.filter_by(traveler_id=user_id).all()
+        rows = query.order_by(Payment.created_at.desc(), Payment.id.desc()).limit(limit + 1).all()
         
-        # Get booking IDs
-        booking_ids = [booking.id for booking in bookings]
+        user_payments = []
+        for payment, booking_date, translator_id, translator_name in rows[:limit]:
+            payment_data = payment.as_dict()
+            payment_data.update({
+                'booking_date': booking_date.strftime('%Y-%m-%d'),
+                'translator_id': translator_id,
+                'translator_name': translator_name
+            })
+            user_payments.append(payment_data)
         
-        # Filter payments by booking IDs (in a real implementation, this would be a database query)
-        user_payments = [
-            payment.as_dict() for payment in payments_store.values()
-            if payment.booking_id in booking_ids
-        ]
+        response = jsonify(user_payments)
+        
+        # The body stays a plain list; the next page is advertised in a header
+        if len(rows) > limit:
+            last = rows[limit - 1][0]
+            response.headers['X-Next-Cursor'] = encode_cursor(last.created_at.isoformat(), last.id)
         
-        return jsonify(user_payments), 200
+        return response, 200
         
+    except ValueError as e:
+        logging.error(f"Invalid parameter in payment history: {str(e)}")
+        return jsonify({'error': 'Invalid parameters provided'}), 400
     except Exception as e:
         logging.error(f"Error getting payment history: {str(e)}")
         return jsonify({'error': 'Failed to retrieve payment history'}), 500
 
 # New endpoints for translator earnings
 
+def earnings_summary(user_id):
+    """Earnings totals, this week's daily earnings and the balance of a translator"""
+    # Get current date for filtering
+    current_date = datetime.utcnow().date()
+    start_of_week = current_date - timedelta(days=current_date.weekday())
+    end_of_week = start_of_week + timedelta(days=6)
+    
+    # All-time completed (earned) and confirmed (pending) totals from the daily rollup
+    totals = dict(db.session.query(
+        TranslatorDailyEarning.status,
+        func.sum(TranslatorDailyEarning.amount)
+    ).filter(
+        TranslatorDailyEarning.translator_id == user_id,
+        TranslatorDailyEarning.status.in_(['completed', 'confirmed'])
+    ).group_by(TranslatorDailyEarning.status).all())
+    
+    total_earnings = totals.get('completed') or Decimal('0')
+    pending_earnings = totals.get('confirmed') or Decimal('0')
+    
+    # Completed earnings for each day of this week
+    # In a real implementation, this would use actual completion dates 
+    # rather than booking dates
+    daily = dict(db.session.query(
+        TranslatorDailyEarning.day,
+        func.sum(TranslatorDailyEarning.amount)
+    ).filter(
+        TranslatorDailyEarning.translator_id == user_id,
+        TranslatorDailyEarning.status == 'completed',
+        TranslatorDailyEarning.day.between(start_of_week, end_of_week)
+    ).group_by(TranslatorDailyEarning.day).all())
+    
+    # [Monday, Tuesday, ..., Sunday]
+    weekly_earnings = [daily.get(start_of_week + timedelta(days=i)) or Decimal('0') for i in range(7)]
+    today_earnings = daily.get(current_date) or Decimal('0')
+    
+    # Balance and payouts come straight from the ledger's running totals
+    available_balance, total_payouts = TranslatorBalance.for_translator(user_id)
+    
+    return {
+        'today_earnings': float(today_earnings),
+        'total_earnings': float(total_earnings),
+        'pending_earnings': float(pending_earnings),
+        'available_balance': float(available_balance),
+        'total_payouts': float(total_payouts),
+        'weekly_earnings': [float(amount) for amount in weekly_earnings],
+        'weekly_labels': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    }
+
 @payments_bp.route('/earnings', methods=['GET'])
 @jwt_required()
 def get_earnings_summary():
     """Get earnings summary for a translator"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        user_id = int(get_jwt_identity())
+        user = current_user
         
         # Ensure user is a translator
         if user.is_traveler:
             return jsonify({'error': 'Only translators can access earnings'}), 403
         
-        # Get current date for filtering
-        current_date = datetime.utcnow().date()
-        start_of_week = current_date - timedelta(days=current_date.weekday())
-        end_of_week = start_of_week + timedelta(days=6)
-        
-        # Get all completed bookings for this translator
-        completed_bookings = Booking.query.filter(
-            Booking.translator_id == user_id,
-            Booking.status == 'completed'
-        ).all()
-        
-        # Get bookings completed today
-        today_bookings = [b for b in completed_bookings if b.date == current_date]
-        today_earnings = sum(float(b.total_amount) for b in today_bookings)
-        
-        # Get all time earnings
-        total_earnings = sum(float(b.total_amount) for b in completed_bookings)
-        
-        # Get pending payments (bookings that are confirmed but not completed)
-        pending_bookings = Booking.query.filter(
-            Booking.translator_id == user_id,
-            Booking.status == 'confirmed'
-        ).all()
-        pending_earnings = sum(float(b.total_amount) for b in pending_bookings)
-        
-        # Get weekly earnings breakdown
-        # In a real implementation, this would use actual completion dates 
-        # rather than booking dates
-        weekly_earnings = [0] * 7  # [Monday, Tuesday, ..., Sunday]
-        
-        for booking in completed_bookings:
-            booking_date = booking.date
-            # Check if the booking is from this week
-            if start_of_week <= booking_date <= end_of_week:
-                # Get day of week (0 = Monday, 6 = Sunday)
-                day_of_week = booking_date.weekday()
-                weekly_earnings[day_of_week] += float(booking.total_amount)
-        
-        # Get total payouts (in a real implementation, this would be from the database)
-        total_payouts = sum(float(payout.get('amount', 0)) for payout in payouts_store.values() 
-                          if payout.get('translator_id') == user_id)
-        
-        return jsonify({
-            'today_earnings': today_earnings,
-            'total_earnings': total_earnings,
-            'pending_earnings': pending_earnings,
-            'available_balance': total_earnings - total_payouts,
-            'total_payouts': total_payouts,
-            'weekly_earnings': weekly_earnings,
-            'weekly_labels': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-        }), 200
+        return jsonify(earnings_summary(user_id)), 200
         
     except Exception as e:
         logging.error(f"Error getting earnings summary: {str(e)}")
@@ -327,13 +390,10 @@ def get_earnings_summary():
 @payments_bp.route('/earnings/transactions', methods=['GET'])
 @jwt_required()
 def get_earnings_transactions():
-    """Get all earnings transactions for a translator"""
+    """Get a translator's earnings and payouts as one feed, newest first, one page at a time"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        user_id = int(get_jwt_identity())
+        user = current_user
         
         # Ensure user is a translator
         if user.is_traveler:
@@ -341,78 +401,167 @@ def get_earnings_transactions():
         
         # Get transaction type from query params (earnings, payouts, or all)
         transaction_type = request.args.get('type', 'all')
+        if transaction_type not in ('all', 'earnings', 'payouts'):
+            return jsonify({'error': 'type must be one of: all, earnings, payouts'}), 400
+        
+        limit = page_limit(request.args)
+        
+        # Keyset pagination on (occurred_at, type, id), newest first
+        cursor = request.args.get('cursor')
+        if cursor:
+            occurred_at, kind, row_id = decode_cursor(cursor)
+            cursor_key = (datetime.fromisoformat(occurred_at), kind, int(row_id))
+        
+        def feed_page(statement, occurred_at, kind, row_id):
+            # Each side is cut to one page on its own, so the union never
+            # holds more than two pages of rows
+            if cursor:
+                statement = statement.where(tuple_(occurred_at, kind, row_id) < cursor_key)
+            return statement.order_by(
+                occurred_at.desc(), row_id.desc()
+            ).limit(limit + 1)
         
-        # Get all completed bookings for this translator (earnings)
-        bookings = []
+        parts = []
+        
+        # Earnings: completed/confirmed bookings, timed by when the session starts
         if transaction_type in ['all', 'earnings']:
-            completed_bookings = Booking.query.filter(
-                Booking.translator_id == user_id,
-                Booking.status.in_(['completed', 'confirmed'])
-            ).order_by(Booking.date.desc()).all()
-            
-            # Convert bookings to transactions
-            for booking in completed_bookings:
-                # Get traveler info
-                traveler = User.query.get(booking.traveler_id)
-                traveler_name = traveler.name if traveler else "Unknown Traveler"
-                
-                # Format date
-                if booking.date == datetime.utcnow().date():
-                    date_str = f"Today, {booking.start_time.strftime('%H:%M')}"
-                elif booking.date == datetime.utcnow().date() - timedelta(days=1):
-                    date_str = f"Yesterday, {booking.start_time.strftime('%H:%M')}"
-                else:
-                    date_str = booking.date.strftime('%b %d, %Y')
-                
-                bookings.append({
-                    'id': str(booking.id),
-                    'travelerName': traveler_name,
-                    'date': date_str,
-                    'amount': float(booking.total_amount),
-                    'status': booking.status,
-                    'type': 'earning'
-                })
-        
-        # Get all payouts for this translator
-        payouts = []
+            starts_at = Booking.date + Booking.start_time
+            parts.append(feed_page(
+                select(
+                    literal('earning').label('type'),
+                    Booking.id.label('id'),
+                    starts_at.label('occurred_at'),
+                    func.coalesce(User.name, 'Unknown Traveler').label('counterparty'),
+                    Booking.total_amount.label('amount'),
+                    Booking.status.label('status')
+                ).select_from(Booking).outerjoin(
+                    User, User.id == Booking.traveler_id
+                ).where(
+                    Booking.translator_id == user_id,
+                    Booking.status.in_(['completed', 'confirmed'])
+                ),
+                starts_at, literal('earning'), Booking.id
+            ))
+        
+        # Payouts: withdrawals, timed by when they were requested
         if transaction_type in ['all', 'payouts']:
-            # In a real implementation, this would query a Payouts table
-            translator_payouts = [payout for payout in payouts_store.values() 
-                               if payout.get('translator_id') == user_id]
+            parts.append(feed_page(
+                select(
+                    literal('payout').label('type'),
+                    TranslatorPayout.id.label('id'),
+                    TranslatorPayout.created_at.label('occurred_at'),
+                    literal('Bank Transfer').label('counterparty'),
+                    TranslatorPayout.amount.label('amount'),
+                    TranslatorPayout.status.label('status')
+                ).where(TranslatorPayout.translator_id == user_id),
+                TranslatorPayout.created_at, literal('payout'), TranslatorPayout.id
+            ))
+        
+        feed = union_all(*parts).subquery() if len(parts) > 1 else parts[0].subquery()
+        rows = db.session.execute(
+            select(feed).order_by(
+                feed.c.occurred_at.desc(), feed.c.type.desc(), feed.c.id.desc()
+            ).limit(limit + 1)
+        ).all()
+        
+        # Only the returned page is formatted for display
+        today = datetime.utcnow().date()
+        transactions = []
+        for row in rows[:limit]:
+            if row.type == 'earning' and row.occurred_at.date() == today:
+                date_str = f"Today, {row.occurred_at.strftime('%H:%M')}"
+            elif row.type == 'earning' and row.occurred_at.date() == today - timedelta(days=1):
+                date_str = f"Yesterday, {row.occurred_at.strftime('%H:%M')}"
+            else:
+                date_str = row.occurred_at.strftime('%b %d, %Y')
             
-            for payout in translator_payouts:
-                date_str = datetime.fromisoformat(payout.get('created_at')).strftime('%b %d, %Y')
-                payouts.append({
-                    'id': payout.get('id'),
-                    'travelerName': 'Bank Transfer',  # Or the actual payment method
-                    'date': date_str,
-                    'amount': float(payout.get('amount')),
-                    'status': 'completed',
-                    'type': 'payout'
-                })
-        
-        # Combine and sort transactions by date (newest first)
-        # In a real implementation, you'd do this ordering in the database query
-        transactions = sorted(bookings + payouts, 
-                            key=lambda x: x['date'], 
-                            reverse=True)
-        
-        return jsonify(transactions), 200
+            transactions.append({
+                'id': str(row.id),
+                'travelerName': row.counterparty,
+                'date': date_str,
+                'timestamp': row.occurred_at.isoformat(),
+                'amount': float(row.amount),
+                'status': row.status,
+                'type': row.type
+            })
+        
+        response = jsonify(transactions)
+        
+        # The body stays a plain list; the next page is advertised in a header
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            response.headers['X-Next-Cursor'] = encode_cursor(last.occurred_at.isoformat(), last.type, last.id)
         
+        return response, 200
+        
+    except ValueError as e:
+        logging.error(f"Invalid parameter in earnings transactions: {str(e)}")
+        return jsonify({'error': 'Invalid parameters provided'}), 400
     except Exception as e:
         logging.error(f"Error getting earnings transactions: {str(e)}")
         return jsonify({'error': 'Failed to retrieve earnings transactions'}), 500
 
+@payments_bp.route('/earnings/export', methods=['GET'])
+@jwt_required()
+def export_earnings():
+    """Stream a translator's full earnings history as CSV or NDJSON"""
+    try:
+        user_id = int(get_jwt_identity())
+        user = current_user
+        
+        # Ensure user is a translator
+        if user.is_traveler:
+            return jsonify({'error': 'Only translators can access earnings'}), 403
+        
+        fmt = request.args.get('format', 'csv').lower()
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({'error': f'Unsupported format, use one of: {", ".join(EXPORT_FORMATS)}'}), 400
+        
+        statement = select(
+            Booking.id,
+            Booking.date,
+            Booking.start_time,
+            Booking.duration_hours,
+            Booking.status,
+            Booking.total_amount,
+            Booking.traveler_id,
+            User.name,
+            Booking.created_at,
+            Booking.updated_at
+        ).outerjoin(
+            User, User.id == Booking.traveler_id
+        ).where(
+            Booking.translator_id == user_id,
+            Booking.status.in_(['completed', 'confirmed'])
+        )
+        
+        if request.args.get('from'):
+            statement = statement.where(Booking.date >= datetime.strptime(request.args['from'], '%Y-%m-%d').date())
+        if request.args.get('to'):
+            statement = statement.where(Booking.date <= datetime.strptime(request.args['to'], '%Y-%m-%d').date())
+        
+        statement = statement.order_by(Booking.date.desc(), Booking.start_time.desc(), Booking.id.desc())
+        
+        columns = [
+            'booking_id', 'date', 'start_time', 'duration_hours', 'status', 'amount',
+            'traveler_id', 'traveler_name', 'created_at', 'updated_at'
+        ]
+        return stream_export(statement, columns, fmt, f'earnings-{user_id}')
+        
+    except ValueError as e:
+        return jsonify({'error': f'Invalid input: {str(e)}'}), 400
+    except Exception as e:
+        logging.error(f"Error exporting earnings: {str(e)}")
+        return jsonify({'error': 'Failed to export earnings'}), 500
+
 @payments_bp.route('/earnings/withdraw', methods=['POST'])
 @jwt_required()
+@idempotent
 def withdraw_earnings():
     """Process a withdrawal request for a translator"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        user_id = int(get_jwt_identity())
+        user = current_user
         
         # Ensure user is a translator
         if user.is_traveler:
@@ -426,53 +575,117 @@ def withdraw_earnings():
         
         # Get amount to withdraw
         try:
-            amount = float(data['amount'])
+            amount = Decimal(str(data['amount'])).quantize(Decimal('0.01'))
             if amount <= 0:
                 return jsonify({'error': 'Amount must be positive'}), 400
-        except ValueError:
+        except (ArithmeticError, ValueError):
             return jsonify({'error': 'Invalid amount'}), 400
         
         payment_method = data['payment_method']
         
-        # Calculate available balance
-        completed_bookings = Booking.query.filter(
-            Booking.translator_id == user_id,
-            Booking.status == 'completed'
-        ).all()
-        total_earnings = sum(float(b.total_amount) for b in completed_bookings)
-        
-        # Get total payouts
-        total_payouts = sum(float(payout.get('amount', 0)) for payout in payouts_store.values() 
-                          if payout.get('translator_id') == user_id)
-        
-        available_balance = total_earnings - total_payouts
-        
-        # Check if user has enough balance
-        if amount > available_balance:
+        # Debit the balance; the check and the debit are one atomic statement
+        new_balance = TranslatorBalance.debit(user_id, amount)
+        if new_balance is None:
+            db.session.rollback()
             return jsonify({'error': 'Insufficient balance'}), 400
         
-        # Process withdrawal
-        payout_id = str(uuid.uuid4())
-        payout = {
-            'id': payout_id,
-            'translator_id': user_id,
-            'amount': amount,
-            'payment_method': payment_method,
-            'status': 'completed',
-            'created_at': datetime.utcnow().isoformat()
-        }
-        
-        # Store payout in memory
-        payouts_store[payout_id] = payout
+        # Append the payout to the ledger in the same transaction
+        payout = TranslatorPayout(
+            translator_id=user_id,
+            amount=amount,
+            payment_method=payment_method,
+            status='completed'
+        )
+        db.session.add(payout)
+        db.session.commit()
         
         # Return success response
         return jsonify({
             'status': 'success',
-            'payout_id': payout_id,
-            'amount': amount,
-            'new_balance': available_balance - amount
+            'payout_id': str(payout.id),
+            'amount': float(amount),
+            'new_balance': float(new_balance)
         }), 200
         
     except Exception as e:
+        db.session.rollback()
         logging.error(f"Error processing withdrawal: {str(e)}")
-        return jsonify({'error': 'Failed to process withdrawal'}), 500 
\ No newline at end of file
+        return jsonify({'error': 'Failed to process withdrawal'}), 500
+
+@payments_bp.cli.command('backfill-ledger')
+def backfill_ledger():
+    """Record earnings for completed bookings missing from the ledger and rebuild balances"""
+    now = datetime.utcnow()
+    missing = db.session.query(
+        Booking.translator_id,
+        Booking.id,
+        Booking.total_amount,
+        db.literal('available'),
+        db.literal(now),
+        db.literal(now)
+    ).outerjoin(
+        TranslatorEarning, TranslatorEarning.booking_id == Booking.id
+    ).filter(
+        Booking.status == 'completed',
+        TranslatorEarning.id == None
+    )
+    
+    result = db.session.execute(
+        pg_insert(TranslatorEarning.__table__).from_select(
+            ['translator_id', 'booking_id', 'amount', 'status', 'created_at', 'updated_at'],
+            missing
+        ).on_conflict_do_nothing(index_elements=['booking_id'])
+    )
+    TranslatorBalance.rebuild()
+    db.session.commit()
+    
+    print(f"Recorded {result.rowcount} missing earnings and rebuilt translator balances")
+
+@payments_bp.cli.command('rebuild-earnings-rollup')
+def rebuild_earnings_rollup():
+    """Recompute the daily earnings rollup from the bookings table"""
+    TranslatorDailyEarning.rebuild()
+    db.session.commit()
+    
+    print("Rebuilt the translator daily earnings rollup")
+
+@payments_bp.cli.command('backfill-payment-travelers')
+def backfill_payment_travelers():
+    """Copy the traveler of each booking onto payments created before payments.traveler_id existed"""
+    result = db.session.execute(
+        update(Payment.__table__).where(
+            Payment.__table__.c.booking_id == Booking.__table__.c.id,
+            Payment.__table__.c.traveler_id == None
+        ).values(traveler_id=Booking.__table__.c.traveler_id)
+    )
+    db.session.commit()
+    
+    print(f"Set traveler_id on {result.rowcount} payments")
+
+@payments_bp.cli.command('process-webhooks')
+@click.option('--batch-size', default=WEBHOOK_BATCH_SIZE, show_default=True, help='Events claimed per batch')
+@click.option('--interval', default=1.0, show_default=True, help='Seconds to sleep when the inbox is empty')
+@click.option('--once', is_flag=True, help='Drain the due events and exit instead of polling')
+def process_webhooks(batch_size, interval, once):
+    """Process webhook events from the inbox"""
+    while True:
+        claimed = process_webhook_batch(batch_size)
+        if claimed:
+            logging.info(f"Processed {claimed} webhook events")
+            continue
+        if once:
+            break
+        time.sleep(interval)
+
+@payments_bp.cli.command('reconcile')
+@click.option('--stale-minutes', default=RECONCILE_STALE_MINUTES, show_default=True, help='Only pending payments older than this')
+@click.option('--chunk-size', default=RECONCILE_CHUNK_SIZE, show_default=True, help='Payments resolved per batch')
+def reconcile(stale_minutes, chunk_size):
+    """Resolve stale pending payments against the payment provider"""
+    started = time.monotonic()
+    stats = reconcile_pending_payments(stale_minutes, chunk_size)
+    print(f"Scanned {stats['scanned']} stale pending payments in {time.monotonic() - started:.1f}s "
+          f"using {stats['provider_calls']} provider calls")
+    print(f"Drift: {stats['completed']} completed, {stats['failed']} failed at the provider "
+          f"(oldest {stats['max_drift_seconds']}s); {stats['still_pending']} still pending, "
+          f"{stats['missing']} not found at the provider")
@@ -1,9 +1,16 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request, current_user
 from datetime import datetime
 from extensions import db
+from conditional import make_etag, not_modified, conditional_jsonify
 from models import User, TranslatorProfile, TravelerProfile
+from photos import store_photo, PhotoProcessorBusy, PHOTO_MAX_BYTES
+from onboarding import TranslatorImport, translator_profile_error, read_rows, IMPORT_CHUNK_SIZE
+import photos
 import logging
+import click
+import os
+import time
 
 profiles_bp = Blueprint('profiles', __name__)
 
@@ -98,34 +105,15 @@ def create_translator_profile():
         data = request.get_json()
         logging.info(f"Received data: {data}")
         
-        required_fields = ['full_name', 'phone_number', 'hourly_rate', 'languages']
-        
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            logging.error(f"Missing required fields: {missing_fields}")
-            return jsonify({'error': f'Missing required fields: {missing_fields}'}), 400
+        # Same rules as the bulk import (flask profiles import-translators)
+        error = translator_profile_error(data)
+        if error:
+            logging.error(f"Invalid translator profile: {error}")
+            return jsonify({'error': error}), 400
         
         try:
             hourly_rate = float(data['hourly_rate'])
             
-            # Validate languages array
-            if not isinstance(data['languages'], list):
-                logging.error("Languages must be a list")
-                return jsonify({'error': 'Languages must be a list'}), 400
-                
-            if not data['languages']:
-                logging.error("At least one language must be provided")
-                return jsonify({'error': 'At least one language must be provided'}), 400
-                
-            for lang in data['languages']:
-                if not isinstance(lang, dict):
-                    logging.error("Each language must be an object")
-                    return jsonify({'error': 'Each language must be an object'}), 400
-                    
-                if 'language_code' not in lang or 'language_name' not in lang:
-                    logging.error("Each language must have language_code and language_name")
-                    return jsonify({'error': 'Each language must have language_code and language_name'}), 400
-                
             profile = TranslatorProfile(
                 user_id=user_id,
                 full_name=data['full_name'],
@@ -198,8 +186,14 @@ def get_translator_profile(user_id):
     
     if not profile:
         return jsonify({'error': 'Profile not found'}), 404
+    
+    version, last_modified = profile.cache_validators()
+    etag = make_etag(*version)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
         
-    return jsonify(profile.as_dict())
+    return conditional_jsonify(profile.as_dict(), etag, last_modified)
 
 @profiles_bp.route('/traveler/<int:user_id>', methods=['GET'])
 @jwt_required()
@@ -208,8 +202,14 @@ def get_traveler_profile(user_id):
     
     if not profile:
         return jsonify({'error': 'Profile not found'}), 404
+    
+    version, last_modified = profile.cache_validators()
+    etag = make_etag(*version)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
         
-    return jsonify(profile.as_dict())
+    return conditional_jsonify(profile.as_dict(), etag, last_modified)
 
 @profiles_bp.route('/translator/<int:user_id>', methods=['PUT'])
 @jwt_required()
@@ -236,8 +236,10 @@ def update_translator_profile(user_id):
             profile.languages = data['languages']
         
         # Update additional fields
-        if 'photo_url' in data:
+        if 'photo_url' in data and data['photo_url'] != profile.photo_url:
+            # An external URL replaces any uploaded photo
             profile.photo_url = data['photo_url']
+            profile.photo_key = None
         if 'location' in data:
             profile.location = data['location']
         if 'bio' in data:
@@ -296,8 +298,10 @@ def update_traveler_profile(user_id):
         # Update additional fields
         if 'bio' in data:
             profile.bio = data['bio']
-        if 'photo_url' in data:
+        if 'photo_url' in data and data['photo_url'] != profile.photo_url:
+            # An external URL replaces any uploaded photo
             profile.photo_url = data['photo_url']
+            profile.photo_key = None
         if 'current_location' in data:
             profile.current_location = data['current_location']
         if 'travel_preferences' in data:
@@ -316,3 +320,89 @@ def update_traveler_profile(user_id):
         db.session.rollback()
         logging.error(f"Error updating traveler profile: {str(e)}")
         return jsonify({'error': str(e)}), 400
+
+@profiles_bp.route('/photo', methods=['POST'])
+@jwt_required()
+def upload_photo():
+    """Upload a profile photo (multipart field "photo") and get its variant URLs"""
+    if photos.PIL is None:
+        return jsonify({'error': 'Photo uploads are not available'}), 503
+    
+    model = TravelerProfile if current_user.is_traveler else TranslatorProfile
+    profile = model.query.filter_by(user_id=current_user.id).first()
+    if not profile:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    upload = request.files.get('photo')
+    if upload is None:
+        return jsonify({'error': 'No photo provided'}), 400
+    if request.content_length and request.content_length > PHOTO_MAX_BYTES + 64 * 1024:
+        return jsonify({'error': 'Photo is too large'}), 413
+    
+    data = upload.read(PHOTO_MAX_BYTES + 1)
+    if len(data) > PHOTO_MAX_BYTES:
+        return jsonify({'error': 'Photo is too large'}), 413
+    
+    try:
+        # Resized on the photo process pool; identical uploads are stored once
+        photo_key = store_photo(data)
+        
+        profile.photo_key = photo_key
+        profile.photo_url = profile.photo_urls()['full']
+        profile.updated_at = datetime.utcnow()
+        db.session.commit()
+        
+        return jsonify({
+            'photo_url': profile.photo_url,
+            'photo_urls': profile.photo_urls()
+        }), 201
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except PhotoProcessorBusy as e:
+        logging.warning(f"Photo processing busy: {str(e)}")
+        response = jsonify({'error': 'Server is busy, please retry'})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error uploading profile photo: {str(e)}")
+        return jsonify({'error': 'Failed to upload photo'}), 500
+
+@profiles_bp.cli.command('backfill-completion')
+def backfill_completion():
+    """Recompute the stored profile completion of every profile"""
+    updated = 0
+    for model in (TranslatorProfile, TravelerProfile):
+        for profile in model.query.order_by(model.id).yield_per(500):
+            completion = profile.calculate_profile_completion()
+            if profile.profile_completion != completion:
+                profile.profile_completion = completion
+                updated += 1
+        db.session.commit()
+    print(f"Updated profile completion of {updated} profiles")
+
+@profiles_bp.cli.command('import-translators')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']), help='Input format (default: from the file extension)')
+@click.option('--rejects', 'rejects_path', help='Where to write rejected rows (default: <path>.rejects.jsonl)')
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='Rows hashed and inserted per transaction')
+@click.option('--dry-run', is_flag=True, help='Validate and report rejects without inserting anything')
+def import_translators(path, file_format, rejects_path, chunk_size, dry_run):
+    """Create translator accounts and profiles from a CSV or JSONL file"""
+    file_format = file_format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    rejects_path = rejects_path or f'{path}.rejects.jsonl'
+    
+    started = time.monotonic()
+    with open(rejects_path, 'w', encoding='utf-8') as rejects_file:
+        stats = TranslatorImport(rejects_file, chunk_size, dry_run).run(read_rows(path, file_format))
+    elapsed = time.monotonic() - started
+    
+    verb = 'Validated' if dry_run else 'Imported'
+    print(f"{verb} {stats['imported']} of {stats['read']} rows in {elapsed:.1f}s "
+          f"({stats['imported'] / max(elapsed, 0.001):.0f} rows/s); "
+          f"hashing {stats['hash_seconds']:.1f}s, inserts {stats['insert_seconds']:.1f}s")
+    if stats['rejected']:
+        print(f"Rejected {stats['rejected']} rows, see {rejects_path}")
+    else:
+        os.remove(rejects_path)
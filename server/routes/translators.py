@@ -1,14 +1,74 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import TranslatorProfile, User, Rating, Booking
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
+from models import TranslatorProfile, TravelerProfile, User, Rating, RatingSummary, Booking, BookingSummary, SimilarTranslators
 from extensions import db
+from conditional import make_etag, not_modified, conditional_jsonify
+from ratelimit import rate_limit, by_ip, by_user
+from fieldsets import requested_fields
+from pagination import encode_cursor, decode_cursor, page_limit
+import matching
+import similar
 import logging
-from sqlalchemy import func
+from sqlalchemy import func, event, literal, tuple_
+from datetime import datetime
+import click
+import json
+import time
 
 translators_bp = Blueprint('translators', __name__)
 
+# Upper bound on the ids a single bulk lookup may ask for
+MAX_BULK_TRANSLATOR_IDS = 100
+
+# Upper bound on k for matching
+MAX_MATCH_RESULTS = 50
+
+def load_translators(user_ids, fields):
+    """Serialized translators by user id; profiles, users and average ratings in one round trip"""
+    rows = TranslatorProfile.query.join(
+        User, User.id == TranslatorProfile.user_id
+    ).options(
+        *TranslatorProfile.load_options(fields, user_joined=True)
+    ).outerjoin(
+        RatingSummary, RatingSummary.user_id == TranslatorProfile.user_id
+    ).filter(
+        TranslatorProfile.user_id.in_(user_ids)
+    ).add_columns(RatingSummary.average()).all()
+    
+    return {profile.user_id: profile.as_dict(fields, rating=rating) for profile, rating in rows}
+
+@translators_bp.route('', methods=['GET'])
+@jwt_required()
+def get_translators_by_ids():
+    """Get several translators by user id (?ids=1,2,3) with one query, in the order asked"""
+    try:
+        ids = list(dict.fromkeys(int(value) for value in request.args.get('ids', '').split(',') if value.strip()))
+        if not ids:
+            return jsonify({'error': 'ids is required'}), 400
+        if len(ids) > MAX_BULK_TRANSLATOR_IDS:
+            return jsonify({'error': f'At most {MAX_BULK_TRANSLATOR_IDS} ids can be requested at once'}), 400
+        
+        # Lists default to the card projection
+        fields = requested_fields(request.args, TranslatorProfile, default='card')
+        
+        found = load_translators(ids, fields)
+        
+        return jsonify({
+            'translators': [found[translator_id] for translator_id in ids if translator_id in found],
+            'not_found': [translator_id for translator_id in ids if translator_id not in found]
+        }), 200
+        
+    except ValueError as e:
+        logging.error(f"Invalid parameter in bulk translator lookup: {str(e)}")
+        return jsonify({'error': 'Invalid parameters provided'}), 400
+    except Exception as e:
+        logging.error(f"Error getting translators: {str(e)}")
+        return jsonify({'error': 'Failed to get translators'}), 500
+
 @translators_bp.route('/search', methods=['GET'])
 @jwt_required()
+@rate_limit('search-ip', by_ip)
+@rate_limit('search-user', by_user)
 def search_translators():
     try:
         # Get query parameters with defaults
@@ -16,11 +76,16 @@ def search_translators():
         location = request.args.get('location')
         available = request.args.get('available', '').lower() == 'true'
         min_rating = request.args.get('min_rating')
+        min_completion = request.args.get('min_completion')
+        sort = request.args.get('sort')
         page = max(1, int(request.args.get('page', 1)))
         per_page = min(50, int(request.args.get('per_page', 10)))  # Limit max results
+        fields = requested_fields(request.args, TranslatorProfile)
         
-        # Start building query
-        query = TranslatorProfile.query
+        # Start building query, loading only the columns the requested fields need
+        query = TranslatorProfile.query.join(
+            User, User.id == TranslatorProfile.user_id
+        ).options(*TranslatorProfile.load_options(fields, user_joined=True))
         
         # Apply filters
         if language:
@@ -37,42 +102,39 @@ def search_translators():
         if available:
             query = query.filter(TranslatorProfile.is_available == True)
         
+        if min_completion:
+            query = query.filter(TranslatorProfile.profile_completion >= int(min_completion))
+        
+        # Running rating totals, one row per translator: no GROUP BY over ratings
+        query = query.outerjoin(RatingSummary, RatingSummary.user_id == TranslatorProfile.user_id)
+        
         if min_rating and min_rating.replace('.', '').isdigit():
             min_rating = float(min_rating)
-            # Subquery to get average ratings
-            ratings_subq = db.session.query(
-                Rating.reviewee_id,
-                func.avg(Rating.rating).label('avg_rating')
-            ).group_by(Rating.reviewee_id).having(
-                func.avg(Rating.rating) >= min_rating
-            ).subquery()
-            
-            query = query.join(
-                ratings_subq,
-                TranslatorProfile.user_id == ratings_subq.c.reviewee_id
+            query = query.filter(
+                RatingSummary.rating_count > 0,
+                RatingSummary.rating_sum >= min_rating * RatingSummary.rating_count
             )
         
-        # Order by availability first, then rating (if exists), then hourly rate
-        query = query.outerjoin(
-            Rating,
-            TranslatorProfile.user_id == Rating.reviewee_id
-        ).group_by(
-            TranslatorProfile.id
-        ).order_by(
+        # Order by availability first, then rating (if exists), then hourly rate;
+        # sort=completion ranks the most complete profiles first
+        avg_rating = RatingSummary.average()
+        ordering = [
             TranslatorProfile.is_available.desc(),
-            func.coalesce(func.avg(Rating.rating), 0).desc(),
+            avg_rating.desc(),
             TranslatorProfile.hourly_rate.asc()
-        )
+        ]
+        if sort == 'completion':
+            ordering.insert(0, TranslatorProfile.profile_completion.desc())
+        
+        query = query.order_by(*ordering).add_columns(avg_rating)
         
         # Execute paginated query
         paginated = query.paginate(page=page, per_page=per_page, error_out=False)
         
-        # Prepare response
+        # Prepare response; the average rating comes from the search query itself
         translators = []
-        for profile in paginated.items:
-            translator_data = profile.as_dict()
-            # Add any additional processing here if needed
-            translators.append(translator_data)
+        for profile, rating in paginated.items:
+            translators.append(profile.as_dict(fields, rating=rating))
         
         return jsonify({
             'translators': translators,
@@ -89,17 +151,244 @@ def search_translators():
         logging.error(f"Error searching translators: {str(e)}")
         return jsonify({'error': 'Failed to search translators'}), 500
 
+@translators_bp.route('/match', methods=['GET'])
+@jwt_required()
+@rate_limit('search-user', by_user)
+def match_translators():
+    """Best translators for the current traveler, scored against every translator in memory.
+    
+    The request comes from the traveler's profile (languages_needed,
+    current_location, interests); languages, location and max_rate
+    query parameters override it.
+    """
+    try:
+        if matching.np is None:
+            return jsonify({'error': 'Matching is not available'}), 503
+        
+        user = current_user
+        if not user.is_traveler:
+            return jsonify({'error': 'Only travelers can request matches'}), 403
+        
+        profile = TravelerProfile.query.filter_by(user_id=user.id).first()
+        languages = request.args.get('languages')
+        max_rate = request.args.get('max_rate')
+        match_request = matching.MatchRequest(
+            languages=languages.split(',') if languages else (profile.languages_needed if profile else []),
+            location=request.args.get('location') or (profile.current_location if profile else None),
+            interests=profile.interests if profile else [],
+            max_rate=float(max_rate) if max_rate else None,
+            include_unavailable=request.args.get('available', '').lower() == 'false'
+        )
+        if not match_request.languages:
+            return jsonify({'error': 'languages is required when the profile has no languages_needed'}), 400
+        
+        k = max(1, min(MAX_MATCH_RESULTS, int(request.args.get('k', 10))))
+        fields = requested_fields(request.args, TranslatorProfile, default='card')
+        
+        matches = matching.matcher.top_k(match_request, k)
+        found = load_translators([user_id for user_id, _ in matches], fields)
+        
+        translators = []
+        for user_id, score in matches:
+            # A profile deleted since the last refresh is skipped
+            if user_id in found:
+                translators.append(dict(found[user_id], match_score=score))
+        
+        return jsonify({'translators': translators}), 200
+        
+    except ValueError as e:
+        logging.error(f"Invalid parameter in translator matching: {str(e)}")
+        return jsonify({'error': 'Invalid parameters provided'}), 400
+    except Exception as e:
+        logging.error(f"Error matching translators: {str(e)}")
+        return jsonify({'error': 'Failed to match translators'}), 500
+
 @translators_bp.route('/<int:translator_id>', methods=['GET'])
 @jwt_required()
 def get_translator(translator_id):
     try:
-        translator = TranslatorProfile.query.filter_by(user_id=translator_id).first()
+        fields = requested_fields(request.args, TranslatorProfile)
+        translator = TranslatorProfile.query.options(
+            *TranslatorProfile.load_options(fields)
+        ).filter_by(user_id=translator_id).first()
         
         if not translator:
             return jsonify({'error': 'Translator not found'}), 404
+        
+        # Answer revalidation requests before running the serialization aggregates;
+        # each field set is a separate representation with its own ETag
+        version, last_modified = translator.cache_validators()
+        etag = make_etag(*version, tuple(fields))
+        cached = not_modified(etag, last_modified)
+        if cached:
+            return cached
             
-        return jsonify(translator.as_dict()), 200
+        return conditional_jsonify(translator.as_dict(fields), etag, last_modified)
         
+    except ValueError as e:
+        logging.error(f"Invalid parameter in translator details: {str(e)}")
+        return jsonify({'error': 'Invalid parameters provided'}), 400
     except Exception as e:
         logging.error(f"Error getting translator details: {str(e)}")
-        return jsonify({'error': 'Failed to get translator details'}), 500 
\ No newline at end of file
+        return jsonify({'error': 'Failed to get translator details'}), 500 
+
+@translators_bp.route('/<int:translator_id>/similar', methods=['GET'])
+@jwt_required()
+def get_similar_translators(translator_id):
+    """Precomputed translators similar to this one, for when they are booked or unavailable"""
+    try:
+        fields = requested_fields(request.args, TranslatorProfile, default='card')
+        available_only = request.args.get('available', '').lower() == 'true'
+        
+        # One primary key lookup; the list itself is built by flask translators build-similar
+        similar = db.session.get(SimilarTranslators, translator_id)
+        if similar is None:
+            if not TranslatorProfile.query.filter_by(user_id=translator_id).first():
+                return jsonify({'error': 'Translator not found'}), 404
+            # Not computed yet
+            return jsonify({'translators': []}), 200
+        
+        # The availability filter needs is_available even when it was not asked for
+        load_fields = fields + ['is_available'] if available_only and 'is_available' not in fields else fields
+        found = load_translators([user_id for user_id, _ in similar.neighbours], load_fields)
+        
+        translators = []
+        for user_id, similarity in similar.neighbours:
+            # Skip profiles deleted since the list was computed
+            if user_id not in found:
+                continue
+            translator = found[user_id]
+            if available_only and not translator['is_available']:
+                continue
+            if load_fields is not fields:
+                del translator['is_available']
+            translators.append(dict(translator, similarity=similarity))
+        
+        return jsonify({'translators': translators, 'computed_at': similar.computed_at.isoformat()}), 200
+        
+    except ValueError as e:
+        logging.error(f"Invalid parameter in similar translators: {str(e)}")
+        return jsonify({'error': 'Invalid parameters provided'}), 400
+    except Exception as e:
+        logging.error(f"Error getting similar translators: {str(e)}")
+        return jsonify({'error': 'Failed to get similar translators'}), 500
+
+@translators_bp.route('/<int:translator_id>/reviews', methods=['GET'])
+@jwt_required()
+def get_translator_reviews(translator_id):
+    """Reviews a translator received, newest first, one page at a time"""
+    try:
+        limit = page_limit(request.args)
+        
+        query = db.session.query(Rating, User.name).join(
+            User, User.id == Rating.reviewer_id
+        ).filter(Rating.reviewee_id == translator_id)
+        
+        # Keyset pagination on (created_at, id), served by idx_ratings_reviewee_created
+        cursor = request.args.get('cursor')
+        if cursor:
+            created_at, rating_id = decode_cursor(cursor)
+            query = query.filter(
+                tuple_(Rating.created_at, Rating.id) < (datetime.fromisoformat(created_at), int(rating_id))
+            )
+        
+        rows = query.order_by(Rating.created_at.desc(), Rating.id.desc()).limit(limit + 1).all()
+        average, count, _ = RatingSummary.for_user(translator_id)
+        
+        response = jsonify({
+            'rating': round(float(average), 1),
+            'rating_count': count,
+            'reviews': [rating.as_dict(reviewer_name) for rating, reviewer_name in rows[:limit]]
+        })
+        
+        # As for payment history, the next page is advertised in a header
+        if len(rows) > limit:
+            last = rows[limit - 1][0]
+            response.headers['X-Next-Cursor'] = encode_cursor(last.created_at.isoformat(), last.id)
+        
+        return response, 200
+        
+    except ValueError as e:
+        logging.error(f"Invalid parameter in translator reviews: {str(e)}")
+        return jsonify({'error': 'Invalid parameters provided'}), 400
+    except Exception as e:
+        logging.error(f"Error getting translator reviews: {str(e)}")
+        return jsonify({'error': 'Failed to get translator reviews'}), 500
+
+@translators_bp.cli.command('measure-projections')
+@click.option('--limit', default=50, show_default=True, help='Translator profiles serialized per projection')
+def measure_projections(limit):
+    """Compare payload size and database I/O of the translator projections"""
+    statements = []
+    
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(db.engine, 'before_cursor_execute', count_statement)
+    try:
+        for name, fields in TranslatorProfile.PROJECTIONS.items():
+            # Start from an empty identity map so every projection loads its own rows
+            db.session.close()
+            statements.clear()
+            started = time.perf_counter()
+            
+            profiles = TranslatorProfile.query.options(
+                *TranslatorProfile.load_options(fields)
+            ).order_by(TranslatorProfile.id).limit(limit).all()
+            payload = json.dumps([profile.as_dict(fields) for profile in profiles])
+            
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            queries = len(statements)
+            columns = TranslatorProfile.columns_for(fields)
+            
+            # Bytes of column data read for these rows (PostgreSQL only)
+            stored = ''
+            if db.engine.dialect.name == 'postgresql':
+                ids = [profile.id for profile in profiles]
+                size = sum(
+                    (func.coalesce(func.pg_column_size(getattr(TranslatorProfile, column)), 0) for column in columns),
+                    literal(0)
+                )
+                column_bytes = db.session.query(func.sum(size)).filter(TranslatorProfile.id.in_(ids)).scalar() or 0
+                stored = f", {column_bytes} bytes of column data"
+            
+            per_profile = len(payload) // max(1, len(profiles))
+            print(f"{name:<7} {len(profiles)} profiles: {len(payload)} payload bytes ({per_profile}/profile), "
+                  f"{len(columns)} columns{stored}, {queries} queries, {elapsed_ms:.1f}ms")
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+@translators_bp.cli.command('build-similar')
+@click.option('--full', is_flag=True, help='Recompute every list instead of only those affected by profile changes')
+@click.option('--watch', default=0.0, help='Keep running, refreshing every this many seconds')
+def build_similar_translators(full, watch):
+    """Recompute the precomputed similar-translator lists"""
+    if similar.np is None:
+        print("NumPy is required to build similar translators (pip install numpy)")
+        return
+    
+    while True:
+        stats = similar.build_similar(full=full)
+        print(f"Recomputed {stats['changed']} changed and {stats['affected']} affected lists "
+              f"of {stats['translators']} translators ({stats['removed']} removed) in {stats['seconds']:.1f}s")
+        if not watch:
+            break
+        # Later rounds only pick up changes
+        full = False
+        time.sleep(watch)
+
+@translators_bp.cli.command('rebuild-rating-summaries')
+def rebuild_rating_summaries():
+    """Recompute the running rating totals from the ratings table"""
+    RatingSummary.rebuild()
+    db.session.commit()
+    
+    print("Rebuilt the rating summaries")
+
+@translators_bp.cli.command('rebuild-booking-summaries')
+def rebuild_booking_summaries():
+    """Recompute the running booking counts from the bookings table"""
+    BookingSummary.rebuild()
+    db.session.commit()
+    
+    print("Rebuilt the booking summaries")
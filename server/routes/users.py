@@ -1,35 +1,56 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
 from models import User, TranslatorProfile, TravelerProfile
 from extensions import db
+from conditional import make_etag, latest, not_modified, conditional_jsonify
 import logging
 
 users_bp = Blueprint('users', __name__)
 
+def load_user_and_profile(user_id):
+    """Get a user and their traveler or translator profile; (None, None) if the user does not exist"""
+    user = User.query.get(user_id)
+    if not user:
+        return None, None
+    
+    # Get specific profile based on user type
+    if user.is_traveler:
+        profile = TravelerProfile.query.filter_by(user_id=user_id).first()
+    else:
+        profile = TranslatorProfile.query.filter_by(user_id=user_id).first()
+    return user, profile
+
+def serialize_me(user, profile):
+    user_data = user.as_dict()
+    if profile:
+        user_data['profile'] = profile.as_dict()
+    return user_data
+
 @users_bp.route('/me', methods=['GET'])
 @jwt_required()
 def get_user_profile():
     user_id = get_jwt_identity()
     
     # Get user from database
-    user = User.query.get(user_id)
+    user, profile = load_user_and_profile(user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    user_data = user.as_dict()
+    # Answer revalidation requests before serializing the profile
+    version = ('user', user.id, user.updated_at)
+    last_modified = user.updated_at
+    if profile:
+        profile_version, profile_last_modified = profile.cache_validators()
+        version += profile_version
+        last_modified = latest(last_modified, profile_last_modified)
     
-    # Get specific profile based on user type
-    if user.is_traveler:
-        profile = TravelerProfile.query.filter_by(user_id=user_id).first()
-        if profile:
-            user_data['profile'] = profile.as_dict()
-    else:
-        profile = TranslatorProfile.query.filter_by(user_id=user_id).first()
-        if profile:
-            user_data['profile'] = profile.as_dict()
+    etag = make_etag(*version)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
     
-    return jsonify(user_data), 200
+    return conditional_jsonify(serialize_me(user, profile), etag, last_modified)
 
 @users_bp.route('/me', methods=['PUT'])
 @jwt_required()
@@ -83,18 +104,10 @@ def update_user_profile():
     try:
         db.session.commit()
         
-        # Get updated user data
+        # Get updated user data; the objects loaded above are refreshed on access
         user_data = user.as_dict()
-        
-        # Get specific profile based on user type
-        if user.is_traveler:
-            profile = TravelerProfile.query.filter_by(user_id=user_id).first()
-            if profile:
-                user_data['profile'] = profile.as_dict()
-        else:
-            profile = TranslatorProfile.query.filter_by(user_id=user_id).first()
-            if profile:
-                user_data['profile'] = profile.as_dict()
+        if profile:
+            user_data['profile'] = profile.as_dict()
         
         return jsonify(user_data), 200
     except Exception as e:
@@ -105,12 +118,4 @@ def update_user_profile():
 @users_bp.route('/me/language', methods=['GET'])
 @jwt_required()
 def get_user_language():
-    user_id = get_jwt_identity()
-    
-    # Get user from database
-    user = User.query.get(user_id)
-    
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-    
-    return jsonify({'preferred_language': user.preferred_language}), 200 
\ No newline at end of file
+    return jsonify({'preferred_language': current_user.preferred_language}), 200 
\ No newline at end of file
@@ -0,0 +1,220 @@
+from sqlalchemy import select, delete, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from extensions import db
+from models import TranslatorProfile, SimilarTranslators
+from matching import location_cell
+from datetime import datetime
+import logging
+import math
+import os
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Neighbours kept per translator
+SIMILAR_COUNT = int(os.environ.get('SIMILAR_COUNT', 10))
+
+# Rows scored against everyone at once; memory is about 4 bytes * block * translators
+SIMILAR_BLOCK_SIZE = int(os.environ.get('SIMILAR_BLOCK_SIZE', 256))
+
+# Similarity = sum of weight * per-part cosine similarity, so it lies in [0, 1]
+SIMILAR_WEIGHTS = {
+    'languages': 0.45,
+    'specializations': 0.20,
+    'location': 0.20,  # Same city
+    'rate': 0.15
+}
+
+# A language spoken natively counts more than one learned recently
+PROFICIENCY_WEIGHTS = {'native': 1.0, 'fluent': 0.9, 'advanced': 0.8, 'intermediate': 0.5, 'beginner': 0.25}
+DEFAULT_PROFICIENCY_WEIGHT = 0.6
+
+# Upper edges of the hourly rate bands; neighbouring bands count as half similar
+RATE_BANDS = [15, 25, 40, 60, 90]
+
+def _rate_band(hourly_rate):
+    return next((band for band, edge in enumerate(RATE_BANDS) if (hourly_rate or 0) < edge), len(RATE_BANDS))
+
+def feature_matrix(rows):
+    """Feature vectors for (user_id, languages, specializations, hourly_rate, location) rows.
+
+    Returns (vectors, cells): each part of a vector is L2-normalized and
+    scaled by the square root of its weight, so the dot product of two
+    vectors is their weighted similarity without location. Location is a
+    city id per row (-1 if unknown) and is compared separately, as a
+    one-hot column per city would dwarf the rest.
+    """
+    language_dims, specialization_dims, cell_ids = {}, {}, {}
+    parsed = []
+    for _, languages, specializations, hourly_rate, location in rows:
+        weights = {}
+        for language in languages or []:
+            if isinstance(language, dict) and language.get('language_code'):
+                code = str(language['language_code']).strip().lower()
+                level = str(language.get('proficiency_level') or '').lower()
+                weights[code] = max(weights.get(code, 0), PROFICIENCY_WEIGHTS.get(level, DEFAULT_PROFICIENCY_WEIGHT))
+                language_dims.setdefault(code, len(language_dims))
+        terms = {str(term).strip().lower() for term in specializations or [] if str(term).strip()}
+        for term in terms:
+            specialization_dims.setdefault(term, len(specialization_dims))
+        cell = location_cell(location)
+        parsed.append((
+            weights, terms, _rate_band(hourly_rate),
+            -1 if cell is None else cell_ids.setdefault(cell, len(cell_ids))
+        ))
+
+    rate_offset = len(language_dims) + len(specialization_dims)
+    vectors = np.zeros((len(parsed), rate_offset + len(RATE_BANDS) + 1), dtype=np.float32)
+    cells = np.fromiter((cell for *_, cell in parsed), dtype=np.int32, count=len(parsed))
+    for row, (weights, terms, band, _) in enumerate(parsed):
+        for code, weight in weights.items():
+            vectors[row, language_dims[code]] = weight
+        for term in terms:
+            vectors[row, len(language_dims) + specialization_dims[term]] = 1
+        vectors[row, rate_offset + band] = 1
+        for neighbour in (band - 1, band + 1):
+            if 0 <= neighbour <= len(RATE_BANDS):
+                vectors[row, rate_offset + neighbour] = 0.5
+
+    for name, start, end in (('languages', 0, len(language_dims)),
+                             ('specializations', len(language_dims), rate_offset),
+                             ('rate', rate_offset, vectors.shape[1])):
+        part = vectors[:, start:end]
+        norms = np.linalg.norm(part, axis=1, keepdims=True)
+        np.divide(part, norms, out=part, where=norms > 0)
+        part *= math.sqrt(SIMILAR_WEIGHTS[name])
+    return vectors, cells
+
+def nearest_neighbours(vectors, cells, rows, count=SIMILAR_COUNT):
+    """Top `count` (index, similarity) pairs for each of the given row indexes"""
+    results = {}
+    count = min(count, len(vectors) - 1)
+    if count <= 0:
+        return {row: [] for row in rows}
+    for start in range(0, len(rows), SIMILAR_BLOCK_SIZE):
+        block = np.asarray(rows[start:start + SIMILAR_BLOCK_SIZE])
+        scores = vectors[block] @ vectors.T
+        scores += SIMILAR_WEIGHTS['location'] * ((cells[block, None] == cells[None, :]) & (cells[block, None] >= 0))
+        # A translator is not its own neighbour
+        scores[np.arange(len(block)), block] = -np.inf
+        top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        for i, row in enumerate(block):
+            results[int(row)] = [
+                (int(neighbour), round(float(score), 4))
+                for neighbour, score in zip(top[i], top_scores[i]) if score > 0
+            ]
+    return results
+
+def _affected_rows(vectors, cells, changed, stored, index):
+    """Rows whose stored list may change because the `changed` rows moved.
+
+    That is every row that lists a changed or deleted translator, plus every row
+    for which some changed translator now beats the weakest neighbour it
+    has stored (or which has room for more neighbours).
+    """
+    affected = set()
+    changed_ids = {int(row) for row in changed}
+    for start in range(0, len(vectors), SIMILAR_BLOCK_SIZE * 16):
+        end = min(start + SIMILAR_BLOCK_SIZE * 16, len(vectors))
+        scores = vectors[start:end] @ vectors[changed].T
+        scores += SIMILAR_WEIGHTS['location'] * ((cells[start:end, None] == cells[None, changed]) & (cells[start:end, None] >= 0))
+        best = scores.max(axis=1)
+        for offset in np.nonzero(best > 0)[0]:
+            row = start + int(offset)
+            neighbours = stored.get(row)
+            if neighbours is None or len(neighbours) < SIMILAR_COUNT or best[offset] > neighbours[-1][1]:
+                affected.add(row)
+    for row, neighbours in stored.items():
+        # Also lists naming a translator whose profile is gone
+        if any(index.get(user_id, -1) in changed_ids or user_id not in index for user_id, _ in neighbours):
+            affected.add(row)
+    return affected - changed_ids
+
+def _save(user_ids, results, now):
+    values = [
+        {
+            'translator_id': user_ids[row],
+            'neighbours': [[user_ids[neighbour], score] for neighbour, score in neighbours],
+            'computed_at': now
+        }
+        for row, neighbours in results.items()
+    ]
+    table = SimilarTranslators.__table__
+    for start in range(0, len(values), 1000):
+        statement = pg_insert(table).values(values[start:start + 1000])
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.translator_id],
+            set_={'neighbours': statement.excluded.neighbours, 'computed_at': statement.excluded.computed_at}
+        ))
+
+def build_similar(full=False):
+    """Recompute the stored similar-translator lists; returns counts for the report.
+
+    A full build recomputes every list. Otherwise only translators whose
+    profile changed after their list was computed (or who have none) are
+    recomputed, together with the other lists those changes can enter or
+    leave. Features of every translator are loaded either way: neighbours
+    can be anyone.
+    """
+    started = time.monotonic()
+    now = datetime.utcnow()
+    rows = db.session.execute(
+        select(
+            TranslatorProfile.user_id,
+            TranslatorProfile.languages,
+            TranslatorProfile.specializations,
+            TranslatorProfile.hourly_rate,
+            TranslatorProfile.location
+        ).order_by(TranslatorProfile.user_id)
+    ).all()
+    user_ids = [row[0] for row in rows]
+    index = {user_id: row for row, user_id in enumerate(user_ids)}
+    vectors, cells = feature_matrix(rows)
+
+    if full:
+        changed = list(range(len(rows)))
+        affected = set()
+    else:
+        stale = db.session.execute(
+            select(TranslatorProfile.user_id).outerjoin(
+                SimilarTranslators, SimilarTranslators.translator_id == TranslatorProfile.user_id
+            ).where(or_(
+                SimilarTranslators.translator_id == None,
+                TranslatorProfile.updated_at > SimilarTranslators.computed_at
+            ))
+        ).scalars().all()
+        changed = sorted(index[user_id] for user_id in stale)
+        stored = {
+            index[translator_id]: [(user_id, score) for user_id, score in neighbours]
+            for translator_id, neighbours in db.session.query(
+                SimilarTranslators.translator_id, SimilarTranslators.neighbours
+            ) if translator_id in index
+        }
+        affected = _affected_rows(vectors, cells, changed, stored, index) if changed else set()
+
+    results = nearest_neighbours(vectors, cells, changed + sorted(affected))
+    _save(user_ids, results, now)
+    # Lists of translators whose profile is gone
+    removed = db.session.execute(
+        delete(SimilarTranslators).where(
+            SimilarTranslators.translator_id.notin_(select(TranslatorProfile.user_id))
+        )
+    ).rowcount
+    db.session.commit()
+
+    stats = {
+        'translators': len(rows),
+        'changed': len(changed),
+        'affected': len(affected),
+        'removed': removed,
+        'seconds': time.monotonic() - started
+    }
+    logging.info(f"Rebuilt similar translators: {stats}")
+    return stats
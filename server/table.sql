@@ -19,6 +19,15 @@ CREATE TABLE password_reset_tokens (
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Revoked access tokens (by JWT jti), kept until the token would have expired anyway
+CREATE TABLE revoked_tokens (
+    id SERIAL PRIMARY KEY,
+    jti VARCHAR(36) NOT NULL UNIQUE,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    expires_at TIMESTAMP NOT NULL,
+    revoked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Store profiles for translators
 CREATE TABLE translator_profiles (
     id SERIAL PRIMARY KEY,
@@ -28,6 +37,7 @@ CREATE TABLE translator_profiles (
     languages JSONB NOT NULL,  -- Array of {language_code, proficiency_level}
     hourly_rate FLOAT NOT NULL,
     photo_url VARCHAR(255),  -- Profile photo URL
+    photo_key VARCHAR(64),  -- SHA-256 of an uploaded photo; variants live under photos/<key>/
     location VARCHAR(255),  -- Current location
     bio TEXT,  -- Translator's bio/description
     is_available BOOLEAN DEFAULT true,  -- Availability status
@@ -38,6 +48,7 @@ CREATE TABLE translator_profiles (
     social_media JSONB,  -- Object with social media links
     preferred_meeting_locations VARCHAR[],  -- Preferred meeting spots
     availability_hours JSONB,  -- Weekly availability schedule
+    profile_completion INTEGER NOT NULL DEFAULT 0,  -- Percentage, recomputed by the app on write
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     CONSTRAINT unique_translator_user UNIQUE (user_id)
@@ -50,6 +61,7 @@ CREATE TABLE traveler_profiles (
     full_name VARCHAR(255) NOT NULL,
     phone_number VARCHAR(20) NOT NULL,
     photo_url VARCHAR(255),  -- Profile photo URL
+    photo_key VARCHAR(64),  -- SHA-256 of an uploaded photo; variants live under photos/<key>/
     bio TEXT,  -- Traveler's bio/description
     nationality VARCHAR(100),
     languages_needed JSONB NOT NULL,  -- Languages they need help with
@@ -57,6 +69,7 @@ CREATE TABLE traveler_profiles (
     travel_preferences JSONB,  -- Travel style, preferences, etc.
     interests VARCHAR[],  -- Areas of interest
     emergency_contact JSONB,  -- Emergency contact information
+    profile_completion INTEGER NOT NULL DEFAULT 0,  -- Percentage, recomputed by the app on write
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     CONSTRAINT unique_traveler_user UNIQUE (user_id)
@@ -83,6 +96,7 @@ CREATE TABLE bookings (
     location VARCHAR(255) NOT NULL,
     notes TEXT,
     total_amount DECIMAL(10, 2) NOT NULL,
+    hourly_rate DECIMAL(10, 2),  -- Rate the booking was priced at; NULL for bookings made before server-side quotes
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
@@ -101,6 +115,7 @@ CREATE TABLE chat_messages (
 CREATE TABLE payments (
     id SERIAL PRIMARY KEY,
     booking_id INTEGER NOT NULL REFERENCES bookings(id) ON DELETE CASCADE,
+    traveler_id INTEGER REFERENCES users(id) ON DELETE CASCADE,  -- Denormalized from the booking for history queries
     payment_id VARCHAR(100) NOT NULL UNIQUE,
     transaction_id VARCHAR(100) UNIQUE,
     amount DECIMAL(10, 2) NOT NULL,
@@ -113,6 +128,35 @@ CREATE TABLE payments (
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Inbox of payment provider webhook events, processed asynchronously by a worker
+CREATE TABLE webhook_events (
+    id SERIAL PRIMARY KEY,
+    event_id VARCHAR(255) NOT NULL UNIQUE,  -- Provider event id, used to drop duplicate deliveries
+    event_type VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'processed', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+
+-- Responses of mutating requests sent with an Idempotency-Key header, replayed on retry
+CREATE TABLE idempotency_keys (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    key VARCHAR(255) NOT NULL,
+    method VARCHAR(10) NOT NULL,
+    path VARCHAR(255) NOT NULL,
+    request_hash VARCHAR(64) NOT NULL,
+    status_code INTEGER,  -- NULL while the original request is still running
+    response_body TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    CONSTRAINT unique_user_idempotency_key UNIQUE (user_id, key)
+);
+
 -- Translator earnings from completed bookings
 CREATE TABLE translator_earnings (
     id SERIAL PRIMARY KEY,
@@ -139,6 +183,32 @@ CREATE TABLE translator_payouts (
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Running totals of the earnings/payouts ledger, one row per translator
+CREATE TABLE translator_balances (
+    translator_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    available_balance DECIMAL(12, 2) NOT NULL DEFAULT 0 CHECK (available_balance >= 0),
+    total_earned DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    total_paid_out DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Daily booking totals per translator and status, kept current on every booking write
+CREATE TABLE translator_daily_earnings (
+    translator_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    amount DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    booking_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (translator_id, day, status)
+);
+
+-- Precomputed nearest neighbours of each translator, rebuilt by flask translators build-similar
+CREATE TABLE similar_translators (
+    translator_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    neighbours JSONB NOT NULL,  -- [[translator user id, similarity], ...], most similar first
+    computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Ratings and reviews for completed sessions
 CREATE TABLE ratings (
     id SERIAL PRIMARY KEY,
@@ -151,25 +221,49 @@ CREATE TABLE ratings (
     UNIQUE (booking_id, reviewer_id, reviewee_id)
 );
 
+-- Running sum and count of the ratings each user received, updated with every new rating
+CREATE TABLE rating_summaries (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    rating_sum BIGINT NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    last_rating_at TIMESTAMP
+);
+
+-- Running count of the bookings each translator received, updated with every new booking
+CREATE TABLE booking_summaries (
+    translator_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    booking_count INTEGER NOT NULL DEFAULT 0,
+    last_booking_at TIMESTAMP
+);
+
 -- Create indexes for performance
 CREATE INDEX idx_user_email ON users(email);
 CREATE INDEX idx_translator_hourly_rate ON translator_profiles(hourly_rate);
+CREATE INDEX idx_translator_profile_completion ON translator_profiles(profile_completion);
 CREATE INDEX idx_traveler_nationality ON traveler_profiles(nationality);
 CREATE INDEX idx_bookings_traveler ON bookings(traveler_id);
 CREATE INDEX idx_bookings_translator ON bookings(translator_id);
 CREATE INDEX idx_bookings_date ON bookings(date);
 CREATE INDEX idx_bookings_status ON bookings(status);
+CREATE INDEX idx_bookings_translator_starts ON bookings(translator_id, (date + start_time), id);
 CREATE INDEX idx_chat_messages_sender ON chat_messages(sender_id);
 CREATE INDEX idx_chat_messages_receiver ON chat_messages(receiver_id);
 CREATE INDEX idx_chat_messages_created ON chat_messages(created_at);
 CREATE INDEX idx_payments_booking ON payments(booking_id);
 CREATE INDEX idx_payments_status ON payments(status);
+CREATE INDEX idx_payments_traveler_created ON payments(traveler_id, created_at, id);
+CREATE INDEX idx_payments_pending_created ON payments(created_at, id) WHERE status = 'pending';
+CREATE INDEX idx_webhook_events_due ON webhook_events(status, next_attempt_at);
+CREATE INDEX idx_idempotency_keys_expires ON idempotency_keys(expires_at);
+CREATE INDEX idx_revoked_tokens_expires ON revoked_tokens(expires_at);
+CREATE INDEX idx_revoked_tokens_revoked ON revoked_tokens(revoked_at);
 CREATE INDEX idx_ratings_booking ON ratings(booking_id);
-CREATE INDEX idx_ratings_reviewee ON ratings(reviewee_id);
+CREATE INDEX idx_ratings_reviewee_created ON ratings(reviewee_id, created_at, id);
 CREATE INDEX idx_translator_earnings_translator ON translator_earnings(translator_id);
 CREATE INDEX idx_translator_earnings_status ON translator_earnings(status);
 CREATE INDEX idx_translator_payouts_translator ON translator_payouts(translator_id);
 CREATE INDEX idx_translator_payouts_status ON translator_payouts(status);
+CREATE INDEX idx_translator_payouts_translator_created ON translator_payouts(translator_id, created_at, id);
 
 -- Function to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -225,8 +319,13 @@ CREATE TRIGGER update_translator_payouts_updated_at
 -- select * from bookings
 -- select * from chat_messages
 -- select * from payments
+-- select * from webhook_events
+-- select * from idempotency_keys
+-- select * from revoked_tokens
 -- select * from translator_earnings
 -- select * from translator_payouts
+-- select * from translator_balances
+-- select * from translator_daily_earnings
 -- select * from ratings
 
 
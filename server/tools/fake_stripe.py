@@ -0,0 +1,186 @@
+"""Local stand-in for the Stripe PaymentIntents API, for offline load tests.
+
+Run it and point the server at it:
+
+    python tools/fake_stripe.py --port 12111 --latency-ms 300 --jitter-ms 200 --failure-rate 0.05
+    STRIPE_API_BASE=http://localhost:12111 STRIPE_SECRET_KEY=sk_test_fake flask run
+
+Supported calls:
+    POST /v1/payment_intents                 create an intent
+    GET  /v1/payment_intents/<id>            retrieve an intent
+    POST /v1/payment_intents/<id>/confirm    mark an intent as succeeded
+    POST /v1/payment_intents/<id>/cancel     mark an intent as canceled
+    GET  /v1/payment_intents                 list intents, newest first
+                                             (created[gte|lte], limit, starting_after)
+
+Latency, failures and hung requests can be injected to exercise the
+timeouts and circuit breaker in payment_provider.py.
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qsl, urlsplit
+import argparse
+import json
+import random
+import re
+import secrets
+import threading
+import time
+
+intents = {}
+intents_lock = threading.Lock()
+options = None
+
+def parse_form(body):
+    """Decode Stripe's form encoding, including one level of key[subkey] nesting"""
+    params = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        match = re.match(r'^(\w+)\[(\w*)\]$', key)
+        if match:
+            outer, inner = match.groups()
+            if inner.isdigit() or inner == '':
+                params.setdefault(outer, []).append(value)
+            else:
+                params.setdefault(outer, {})[inner] = value
+        else:
+            params[key] = value
+    return params
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if not options.quiet:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Request-Id', 'req_' + secrets.token_hex(8))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, error_type, message):
+        self.send_json(status, {'error': {'type': error_type, 'message': message}})
+
+    def inject_faults(self):
+        """Apply configured latency and failures; returns True if the request was answered"""
+        delay = options.latency_ms + random.uniform(0, options.jitter_ms)
+        time.sleep(delay / 1000.0)
+
+        if random.random() < options.hang_rate:
+            # Never answer in time, so the client's read timeout fires
+            time.sleep(options.hang_seconds)
+
+        if random.random() < options.failure_rate:
+            self.send_error_json(500, 'api_error', 'Injected failure')
+            return True
+        return False
+
+    def read_params(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return parse_form(self.rfile.read(length).decode('utf-8'))
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        params = self.read_params()
+        if self.inject_faults():
+            return
+
+        if path == '/v1/payment_intents':
+            intent_id = 'pi_' + secrets.token_hex(12)
+            intent = {
+                'id': intent_id,
+                'object': 'payment_intent',
+                'amount': int(params.get('amount', 0)),
+                'currency': params.get('currency', 'eur'),
+                'payment_method_types': params.get('payment_method_types', ['card']),
+                'metadata': params.get('metadata', {}),
+                'status': 'requires_payment_method',
+                'client_secret': f'{intent_id}_secret_{secrets.token_hex(12)}',
+                'created': int(time.time()),
+                'livemode': False
+            }
+            with intents_lock:
+                intents[intent_id] = intent
+            return self.send_json(200, intent)
+
+        match = re.match(r'^/v1/payment_intents/(\w+)/(confirm|cancel)$', path)
+        if match:
+            with intents_lock:
+                intent = intents.get(match.group(1))
+                if intent:
+                    intent['status'] = 'succeeded' if match.group(2) == 'confirm' else 'canceled'
+            if not intent:
+                return self.send_error_json(404, 'invalid_request_error', 'No such payment_intent')
+            return self.send_json(200, intent)
+
+        self.send_error_json(404, 'invalid_request_error', f'Unrecognized request URL (POST: {path})')
+
+    def list_intents(self, params):
+        created = params.get('created', {})
+        with intents_lock:
+            matching = [
+                intent for intent in intents.values()
+                if int(created.get('gte', 0)) <= intent['created'] <= int(created.get('lte', 2 ** 62))
+            ]
+        # Newest first; dicts keep insertion order, which breaks ties stably
+        matching.reverse()
+        matching.sort(key=lambda intent: intent['created'], reverse=True)
+
+        if params.get('starting_after'):
+            ids = [intent['id'] for intent in matching]
+            if params['starting_after'] not in ids:
+                return self.send_error_json(400, 'invalid_request_error', 'No such payment_intent for starting_after')
+            matching = matching[ids.index(params['starting_after']) + 1:]
+
+        limit = max(1, min(100, int(params.get('limit', 10))))
+        self.send_json(200, {
+            'object': 'list',
+            'url': '/v1/payment_intents',
+            'data': matching[:limit],
+            'has_more': len(matching) > limit
+        })
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path
+        if self.inject_faults():
+            return
+
+        if path == '/v1/payment_intents':
+            return self.list_intents(parse_form(url.query))
+
+        match = re.match(r'^/v1/payment_intents/(\w+)$', path)
+        if match:
+            with intents_lock:
+                intent = intents.get(match.group(1))
+            if not intent:
+                return self.send_error_json(404, 'invalid_request_error', 'No such payment_intent')
+            return self.send_json(200, intent)
+
+        self.send_error_json(404, 'invalid_request_error', f'Unrecognized request URL (GET: {path})')
+
+def main():
+    global options
+    parser = argparse.ArgumentParser(description='Fake Stripe PaymentIntents API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12111)
+    parser.add_argument('--latency-ms', type=float, default=0, help='Fixed delay added to every request')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Random extra delay, uniform in [0, jitter]')
+    parser.add_argument('--failure-rate', type=float, default=0, help='Fraction of requests answered with a 500 api_error')
+    parser.add_argument('--hang-rate', type=float, default=0, help='Fraction of requests that stall for --hang-seconds')
+    parser.add_argument('--hang-seconds', type=float, default=60)
+    parser.add_argument('--quiet', action='store_true', help='Do not log every request')
+    options = parser.parse_args()
+
+    server = ThreadingHTTPServer((options.host, options.port), FakeStripeHandler)
+    print(f"Fake Stripe listening on http://{options.host}:{options.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
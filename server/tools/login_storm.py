@@ -0,0 +1,139 @@
+"""Login storm benchmark: how much do concurrent logins hurt socket latency?
+
+Start the server the way it runs in production (socketio.run on eventlet),
+then fire a burst of logins at it while a probe keeps opening Socket.IO
+handshakes on the same worker:
+
+    RATELIMIT_ENABLED=false python app.py
+    python tools/login_storm.py --url http://localhost:8000 --register --concurrency 32 --logins 500
+
+The probe latency is measured before the storm (baseline) and during it.
+With hashing on the process pool the two should stay close. With
+PASSWORD_POOL_SIZE=0 (inline hashing) every login stalls the hub, and the
+probe latency grows with the login queue.
+
+Every login comes from one IP with one email, so the login rate limits
+must be off (RATELIMIT_ENABLED=false); otherwise the run measures the
+limiter, and the tool stops when most logins get 429.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+import argparse
+import json
+import secrets
+import statistics
+import threading
+import time
+
+def post_json(url, payload, timeout):
+    request = Request(url, data=json.dumps(payload).encode('utf-8'),
+                      headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except HTTPError as e:
+        return e.code
+
+def timed_get(url, timeout):
+    started = time.perf_counter()
+    with urlopen(url, timeout=timeout) as response:
+        response.read()
+    return (time.perf_counter() - started) * 1000
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def describe(label, values):
+    print(f"{label:<22} n={len(values):<6} p50={percentile(values, 0.5):8.1f}ms "
+          f"p95={percentile(values, 0.95):8.1f}ms p99={percentile(values, 0.99):8.1f}ms "
+          f"max={max(values, default=float('nan')):8.1f}ms")
+
+def probe(url, interval, stop, samples, timeout):
+    while not stop.is_set():
+        try:
+            samples.append(timed_get(url, timeout))
+        except Exception:
+            samples.append(timeout * 1000)
+        time.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure socket latency during a login storm')
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--email', help='Existing account to log in with')
+    parser.add_argument('--password', default='StormPassw0rd')
+    parser.add_argument('--register', action='store_true', help='Register a throwaway account first')
+    parser.add_argument('--concurrency', type=int, default=32, help='Logins in flight at once')
+    parser.add_argument('--logins', type=int, default=500, help='Total logins to send')
+    parser.add_argument('--probe-interval-ms', type=float, default=20)
+    parser.add_argument('--baseline-seconds', type=float, default=3)
+    parser.add_argument('--timeout', type=float, default=30)
+    options = parser.parse_args()
+
+    base = options.url.rstrip('/')
+    probe_url = f'{base}/socket.io/?EIO=4&transport=polling&t={secrets.token_hex(4)}'
+    email = options.email
+
+    if options.register or not email:
+        email = f'storm-{secrets.token_hex(6)}@example.com'
+        status = post_json(f'{base}/api/register', {
+            'email': email,
+            'password': options.password,
+            'name': 'Login Storm',
+            'is_traveler': True
+        }, options.timeout)
+        if status != 201:
+            raise SystemExit(f"Registration failed with HTTP {status}")
+
+    # Baseline: probe latency with no logins in flight
+    baseline = []
+    stop = threading.Event()
+    prober = threading.Thread(target=probe, args=(probe_url, options.probe_interval_ms / 1000, stop, baseline, options.timeout))
+    prober.start()
+    time.sleep(options.baseline_seconds)
+    stop.set()
+    prober.join()
+
+    # Storm: the same probe while logins hammer the server
+    during = []
+    stop = threading.Event()
+    prober = threading.Thread(target=probe, args=(probe_url, options.probe_interval_ms / 1000, stop, during, options.timeout))
+    prober.start()
+
+    login_times = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def login(_):
+        started = time.perf_counter()
+        status = post_json(f'{base}/api/login', {'email': email, 'password': options.password}, options.timeout)
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            login_times.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+        list(executor.map(login, range(options.logins)))
+    storm_seconds = time.perf_counter() - started
+
+    stop.set()
+    prober.join()
+
+    print(f"{options.logins} logins in {storm_seconds:.1f}s ({options.logins / storm_seconds:.1f}/s), "
+          f"statuses: {dict(sorted(statuses.items()))}")
+    if statuses.get(429, 0) > options.logins // 2:
+        raise SystemExit(f"{statuses[429]} of {options.logins} logins were rate limited (429); "
+                         f"restart the server with RATELIMIT_ENABLED=false")
+    describe('login latency', login_times)
+    describe('socket probe baseline', baseline)
+    describe('socket probe in storm', during)
+    if baseline and during:
+        print(f"probe p95 slowdown: {percentile(during, 0.95) / max(statistics.median(baseline), 0.001):.1f}x baseline median")
+
+if __name__ == '__main__':
+    main()
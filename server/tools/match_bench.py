@@ -0,0 +1,85 @@
+"""Matching benchmark: how long does top-k take over a large snapshot?
+
+Builds a TranslatorSnapshot of synthetic translators in memory (no
+database) and times TranslatorSnapshot.top_k for random traveler
+requests:
+
+    python tools/match_bench.py --translators 100000 --requests 500 --k 10
+
+Also reports the time to build the snapshot and to apply one profile
+change, which is what a refresh costs per changed translator.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matching import TranslatorSnapshot, MatchRequest
+
+LANGUAGES = ['en', 'es', 'fr', 'de', 'it', 'pt', 'ja', 'zh', 'ko', 'ar', 'hi', 'ru', 'tr', 'nl', 'sv', 'pl',
+             'el', 'he', 'th', 'vi', 'id', 'ms', 'uk', 'cs', 'hu', 'ro', 'da', 'fi', 'no', 'bn']
+SPECIALIZATIONS = ['medical', 'legal', 'business', 'tourism', 'food', 'history', 'art', 'nightlife', 'hiking',
+                   'shopping', 'architecture', 'music', 'sports', 'religion', 'education', 'technology']
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def random_translator(rng, cities):
+    return dict(
+        languages=[{'language_code': code} for code in rng.sample(LANGUAGES, rng.randint(1, 4))],
+        hourly_rate=round(rng.uniform(10, 120), 2),
+        rating=round(rng.uniform(0, 5), 2),
+        completion=rng.randint(20, 100),
+        location=f'{rng.choice(cities)}, Country',
+        specializations=rng.sample(SPECIALIZATIONS, rng.randint(0, 4)),
+        is_available=rng.random() < 0.8
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--translators', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--cities', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cities = [f'City {i}' for i in range(args.cities)]
+
+    snapshot = TranslatorSnapshot(capacity=args.translators)
+    started = time.perf_counter()
+    for user_id in range(1, args.translators + 1):
+        snapshot.upsert(user_id, **random_translator(rng, cities))
+    snapshot.finish()
+    print(f"built snapshot of {snapshot.size} translators in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        snapshot.upsert(rng.randint(1, args.translators), **random_translator(rng, cities))
+    print(f"profile update         {(time.perf_counter() - started) * 1000 / 1000:.3f}ms each")
+
+    timings = []
+    for _ in range(args.requests):
+        request = MatchRequest(
+            languages=rng.sample(LANGUAGES, rng.randint(1, 2)),
+            location=rng.choice(cities),
+            interests=rng.sample(SPECIALIZATIONS, rng.randint(0, 3)),
+            max_rate=rng.choice([None, 50, 80]),
+            include_unavailable=False
+        )
+        started = time.perf_counter()
+        snapshot.top_k(request, args.k)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    print(f"top-{args.k:<19} n={len(timings):<6} p50={statistics.median(timings):7.2f}ms "
+          f"p95={percentile(timings, 0.95):7.2f}ms p99={percentile(timings, 0.99):7.2f}ms "
+          f"max={max(timings):7.2f}ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+from flask import g, request, jsonify, current_app, abort
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from collections import OrderedDict, namedtuple
+from extensions import db, jwt
+from models import User, TranslatorProfile, TravelerProfile
+import hmac
+import os
+import threading
+import time
+
+# How long a user record may be served from the shared cache (seconds)
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL_SECONDS', 30))
+
+# Upper bound on cached records per worker; least recently used are dropped first
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000))
+
+# Bearer token required by GET /metrics/user-cache; the route is off (404) when unset
+USER_CACHE_METRICS_TOKEN = os.environ.get('USER_CACHE_METRICS_TOKEN')
+
+# Compact, read-only view of a user - enough for auth checks and display names
+UserRecord = namedtuple('UserRecord', ['id', 'name', 'is_traveler', 'preferred_language'])
+
+class UserCache:
+    """Short-lived, per-worker cache of UserRecords keyed by user id.
+
+    Entries are dropped when the user or their profile is committed in
+    this worker (see _invalidate_on_commit) and expire after USER_CACHE_TTL
+    everywhere else, which bounds how stale another worker can be.
+    Hits and misses are counted per endpoint.
+    """
+
+    def __init__(self, ttl=USER_CACHE_TTL, max_entries=USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {}
+
+    def get(self, user_id):
+        """Return the UserRecord for an id, or None if the user does not exist"""
+        # Request-scoped memo: repeated lookups in one request never leave the process
+        memo = g.setdefault('_user_records', {})
+        if user_id in memo:
+            return memo[user_id]
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                record = entry[1]
+            else:
+                record = None
+
+        self._count('hits' if record is not None else 'misses')
+        if record is None:
+            row = db.session.query(
+                User.id, User.name, User.is_traveler, User.preferred_language
+            ).filter(User.id == user_id).first()
+            if row is not None:
+                record = UserRecord(*row)
+                self.put(record)
+
+        memo[user_id] = record
+        return record
+
+    def put(self, record):
+        with self._lock:
+            self._entries[record.id] = (time.monotonic() + self.ttl, record)
+            self._entries.move_to_end(record.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def _count(self, outcome):
+        endpoint = request.endpoint or 'unknown'
+        with self._lock:
+            counters = self._stats.setdefault(endpoint, {'hits': 0, 'misses': 0})
+            counters[outcome] += 1
+
+    def stats(self):
+        """Hit/miss counters per endpoint since the worker started"""
+        with self._lock:
+            return {
+                endpoint: dict(counters, hit_rate=round(counters['hits'] / (counters['hits'] + counters['misses']), 3))
+                for endpoint, counters in self._stats.items()
+            }
+
+user_cache = UserCache()
+
+def get_user_record(user_id):
+    """Look up any user's compact record through the cache"""
+    return user_cache.get(int(user_id))
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    # Profiles count too: anything keyed on the user should see the new state
+    changed = session.info.setdefault('changed_user_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+        elif isinstance(obj, (TranslatorProfile, TravelerProfile)):
+            changed.add(obj.user_id)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    changed = session.info.pop('changed_user_ids', None)
+    if changed:
+        user_cache.invalidate(*changed)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('changed_user_ids', None)
+
+def init_app(app):
+    @jwt.user_lookup_loader
+    def load_current_user(jwt_header, jwt_data):
+        return get_user_record(jwt_data[current_app.config['JWT_IDENTITY_CLAIM']])
+
+    @jwt.user_lookup_error_loader
+    def current_user_not_found(jwt_header, jwt_data):
+        return jsonify({'error': 'User not found'}), 404
+
+    @app.route('/metrics/user-cache')
+    def user_cache_metrics():
+        # Operators only: the counters are per worker, so no CLI command can read them
+        if not USER_CACHE_METRICS_TOKEN:
+            abort(404)
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {USER_CACHE_METRICS_TOKEN}'.encode()):
+            return jsonify({'error': 'Invalid metrics token'}), 401
+        return jsonify(user_cache.stats())
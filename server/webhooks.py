@@ -0,0 +1,103 @@
+from extensions import db
+from models import WebhookEvent, Payment, Booking
+from datetime import datetime, timedelta
+import logging
+
+# Events claimed by one worker pass
+WEBHOOK_BATCH_SIZE = 50
+
+# Give up on an event after this many failed attempts
+WEBHOOK_MAX_ATTEMPTS = 8
+
+# Retry delay doubles per attempt from the base, up to the cap (seconds)
+WEBHOOK_RETRY_BASE_SECONDS = 30
+WEBHOOK_RETRY_MAX_SECONDS = 3600
+
+# Event type -> handler taking the event payload
+handlers = {}
+
+def handles(event_type):
+    """Register the handler for a webhook event type"""
+    def register(fn):
+        handlers[event_type] = fn
+        return fn
+    return register
+
+def complete_payment(payment, payment_intent_id):
+    """Mark a payment as completed and confirm its booking (does not commit)"""
+    payment.status = 'completed'
+    payment.transaction_id = payment_intent_id
+    
+    # Update booking status
+    booking = Booking.query.get(payment.booking_id)
+    if booking and booking.status == 'pending':
+        booking.status = 'confirmed'
+
+def fail_payment(payment):
+    """Mark a pending payment as failed (does not commit)"""
+    payment.status = 'failed'
+
+@handles('payment_intent.succeeded')
+def handle_payment_intent_succeeded(event):
+    payment_intent = event['data']['object']
+    
+    # Update payment status in the database
+    payment = Payment.query.filter_by(payment_intent_id=payment_intent['id']).first()
+    if not payment or payment.status == 'completed':
+        return
+    
+    complete_payment(payment, payment_intent['id'])
+    logging.info(f"Payment {payment.payment_id} completed via webhook")
+
+@handles('payment_intent.payment_failed')
+def handle_payment_intent_failed(event):
+    payment_intent = event['data']['object']
+    
+    payment = Payment.query.filter_by(payment_intent_id=payment_intent['id']).first()
+    if not payment or payment.status != 'pending':
+        return
+    
+    fail_payment(payment)
+    logging.info(f"Payment {payment.payment_id} failed via webhook")
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(WEBHOOK_RETRY_MAX_SECONDS, WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1)))
+
+def process_webhook_batch(batch_size=WEBHOOK_BATCH_SIZE):
+    """Process one batch of due inbox events and commit the outcome.
+    
+    Rows are claimed with FOR UPDATE SKIP LOCKED, so several workers can
+    drain the inbox concurrently without handling the same event twice.
+    Each event runs in its own savepoint: a failing event is rescheduled
+    with exponential backoff without undoing the rest of the batch.
+    Returns the number of events claimed.
+    """
+    now = datetime.utcnow()
+    events = WebhookEvent.query.filter(
+        WebhookEvent.status == 'pending',
+        WebhookEvent.next_attempt_at <= now
+    ).order_by(
+        WebhookEvent.next_attempt_at, WebhookEvent.id
+    ).limit(batch_size).with_for_update(skip_locked=True).all()
+    
+    for event in events:
+        handler = handlers.get(event.event_type)
+        try:
+            with db.session.begin_nested():
+                if handler:
+                    handler(event.payload)
+            event.status = 'processed'
+            event.processed_at = datetime.utcnow()
+            event.last_error = None
+        except Exception as e:
+            event.attempts += 1
+            event.last_error = str(e)
+            if event.attempts >= WEBHOOK_MAX_ATTEMPTS:
+                event.status = 'failed'
+                logging.error(f"Webhook event {event.event_id} failed permanently: {str(e)}")
+            else:
+                event.next_attempt_at = datetime.utcnow() + retry_delay(event.attempts)
+                logging.warning(f"Webhook event {event.event_id} failed, attempt {event.attempts}: {str(e)}")
+    
+    db.session.commit()
+    return len(events)